@@ -137,3 +137,69 @@ class BytePSBasics(object):
         pushpull_speed.restype = ctypes.py_object
         entry = pushpull_speed()
         return entry
+
+    def get_scheduling_credit(self):
+        """A function that returns the current credit window of the queues
+        that use credit-based scheduling (see BYTEPS_SCHEDULING_CREDIT). With
+        BYTEPS_SCHEDULING_CREDIT=auto the window is tuned at runtime.
+          Returns:
+            A dict: {queue name: window in bytes}, empty if scheduling is
+            disabled on this process
+        """
+        scheduling_credit = self.C_LIB_CTYPES.byteps_get_scheduling_credit
+        scheduling_credit.restype = ctypes.py_object
+        return scheduling_credit()
+
+    def get_threadpool_busy_time(self):
+        """A function that returns how long each thread of the compression
+        thread pool (see BYTEPS_THREADPOOL_SIZE) has been running tasks.
+          Returns:
+            A list of busy time in seconds, one per thread, empty if there is
+            no thread pool on this process
+        """
+        busy_time = self.C_LIB_CTYPES.byteps_get_threadpool_busy_time
+        busy_time.restype = ctypes.py_object
+        return busy_time()
+
+    def get_queue_stats(self, reset=False):
+        """A function that returns the counters of the scheduled queues of
+        this process, one entry per queue in every array. Wait time is from
+        entering a queue to being taken out by its loop, service time is from
+        then until the stage finishes. Times are counted in log2 histograms:
+        bucket i counts times below hist_bounds_us[i] microseconds and not
+        below hist_bounds_us[i-1], the last bucket also counts longer times.
+          Arguments:
+            reset: whether to restart the counters after reading them, e.g.,
+                   to get the counters of the last N steps
+          Returns:
+            A dict of arrays:
+              queue: queue names
+              tasks: number of finished tasks
+              depth, max_depth: current and maximum number of pending tasks
+              wait_us_total, service_us_total: sum of the times
+              wait_hist, service_hist: one histogram per queue
+              blocked_by_credit, blocked_by_ready_table: number of polls that
+                found no runnable task because of the credits or because the
+                other local ranks were not ready
+              hist_bounds_us: upper bounds of the histogram buckets
+        """
+        queue_stats = self.C_LIB_CTYPES.byteps_get_queue_stats
+        queue_stats.restype = ctypes.py_object
+        return queue_stats(ctypes.c_int(1 if reset else 0))
+
+    def get_reducer_calibration(self):
+        """A function that returns the team sizes the CPU reduction of this
+        process measured at startup with BYTEPS_REDUCER_CALIBRATE=1. A sum
+        over a buffer uses the team size of the longest measured length that
+        is not longer than the buffer; integer types and copies use float32.
+          Returns:
+            A dict, empty if the calibration is disabled or has not run:
+              threads: the team sizes tried
+              bytes: the buffer lengths measured
+              float32, float64, float16, bfloat16: a dict of
+                us: microseconds of one sum, per length and team size
+                best: the team size used, per length
+        """
+        calibration = self.C_LIB_CTYPES.byteps_get_reducer_calibration
+        calibration.restype = ctypes.py_object
+        return calibration()
@@ -0,0 +1,118 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#include "affinity.h"
+
+#include <pthread.h>
+#include <sched.h>
+
+#include <cstdlib>
+#include <sstream>
+#include <unordered_map>
+
+#include "logging.h"
+
+namespace byteps {
+namespace common {
+
+namespace {
+
+std::unordered_map<std::string, std::vector<int>> ParseSpec(
+    const std::string& spec) {
+  std::unordered_map<std::string, std::vector<int>> ret;
+  std::stringstream ss(spec);
+  std::string item;
+  while (std::getline(ss, item, ';')) {
+    if (item.empty()) continue;
+    auto eq = item.find('=');
+    auto cpus = (eq == std::string::npos)
+                    ? std::vector<int>()
+                    : ParseCpuList(item.substr(eq + 1));
+    BPS_CHECK(!cpus.empty())
+        << "BYTEPS_THREAD_AFFINITY: cannot parse \"" << item
+        << "\", expect role=cpus, e.g., reducer=0-3,8";
+    ret[item.substr(0, eq)] = cpus;
+  }
+  return ret;
+}
+
+const std::unordered_map<std::string, std::vector<int>>& GetSpec() {
+  // parsed once, the environment does not change at runtime
+  static const std::unordered_map<std::string, std::vector<int>> spec =
+      ParseSpec(getenv("BYTEPS_THREAD_AFFINITY")
+                    ? getenv("BYTEPS_THREAD_AFFINITY")
+                    : "");
+  return spec;
+}
+
+}  // namespace
+
+std::vector<int> ParseCpuList(const std::string& list) {
+  std::vector<int> cpus;
+  std::stringstream ss(list);
+  std::string range;
+  while (std::getline(ss, range, ',')) {
+    char* end;
+    long first = strtol(range.c_str(), &end, 10);
+    long last = first;
+    if (end == range.c_str()) return {};
+    if (*end == '-') {
+      char* last_begin = end + 1;
+      last = strtol(last_begin, &end, 10);
+      if (end == last_begin) return {};
+    }
+    if (*end || first < 0 || last < first || last >= CPU_SETSIZE) return {};
+    for (long cpu = first; cpu <= last; ++cpu) {
+      cpus.push_back(cpu);
+    }
+  }
+  return cpus;
+}
+
+const std::vector<int>& GetAffinityCpus(const std::string& role) {
+  static const std::vector<int> empty;
+  auto& spec = GetSpec();
+  auto it = spec.find(role);
+  return it == spec.end() ? empty : it->second;
+}
+
+bool PinThread(const std::string& role, int index) {
+  auto& cpus = GetAffinityCpus(role);
+  if (cpus.empty()) return false;
+  cpu_set_t set;
+  CPU_ZERO(&set);
+  if (index < 0) {
+    for (auto cpu : cpus) CPU_SET(cpu, &set);
+  } else {
+    CPU_SET(cpus[index % cpus.size()], &set);
+  }
+  int ret = pthread_setaffinity_np(pthread_self(), sizeof(set), &set);
+  if (ret) {
+    BPS_LOG(WARNING) << "Failed to pin " << role << " thread " << index
+                     << ", error " << ret;
+    return false;
+  }
+  if (index < 0) {
+    BPS_LOG(DEBUG) << "Pinned " << role << " thread to " << cpus.size()
+                   << " cpu(s) from " << cpus.front();
+  } else {
+    BPS_LOG(DEBUG) << "Pinned " << role << " thread " << index << " to cpu "
+                   << cpus[index % cpus.size()];
+  }
+  return true;
+}
+
+}  // namespace common
+}  // namespace byteps
@@ -0,0 +1,45 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_AFFINITY_H
+#define BYTEPS_AFFINITY_H
+
+#include <string>
+#include <vector>
+
+namespace byteps {
+namespace common {
+
+// CPU affinity of the BytePS threads, configured with
+// BYTEPS_THREAD_AFFINITY="role=cpus;role=cpus;...", where cpus is a list in
+// the format of numactl, e.g., "push=0;pull=1;compress=2-5;reducer=6-11,24".
+// Roles: push, pull, compress (thread pool), reducer (OpenMP team of the
+// CpuReducer) and engine (server engine threads).
+
+// Parses a list like "0-3,8". Returns an empty list on a malformed one.
+std::vector<int> ParseCpuList(const std::string& list);
+
+// The CPUs of a role, empty if the role is not configured.
+const std::vector<int>& GetAffinityCpus(const std::string& role);
+
+// Pins the calling thread to all CPUs of the role, or with index >= 0 to the
+// index-th of them (wrapping around). Returns false if the role is not
+// configured or pinning failed.
+bool PinThread(const std::string& role, int index = -1);
+
+}  // namespace common
+}  // namespace byteps
+
+#endif  // BYTEPS_AFFINITY_H
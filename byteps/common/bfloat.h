@@ -0,0 +1,132 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// bfloat16, the upper half of a float32, with the arithmetic done in float
+// as for half_t in half.h. It takes the include guard of mshadow/bfloat.h,
+// like half.h does, so that the two can meet in the MXNet plugin.
+
+#ifndef MSHADOW_BFLOAT_H_
+#define MSHADOW_BFLOAT_H_
+
+#include <stdint.h>
+
+#include <cstring>
+
+#include "half.h"
+
+namespace mshadow {
+namespace bfloat {
+
+#define MSHADOW_BF16_OPERATOR(RTYPE, OP)                               \
+  MSHADOW_XINLINE RTYPE operator OP(bf16_t a, bf16_t b) {              \
+    return RTYPE(float(a) OP float(b)); /* NOLINT(*) */                \
+  }                                                                    \
+  template <typename T>                                                \
+  MSHADOW_XINLINE RTYPE operator OP(bf16_t a, T b) {                   \
+    return RTYPE(float(a) OP float(b)); /* NOLINT(*) */                \
+  }                                                                    \
+  template <typename T>                                                \
+  MSHADOW_XINLINE RTYPE operator OP(T a, bf16_t b) {                   \
+    return RTYPE(float(a) OP float(b)); /* NOLINT(*) */                \
+  }
+
+#define MSHADOW_BF16_ASSIGNOP(AOP, OP)                                 \
+  template <typename T>                                                \
+  MSHADOW_XINLINE bf16_t operator AOP(const T& a) {                    \
+    return *this = bf16_t(float(*this) OP float(a)); /* NOLINT(*)*/    \
+  }
+
+// float32 bits to bfloat16 bits, rounding to nearest even
+MSHADOW_XINLINE uint16_t Float2BF16Bits(float value) {
+  uint32_t bits;
+  std::memcpy(&bits, &value, sizeof(bits));
+  if ((bits & 0x7fffffff) > 0x7f800000) {
+    // keep a NaN a (quiet) NaN
+    return static_cast<uint16_t>((bits >> 16) | 0x40);
+  }
+  bits += 0x7fff + ((bits >> 16) & 1);
+  return static_cast<uint16_t>(bits >> 16);
+}
+
+MSHADOW_XINLINE float BF16Bits2Float(uint16_t value) {
+  uint32_t bits = static_cast<uint32_t>(value) << 16;
+  float f;
+  std::memcpy(&f, &bits, sizeof(f));
+  return f;
+}
+
+class MSHADOW_ALIGNED(2) bf16_t {
+ public:
+  uint16_t bf16_;
+
+  static MSHADOW_XINLINE bf16_t Binary(uint16_t value) {
+    bf16_t res;
+    res.bf16_ = value;
+    return res;
+  }
+
+  bf16_t() = default;
+
+  MSHADOW_XINLINE bf16_t(const float& value) { bf16_ = Float2BF16Bits(value); }
+  MSHADOW_XINLINE explicit bf16_t(const double& value) {
+    bf16_ = Float2BF16Bits(static_cast<float>(value));
+  }
+  MSHADOW_XINLINE explicit bf16_t(const int32_t& value) {
+    bf16_ = Float2BF16Bits(static_cast<float>(value));
+  }
+  MSHADOW_XINLINE explicit bf16_t(const int64_t& value) {
+    bf16_ = Float2BF16Bits(static_cast<float>(value));
+  }
+
+  MSHADOW_XINLINE operator float() const { return BF16Bits2Float(bf16_); }
+
+  MSHADOW_BF16_ASSIGNOP(+=, +)
+  MSHADOW_BF16_ASSIGNOP(-=, -)
+  MSHADOW_BF16_ASSIGNOP(*=, *)
+  MSHADOW_BF16_ASSIGNOP(/=, /)
+
+  MSHADOW_XINLINE bf16_t operator+() { return *this; }
+
+  MSHADOW_XINLINE bf16_t operator-() {
+    return Binary(bf16_ ^ 0x8000);
+  }
+
+  template <typename T>
+  MSHADOW_XINLINE bf16_t operator=(const T& a) {
+    return *this = bf16_t(a); /* NOLINT(*)*/
+  }
+};
+
+/*! \brief overloaded + operator for bf16_t */
+MSHADOW_BF16_OPERATOR(bf16_t, +)
+/*! \brief overloaded - operator for bf16_t */
+MSHADOW_BF16_OPERATOR(bf16_t, -)
+/*! \brief overloaded * operator for bf16_t */
+MSHADOW_BF16_OPERATOR(bf16_t, *)
+/*! \brief overloaded / operator for bf16_t */
+MSHADOW_BF16_OPERATOR(bf16_t, /)
+/*! \brief overloaded > operator for bf16_t */
+MSHADOW_BF16_OPERATOR(bool, >)
+/*! \brief overloaded < operator for bf16_t */
+MSHADOW_BF16_OPERATOR(bool, <)
+/*! \brief overloaded >= operator for bf16_t */
+MSHADOW_BF16_OPERATOR(bool, >=)
+/*! \brief overloaded <= operator for bf16_t */
+MSHADOW_BF16_OPERATOR(bool, <=)
+
+}  // namespace bfloat
+}  // namespace mshadow
+
+#endif  // MSHADOW_BFLOAT_H_
@@ -64,6 +64,8 @@ enum DataType {
   BYTEPS_INT32 = 4,
   BYTEPS_INT8 = 5,
   BYTEPS_INT64 = 6,
+  // same as mshadow::kBfloat16
+  BYTEPS_BFLOAT16 = 12,
   // below are not in mshadow, should avoid using these
   // BYTEPS_UINT16 = 7,
   // BYTEPS_INT16 = 8,
@@ -174,6 +176,8 @@ typedef struct CommTime {
   int type = -1;
 } BPSCommTime;
 
+struct FusionGroup;
+
 typedef struct BytePSContext {
   bool initialized;
   std::mutex init_mutex;
@@ -183,6 +187,13 @@ typedef struct BytePSContext {
   uint64_t declared_key;
   // the actual keys being used
   std::vector<uint64_t> key_list;
+  // partition size requested at declaration, 0 means the default policy
+  uint32_t partition_bytes = 0;
+  // partition size actually used, decided in InitTensor
+  uint32_t partition_bound = 0;
+  // set if the tensor is packed with other small tensors, see fusion.h
+  FusionGroup* fusion_group = nullptr;
+  int fusion_index = -1;
   // a copy on CPU
   void* cpubuff;
   // GPU ptr if the tensor is on CPU
@@ -202,6 +213,8 @@ typedef struct BytePSContext {
   std::vector<std::shared_ptr<compressor::Compressor>> compressor_list;
   // kwargs
   std::unordered_map<std::string, std::string> kwargs;
+  // kwargs of the server-side optimizer
+  std::unordered_map<std::string, std::string> optimizer_kwargs;
 } BPSContext;
 
 class Tensor {
@@ -261,13 +274,20 @@ struct TensorTableEntry {
   std::shared_ptr<compressor::Compressor> compressor;
   // Compressed
   std::shared_ptr<compressor::tensor_t> compressed;
+  // When the task was added to / taken out of its current queue (steady
+  // clock, ns)
+  uint64_t enqueue_ns = 0;
+  uint64_t dequeue_ns = 0;
+  // pushed and pulled through the fused key of its FusionGroup
+  bool fused = false;
 };
 using TensorTable = std::unordered_map<std::string, TensorTableEntry>;
 
 enum class RequestType {
   kDefaultPushPull,
   kRowSparsePushPull,
-  kCompressedPushPull
+  kCompressedPushPull,
+  kServerOptimizer
 };
 
 int GetCommandType(RequestType requestType, int d);
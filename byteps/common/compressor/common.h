@@ -16,11 +16,14 @@
 #ifndef BYTEPS_COMPRESSOR_COMMON_H
 #define BYTEPS_COMPRESSOR_COMMON_H
 
+#include <cstring>
+#include <functional>
+#include <memory>
 #include <unordered_map>
-#if __F16C__
+#include "../bfloat.h"
 #include "../half.h"
 using half_t = mshadow::half::half_t;
-#endif
+using bf16_t = mshadow::bfloat::bf16_t;
 
 namespace byteps {
 namespace common {
@@ -41,12 +44,53 @@ typedef struct BPSTensor {
 
 using kwargs_t = std::unordered_map<std::string, std::string>;
 
+/*!
+ * \brief Buffer of a compressor
+ *
+ * Allocated with new[], unless the process has set an allocator with
+ * SetBufferAllocator(), e.g., the server hands out slices of its memory
+ * arena. Buffers of an allocator are owned by the allocator.
+ */
+struct BufferDeleter {
+  bool owned;
+  void operator()(byte_t* p) const {
+    if (owned) delete[] p;
+  }
+};
+using buffer_t = std::unique_ptr<byte_t[], BufferDeleter>;
+using buffer_allocator_t = std::function<byte_t*(size_t)>;
+
+inline buffer_allocator_t& GetBufferAllocator() {
+  static buffer_allocator_t allocator;
+  return allocator;
+}
+
+// must be set before any compressor is created
+inline void SetBufferAllocator(buffer_allocator_t allocator) {
+  GetBufferAllocator() = allocator;
+}
+
+inline buffer_t AllocateBuffer(size_t size, bool zero = false) {
+  auto& allocator = GetBufferAllocator();
+  if (allocator) {
+    auto p = allocator(size);
+    if (zero) memset(p, 0, size);
+    return buffer_t(p, BufferDeleter{false});
+  }
+  return buffer_t(zero ? new byte_t[size]() : new byte_t[size],
+                  BufferDeleter{true});
+}
+
 #define COMPRESS_IMPL_SWITCH(dtype, func, dst, src, size)                     \
   switch (dtype) {                                                            \
     case BYTEPS_FLOAT16:                                                      \
       return func(reinterpret_cast<uint16_t*>(dst),                           \
                   reinterpret_cast<const half_t*>(src),                       \
                   size / sizeof(half_t));                                     \
+    case BYTEPS_BFLOAT16:                                                     \
+      return func(reinterpret_cast<uint16_t*>(dst),                           \
+                  reinterpret_cast<const bf16_t*>(src),                       \
+                  size / sizeof(bf16_t));                                     \
     case BYTEPS_FLOAT32:                                                      \
       return func(reinterpret_cast<uint32_t*>(dst),                           \
                   reinterpret_cast<const float*>(src), size / sizeof(float)); \
@@ -63,6 +107,9 @@ using kwargs_t = std::unordered_map<std::string, std::string>;
     case BYTEPS_FLOAT16:                                                    \
       return func(reinterpret_cast<half_t*>(dst),                           \
                   reinterpret_cast<const uint16_t*>(src), compressed_size); \
+    case BYTEPS_BFLOAT16:                                                   \
+      return func(reinterpret_cast<bf16_t*>(dst),                           \
+                  reinterpret_cast<const uint16_t*>(src), compressed_size); \
     case BYTEPS_FLOAT32:                                                    \
       return func(reinterpret_cast<float*>(dst),                            \
                   reinterpret_cast<const uint32_t*>(src), compressed_size); \
@@ -80,6 +127,10 @@ using kwargs_t = std::unordered_map<std::string, std::string>;
       return func(reinterpret_cast<half_t*>(dst),                            \
                   reinterpret_cast<half_t*>(src1),                           \
                   reinterpret_cast<const uint16_t*>(src2), compressed_size); \
+    case BYTEPS_BFLOAT16:                                                    \
+      return func(reinterpret_cast<bf16_t*>(dst),                            \
+                  reinterpret_cast<bf16_t*>(src1),                           \
+                  reinterpret_cast<const uint16_t*>(src2), compressed_size); \
     case BYTEPS_FLOAT32:                                                     \
       return func(reinterpret_cast<float*>(dst),                             \
                   reinterpret_cast<float*>(src1),                            \
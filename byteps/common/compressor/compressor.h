@@ -53,7 +53,7 @@ namespace compressor {
 class Compressor {
  public:
   Compressor(size_t size, DataType dtype)
-      : _size(size), _dtype(dtype), _buf(new byte_t[size]){};
+      : _size(size), _dtype(dtype), _buf(AllocateBuffer(size)){};
   virtual ~Compressor() = default;
 
   /*!
@@ -123,7 +123,7 @@ class Compressor {
   DataType _dtype;
 
   /*! \brief buffer to store compressed grad */
-  std::unique_ptr<byte_t[]> _buf;
+  buffer_t _buf;
 };
 
 }  // namespace compressor
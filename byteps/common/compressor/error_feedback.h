@@ -51,7 +51,7 @@ class ErrorFeedback : public Compressor {
   // error buffer should be cleared to zeros at the beginning.
   ErrorFeedback(size_t size, DataType dtype, std::unique_ptr<Compressor> cptr)
       : Compressor(size, dtype),
-        _error(new byte_t[size]()),
+        _error(AllocateBuffer(size, true)),
         _cpu_reducer(new CpuReducer(nullptr)),
         _cptr(std::move(cptr)) {}
   virtual ~ErrorFeedback() = default;
@@ -85,7 +85,7 @@ class ErrorFeedback : public Compressor {
 
  protected:
   /*! \brief buffer of error */
-  std::unique_ptr<byte_t[]> _error;
+  buffer_t _error;
 
   std::unique_ptr<CpuReducer> _cpu_reducer;
 
@@ -13,8 +13,13 @@
 // limitations under the License.
 // =============================================================================
 
+#include <algorithm>
+#include <cmath>
+#include <cstdlib>
 #include <cstring>
-#include <queue>
+#include <functional>
+#include <limits>
+#include <vector>
 
 #include "../compressor_registry.h"
 #include "topk.h"
@@ -36,8 +41,144 @@ CompressorRegistry::Register reg(
       } else {
         k = static_cast<unsigned>(factor);
       }
-      return std::unique_ptr<Compressor>(new TopkCompressor(size, dtype, k));
+      int threads = getenv("BYTEPS_TOPK_THREADS")
+                        ? atoi(getenv("BYTEPS_TOPK_THREADS"))
+                        : 1;
+      return std::unique_ptr<Compressor>(
+          new TopkCompressor(size, dtype, k, std::max(threads, 1)));
     });
+
+// number of magnitudes sampled to estimate the threshold
+constexpr size_t kSampleSize = 4096;
+// shorter gradients are selected with radix select only
+constexpr size_t kMinSampledLen = 8 * kSampleSize;
+// elements per chunk of the parallel filter, at least
+constexpr size_t kMinChunkLen = 1 << 16;
+// elements counted at once by the filter before writing any
+constexpr size_t kFilterBlock = 256;
+
+// The bits of x without the sign bit. They order like |x| for IEEE floats
+// of any width, NaNs above infinities.
+template <typename index_t, typename scalar_t>
+inline index_t Magnitude(const scalar_t& x) {
+  index_t bits;
+  std::memcpy(&bits, &x, sizeof(bits));
+  return bits & (std::numeric_limits<index_t>::max() >> 1);
+}
+
+// Writes (i, src[i]) for every i in [begin, end) with a magnitude of at least
+// t to out, in index order. Returns the number written, or capacity if they
+// do not fit in capacity pairs. Each block is counted first, so that blocks
+// without candidates are skipped, blocks with a few are searched up to the
+// last one and the others are written without branches.
+template <typename index_t, typename scalar_t>
+size_t Filter(std::pair<index_t, scalar_t>* out, size_t capacity,
+              const scalar_t* src, size_t begin, size_t end, index_t t) {
+  auto bits = reinterpret_cast<const index_t*>(src);
+  const index_t abs_mask = std::numeric_limits<index_t>::max() >> 1;
+  size_t count = 0;
+  for (size_t b = begin; b < end; b += kFilterBlock) {
+    size_t e = std::min(b + kFilterBlock, end);
+    index_t hits = 0;
+    for (size_t i = b; i < e; ++i) hits += (bits[i] & abs_mask) >= t;
+    if (!hits) continue;
+    // the last write may land one past the last candidate
+    if (count + hits >= capacity) return capacity;
+    if (hits <= kFilterBlock / 16) {
+      for (size_t i = b; hits; ++i) {
+        if ((bits[i] & abs_mask) >= t) {
+          out[count].first = i;
+          out[count].second = src[i];
+          ++count;
+          --hits;
+        }
+      }
+      continue;
+    }
+    for (size_t i = b; i < e; ++i) {
+      out[count].first = i;
+      out[count].second = src[i];
+      count += (bits[i] & abs_mask) >= t;
+    }
+  }
+  return count;
+}
+
+// The k-th largest magnitude of src by radix select, one byte per pass from
+// the top. *rank is set to how many of the k largest have exactly that
+// magnitude.
+template <typename index_t, typename scalar_t>
+index_t KthLargestMagnitude(const scalar_t* src, size_t len, size_t k,
+                            size_t* rank) {
+  auto bits = reinterpret_cast<const index_t*>(src);
+  const index_t abs_mask = std::numeric_limits<index_t>::max() >> 1;
+  index_t prefix = 0, mask = 0;
+  for (int shift = 8 * sizeof(index_t) - 8; shift >= 0; shift -= 8) {
+    // the last bucket counts the elements outside the prefix
+    size_t hist[257] = {0};
+    for (size_t i = 0; i < len; ++i) {
+      index_t key = bits[i] & abs_mask;
+      ++hist[(key & mask) == prefix ? (key >> shift) & 0xff : 256];
+    }
+    int digit = 255;
+    while (hist[digit] < k) k -= hist[digit--];
+    prefix |= static_cast<index_t>(digit) << shift;
+    mask |= static_cast<index_t>(0xff) << shift;
+  }
+  *rank = k;
+  return prefix;
+}
+}  // namespace
+
+// Filters the candidates of the top k into dst with a threshold estimated
+// from a sample of src, and returns their number. Returns 0 if the sample
+// gives no useful threshold or the candidates do not fit.
+template <typename index_t, typename scalar_t>
+size_t TopkCompressor::SampledCandidates(std::pair<index_t, scalar_t>* dst,
+                                         const scalar_t* src, size_t len) {
+  if (len < kMinSampledLen) return 0;
+  // the sample holds e of the top k on average, take the r-th largest
+  // sampled magnitude, three standard deviations lower, as the threshold
+  double e = 1.0 * this->_k * kSampleSize / len;
+  size_t r = static_cast<size_t>(e + 3 * std::sqrt(e)) + 1;
+  if (r >= kSampleSize) return 0;
+  index_t sample[kSampleSize];
+  for (size_t i = 0; i < kSampleSize; ++i) {
+    sample[i] = Magnitude<index_t>(src[_rng.Randint(0, len)]);
+  }
+  std::nth_element(sample, sample + r - 1, sample + kSampleSize,
+                   std::greater<index_t>());
+  index_t t = sample[r - 1];
+  // mostly zeros, nothing to gain over radix select
+  if (t == 0) return 0;
+
+  size_t capacity = _size / sizeof(*dst);
+  size_t chunks = std::min<size_t>(_threads, len / kMinChunkLen);
+  if (chunks <= 1) {
+    size_t count = Filter(dst, capacity, src, 0, len, t);
+    return count < capacity && count >= this->_k ? count : 0;
+  }
+
+  // each chunk filters into its own part of dst, compacted afterwards
+  std::vector<size_t> counts(chunks);
+  size_t chunk_len = (len + chunks - 1) / chunks;
+  size_t chunk_capacity = capacity / chunks;
+#pragma omp parallel for num_threads(chunks) schedule(static, 1)
+  for (size_t j = 0; j < chunks; ++j) {
+    counts[j] = Filter(dst + j * chunk_capacity, chunk_capacity, src,
+                       std::min(j * chunk_len, len),
+                       std::min((j + 1) * chunk_len, len), t);
+  }
+  size_t count = 0;
+  for (size_t j = 0; j < chunks; ++j) {
+    if (counts[j] == chunk_capacity) return 0;
+    if (j) {
+      auto chunk = dst + j * chunk_capacity;
+      std::move(chunk, chunk + counts[j], dst + count);
+    }
+    count += counts[j];
+  }
+  return count >= this->_k ? count : 0;
 }
 
 template <typename index_t, typename scalar_t>
@@ -47,24 +188,31 @@ tensor_t TopkCompressor::CompressImpl(index_t* dst, const scalar_t* src,
                 "index_t should be the same size as scalar_t");
   BPS_CHECK_LE(this->_k, len / 2);
   using pair_t = std::pair<index_t, scalar_t>;
-  auto comp = [](const pair_t& lhs, const pair_t& rhs) {
-    return std::abs(lhs.second) > std::abs(rhs.second);
-  };
-
   auto beg = reinterpret_cast<pair_t*>(dst);
-  size_t size = 0;
-  for (size_t i = 0; i < len; ++i) {
-    if (i < this->_k) {
-      beg[size] = std::make_pair(i, src[i]);
-      size++;
-      std::push_heap(beg, beg + size, comp);
-    } else {
-      auto& top = *beg;
-      // note: compare absolute value
-      if (std::abs(src[i]) > std::abs(top.second)) {
-        std::pop_heap(beg, beg + size, comp);
-        beg[size - 1] = std::make_pair(i, src[i]);
-        std::push_heap(beg, beg + size, comp);
+  if (this->_k == 0) return {dst, 0};
+
+  size_t count = SampledCandidates(beg, src, len);
+  if (count) {
+    // note: compare absolute value
+    std::nth_element(beg, beg + this->_k - 1, beg + count,
+                     [](const pair_t& lhs, const pair_t& rhs) {
+                       return Magnitude<index_t>(lhs.second) >
+                              Magnitude<index_t>(rhs.second);
+                     });
+  } else {
+    size_t rank;
+    index_t t = KthLargestMagnitude<index_t>(src, len, this->_k, &rank);
+    for (size_t i = 0; i < len; ++i) {
+      index_t key = Magnitude<index_t>(src[i]);
+      bool take = key > t;
+      if (key == t && rank) {
+        take = true;
+        --rank;
+      }
+      if (take) {
+        beg[count].first = i;
+        beg[count].second = src[i];
+        ++count;
       }
     }
   }
@@ -72,6 +220,7 @@ tensor_t TopkCompressor::CompressImpl(index_t* dst, const scalar_t* src,
   return {dst, this->_k * sizeof(pair_t)};
 }
 
+
 tensor_t TopkCompressor::Compress(tensor_t grad) {
   COMPRESS_IMPL_SWITCH(grad.dtype, CompressImpl, _buf.get(), grad.data,
                        grad.size);
@@ -17,6 +17,7 @@
 #define BYTEPS_COMPRESSOR_IMPL_TOPK_H
 
 #include "../compressor.h"
+#include "../utils.h"
 
 namespace byteps {
 namespace common {
@@ -30,11 +31,17 @@ namespace compressor {
  *
  * sending the most significant entries of the stochastic gradient
  *
+ * \note the k entries are selected without a heap: a threshold estimated
+ * from a random sample filters the candidates, and nth_element picks the k
+ * largest among them. If the sample is too small to be useful or the
+ * candidates do not fit, an exact radix select is used instead. Large
+ * gradients are filtered in `threads` chunks in parallel.
  */
 class TopkCompressor : public Compressor {
  public:
-  TopkCompressor(size_t size, DataType dtype, unsigned int k)
-      : Compressor(size, dtype), _k(k){};
+  TopkCompressor(size_t size, DataType dtype, unsigned int k,
+                 unsigned int threads = 1)
+      : Compressor(size, dtype), _k(k), _threads(threads){};
   virtual ~TopkCompressor() = default;
 
   /*!
@@ -84,8 +91,14 @@ class TopkCompressor : public Compressor {
   void FastUpdateErrorImpl(scalar_t* error, scalar_t* corrected,
                            const index_t* compressed, size_t compressed_size);
 
+  template <typename index_t, typename scalar_t>
+  size_t SampledCandidates(std::pair<index_t, scalar_t>* dst,
+                           const scalar_t* src, size_t len);
+
  private:
   unsigned int _k;
+  unsigned int _threads;
+  XorShift128PlusBitShifterRNG _rng;
 };
 }  // namespace compressor
 }  // namespace common
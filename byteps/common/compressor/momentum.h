@@ -46,7 +46,7 @@ class Momentum : public Compressor {
   Momentum(size_t size, DataType dtype, std::unique_ptr<Compressor> cptr,
            float mu)
       : Compressor(size, dtype),
-        _mom(new byte_t[size]()),
+        _mom(AllocateBuffer(size, true)),
         _mu(mu),
         _cpu_reducer(new CpuReducer(nullptr)),
         _cptr(std::move(cptr)){};
@@ -77,7 +77,7 @@ class Momentum : public Compressor {
 
  protected:
   /*! \brief buffer of momentum */
-  std::unique_ptr<byte_t[]> _mom;
+  buffer_t _mom;
 
   /*! \brief momentum factor */
   float _mu;
@@ -15,9 +15,14 @@
 
 #include <cuda_runtime.h>
 
+#include <algorithm>
 #include <chrono>
+#include <cstring>
+#include <map>
 #include <memory>
+#include <thread>
 
+#include "affinity.h"
 #include "common.h"
 #include "compressor/compressor.h"
 #include "core_loops.h"
@@ -32,7 +37,7 @@ void FinishOrProceed(std::shared_ptr<TensorTableEntry> task) {
   BPS_CHECK_GE(queue_list.size(), 1);
   auto this_op = queue_list[0];
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
-  q->reportFinish(task->len);
+  q->reportFinish(task);
   if (BytePSGlobal::IsTensorSampled(task->key)) {
     // We only support sampling
     BPS_CHECK(task->tensor->dtype() == common::BYTEPS_FLOAT32);
@@ -136,8 +141,11 @@ void FinishOrProceed(std::shared_ptr<TensorTableEntry> task) {
 
 bool RunCoordinateLoopOnce(QueueType this_op) {
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto notifier = q->getNotifier();
+  auto version = notifier->Version();
   auto task = q->getTask();
   if (task) {
+    notifier->OnPickup();
     int rank = BytePSGlobal::GetLocalRank();
     auto key = task->key;
 
@@ -180,7 +188,7 @@ bool RunCoordinateLoopOnce(QueueType this_op) {
                    << "Signal=" << sig << ", rank=" << rank << ", key=" << key;
 
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
   return true;
 }
@@ -279,6 +287,10 @@ bool RunRootNcclLoopOnce() {
   auto &tasks = nccl_entry->tasks;
   auto &queues = nccl_entry->queues;
 
+  // REDUCE and BROADCAST share one notifier
+  auto notifier = BytePSGlobal::GetScheduledQueue(REDUCE)->getNotifier();
+  auto version = notifier->Version();
+
   NCCLCHECK(ncclGroupStart());
   for (auto this_op : nccl_ops) {
     auto q = BytePSGlobal::GetScheduledQueue(this_op);
@@ -300,6 +312,7 @@ bool RunRootNcclLoopOnce() {
     }
   }
   if (tasks.size()) {
+    notifier->OnPickup();
     struct BytePSCommMsg msg = {rank, DO_GROUP, 0};
     signal_comm->broadcastSignal(&msg, sizeof(BytePSCommMsg));
     NCCLCHECK(ncclGroupEnd());
@@ -308,7 +321,7 @@ bool RunRootNcclLoopOnce() {
     BytePSGlobal::GetNccl()->EnqueueGroup(nccl_entry);
   } else {
     NCCLCHECK(ncclGroupEnd());
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
 
   return true;
@@ -358,8 +371,11 @@ bool RunNonRootNcclLoopOnce() {
 }
 
 bool RunSyncNcclOnce() {
+  auto notifier = BytePSGlobal::GetNccl()->GetNotifier();
+  auto version = notifier->Version();
   auto nccl_entry = BytePSGlobal::GetNccl()->DequeueGroup();
   if (nccl_entry) {
+    notifier->OnPickup();
     nccl_entry->SynchronizeEvents();
     for (size_t i = 0; i < nccl_entry->tasks.size(); i++) {
       FinishOrProceed(nccl_entry->tasks[i]);
@@ -368,7 +384,7 @@ bool RunSyncNcclOnce() {
     BPS_LOG(TRACE) << "Finished NCCL Group size=" << nccl_entry->tasks.size()
                    << " rank=" << BytePSGlobal::GetLocalRank();
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
   return true;
 }
@@ -376,9 +392,12 @@ bool RunSyncNcclOnce() {
 bool RunCopyDevice2HostLoopOnce() {
   QueueType this_op = COPYD2H;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto notifier = q->getNotifier();
+  auto version = notifier->Version();
   auto task = q->getTask();
 
   if (task) {
+    notifier->OnPickup();
     auto copy_d2h_Stream = BytePSGlobal::GetCopyDevice2HostStream();
     // If we ran NCCL reduce, we should copy from task->output
     auto tensor =
@@ -435,7 +454,7 @@ bool RunCopyDevice2HostLoopOnce() {
 
     FinishOrProceed(task);
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
   return true;
 }
@@ -444,8 +463,11 @@ bool RunPcieReduceLoopOnce() {
   BPS_CHECK(BytePSGlobal::IsCrossPcieSwitch());
   QueueType this_op = PCIE_REDUCE;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto notifier = q->getNotifier();
+  auto version = notifier->Version();
   auto task = q->getTask();
   if (task) {
+    notifier->OnPickup();
     auto reducer = BytePSGlobal::GetCpuReducer();
     if (!reducer->isRoot()) {
       // send signal to root
@@ -478,17 +500,21 @@ bool RunPcieReduceLoopOnce() {
       if (copy_len) {
         auto total_offset = offset + nccl_rank * num_elem_per_gpu * unit_len;
 
-        // Below we assume there are only two PCIe switch
-        // and we run reducer in the context of the second switch
-        reducer->sum((void *)((char *)(task->cpubuff) + total_offset),
-                     (void *)((char *)(task->pcie_cpubuff[0]) + total_offset),
-                     copy_len, tensor->dtype());
+        // We run reducer in the context of the last switch, whose buffer is
+        // cpubuff, and add the buffers of all other switches in one pass
+        auto dst = (char *)(task->cpubuff) + total_offset;
+        std::vector<const void *> srcs(1, dst);
+        for (size_t i = 0; i + 1 < task->pcie_cpubuff.size(); ++i) {
+          srcs.push_back((char *)(task->pcie_cpubuff[i]) + total_offset);
+        }
+        reducer->sum(dst, srcs.data(), srcs.size(), copy_len,
+                     tensor->dtype());
       }
     }
 
     FinishOrProceed(task);
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
   return true;
 }
@@ -496,14 +522,17 @@ bool RunPcieReduceLoopOnce() {
 bool RunCompressLoopOnce() {
   QueueType this_op = COMPRESS;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto notifier = q->getNotifier();
+  auto version = notifier->Version();
   auto task = q->getTask();
   if (task) {
+    notifier->OnPickup();
     BPS_CHECK(BytePSGlobal::IsRootDevice())
         << "only root device should enter COMPRESS loop";
     BPS_CHECK(task->compressor != nullptr);
     BPS_CHECK(task->compressed == nullptr);
 
-    // spawn
+    // spawn, the front layers first
     BytePSGlobal::GetThreadPool()->enqueue([task]() {
       char *data = const_cast<char *>(static_cast<const char *>(task->cpubuff) +
                                       task->offset);
@@ -524,93 +553,254 @@ bool RunCompressLoopOnce() {
           ->reset(task->key, BytePSGlobal::GetLocalSize() - 1);
 
       FinishOrProceed(task);
-    });
+    }, task->priority);
 
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
 
   return true;
 }
 
+// Whether the task may share a multi-key request with other tasks
+bool IsBatchable(std::shared_ptr<TensorTableEntry> task) {
+  return !task->fused && !task->compressed &&
+         task->context->compressor_list.empty() &&
+         task->len < BytePSGlobal::GetBatchBytes();
+}
+
+// Takes more ready tasks from the queue, until the batch reaches the byte
+// budget or no task shows up within the latency budget. Returns the tasks
+// grouped by destination server and dtype; groups of one task are sent as
+// before.
+std::vector<std::vector<std::shared_ptr<TensorTableEntry>>> DrainBatches(
+    BytePSScheduledQueue *q, std::shared_ptr<TensorTableEntry> first) {
+  std::vector<std::vector<std::shared_ptr<TensorTableEntry>>> batches;
+  if (!IsBatchable(first)) {
+    batches.push_back({first});
+    return batches;
+  }
+
+  std::vector<std::shared_ptr<TensorTableEntry>> tasks = {first};
+  size_t bytes = first->len;
+  auto deadline = std::chrono::steady_clock::now() +
+                  std::chrono::microseconds(BytePSGlobal::GetBatchWaitUs());
+  auto notifier = q->getNotifier();
+  while (bytes < BytePSGlobal::GetBatchBytes()) {
+    auto version = notifier->Version();
+    auto task = q->getTask();
+    if (!task) {
+      if (std::chrono::steady_clock::now() >= deadline) break;
+      // until a task may be ready
+      notifier->WaitUntil(version, deadline);
+      continue;
+    }
+    tasks.push_back(task);
+    bytes += task->len;
+  }
+
+  std::map<std::pair<int, int>, size_t> index;  // (server, dtype) -> batch
+  for (auto &task : tasks) {
+    if (!IsBatchable(task)) {
+      batches.push_back({task});
+      continue;
+    }
+    auto &pskv = BytePSGlobal::EncodeDefaultKey(task->key, task->len);
+    auto tensor = task->tensor ? task->tensor : task->output;
+    auto id = std::make_pair(pskv.server, (int)tensor->dtype());
+    auto it = index.find(id);
+    if (it == index.end()) {
+      index[id] = batches.size();
+      batches.push_back({task});
+    } else {
+      batches[it->second].push_back(task);
+    }
+  }
+  return batches;
+}
+
+// Packs the keys, lengths and values of a batch, sorted by key as ps-lite
+// requires. `vals` receives the data only if `copy_data` is set.
+void PackBatch(std::vector<std::shared_ptr<TensorTableEntry>> &tasks,
+               ps::SArray<ps::Key> *keys, ps::SArray<char> *vals,
+               ps::SArray<int> *lens, bool copy_data) {
+  std::vector<std::pair<ps::Key, std::shared_ptr<TensorTableEntry>>> sorted;
+  for (auto &task : tasks) {
+    auto &pskv = BytePSGlobal::EncodeDefaultKey(task->key, task->len);
+    sorted.emplace_back(pskv.keys[0], task);
+  }
+  std::sort(sorted.begin(), sorted.end(),
+            [](const std::pair<ps::Key, std::shared_ptr<TensorTableEntry>> &a,
+               const std::pair<ps::Key, std::shared_ptr<TensorTableEntry>> &b) {
+              return a.first < b.first;
+            });
+  size_t total = 0;
+  for (size_t i = 0; i < sorted.size(); ++i) {
+    tasks[i] = sorted[i].second;
+    keys->push_back(sorted[i].first);
+    lens->push_back(tasks[i]->len);
+    total += tasks[i]->len;
+  }
+  vals->resize(total);
+  if (!copy_data) return;
+  size_t offset = 0;
+  for (auto &task : tasks) {
+    memcpy(vals->data() + offset, (char *)task->cpubuff + task->offset,
+           task->len);
+    offset += task->len;
+  }
+}
+
+void PushOne(std::shared_ptr<TensorTableEntry> task) {
+  auto offset = task->offset;
+  auto len = task->len;
+
+  char *data;
+  BPS_CHECK(task->cpubuff);
+  data = const_cast<char *>(static_cast<const char *>(task->cpubuff) + offset);
+
+  // get metadata
+  const int dtype = task->tensor->dtype();
+
+  // use compressed data/len
+  if (task->compressed) {
+    BPS_LOG(DEBUG) << "PUSH with gradient compression. key=" << task->key;
+    data = task->compressed->data;
+    len = task->compressed->size;
+    task->compressed = nullptr;
+  }
+
+  // false means not to delete data when SArray is deleted
+  ps::SArray<char> vals(data, len, false);
+
+  int cmd = GetCommandType(RequestType::kDefaultPushPull, dtype);
+  auto &pskv = BytePSGlobal::EncodeDefaultKey(task->key, len);
+  BytePSGlobal::RecordPushPullMessage(true, 1);
+  BytePSGlobal::GetPS()->ZPush(pskv.keys, vals, pskv.lens, cmd,
+                               [task]() { FinishOrProceed(task); });
+}
+
+void PushBatch(std::vector<std::shared_ptr<TensorTableEntry>> tasks) {
+  ps::SArray<ps::Key> keys;
+  ps::SArray<char> vals;
+  ps::SArray<int> lens;
+  PackBatch(tasks, &keys, &vals, &lens, true);
+  int cmd = GetCommandType(RequestType::kDefaultPushPull,
+                           tasks[0]->tensor->dtype());
+  BytePSGlobal::RecordPushPullMessage(true, tasks.size());
+  BytePSGlobal::GetPS()->ZPush(keys, vals, lens, cmd, [tasks]() {
+    for (auto &task : tasks) {
+      FinishOrProceed(task);
+    }
+  });
+}
+
 bool RunPushLoopOnce() {
   QueueType this_op = PUSH;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto notifier = q->getNotifier();
+  auto version = notifier->Version();
   auto task = q->getTask();
   if (task) {
+    notifier->OnPickup();
     BPS_CHECK(BytePSGlobal::IsRootDevice())
         << "only root device should enter PUSH loop";
 
     if (BytePSGlobal::IsDistributed()) {
-      auto offset = task->offset;
-      auto len = task->len;
-
-      char *data;
-      BPS_CHECK(task->cpubuff);
-      data =
-          const_cast<char *>(static_cast<const char *>(task->cpubuff) + offset);
-
-      // get metadata
-      const int dtype = task->tensor->dtype();
-
-      // use compressed data/len
-      if (task->compressed) {
-        BPS_LOG(DEBUG) << "PUSH with gradient compression. key=" << task->key;
-        data = task->compressed->data;
-        len = task->compressed->size;
-        task->compressed = nullptr;
+      for (auto &batch : DrainBatches(q, task)) {
+        if (batch.size() > 1) {
+          PushBatch(batch);
+        } else if (batch[0]->fused) {
+          // pushed and pulled together with the other tensors of its group
+          BytePSGlobal::GetFusion()->Push(batch[0]);
+        } else {
+          PushOne(batch[0]);
+        }
       }
-
-      // false means not to delete data when SArray is deleted
-      ps::SArray<char> vals(data, len, false);
-
-      int cmd = GetCommandType(RequestType::kDefaultPushPull, dtype);
-      auto &pskv = BytePSGlobal::EncodeDefaultKey(task->key, len);
-      BytePSGlobal::GetPS()->ZPush(pskv.keys, vals, pskv.lens, cmd,
-                                   [task, q]() { FinishOrProceed(task); });
     } else {
       // This is a dummy barrier for IsCrossPcieSwitch()
       BPS_CHECK(BytePSGlobal::IsCrossPcieSwitch());
       FinishOrProceed(task);
     }
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
   return true;
 }
 
+void PullOne(std::shared_ptr<TensorTableEntry> task) {
+  auto offset = task->offset;
+  auto len = task->len;
+
+  char *data;
+  BPS_CHECK(task->cpubuff);
+  data = const_cast<char *>(static_cast<const char *>(task->cpubuff) + offset);
+
+  // get metadata
+  const int dtype = task->output->dtype();
+
+  // false means not to delete data when SArray is deleted
+  auto vals = new ps::SArray<char>(data, len, false);
+
+  int cmd = GetCommandType(RequestType::kDefaultPushPull, dtype);
+  auto &pskv = BytePSGlobal::EncodeDefaultKey(task->key, len);
+  BytePSGlobal::RecordPushPullMessage(false, 1);
+  // issue pull
+  BytePSGlobal::GetPS()->ZPull(pskv.keys, vals, &pskv.lens, cmd,
+                               [vals, task]() {
+                                 delete vals;
+                                 FinishOrProceed(task);
+                               });
+}
+
+void PullBatch(std::vector<std::shared_ptr<TensorTableEntry>> tasks) {
+  ps::SArray<ps::Key> keys;
+  auto vals = new ps::SArray<char>();
+  auto lens = new ps::SArray<int>();
+  PackBatch(tasks, &keys, vals, lens, false);
+  int cmd = GetCommandType(RequestType::kDefaultPushPull,
+                           tasks[0]->output->dtype());
+  BytePSGlobal::RecordPushPullMessage(false, tasks.size());
+  BytePSGlobal::GetPS()->ZPull(keys, vals, lens, cmd, [vals, lens, tasks]() {
+    // scatter the values back to the tasks, in key order
+    size_t offset = 0;
+    for (size_t i = 0; i < tasks.size(); ++i) {
+      auto &task = tasks[i];
+      BPS_CHECK_EQ((size_t)(*lens)[i], task->len) << task->tensor_name;
+      memcpy((char *)task->cpubuff + task->offset, vals->data() + offset,
+             task->len);
+      offset += task->len;
+    }
+    delete vals;
+    delete lens;
+    for (auto &task : tasks) {
+      FinishOrProceed(task);
+    }
+  });
+}
+
 bool RunPullLoopOnce() {
   QueueType this_op = PULL;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto notifier = q->getNotifier();
+  auto version = notifier->Version();
   auto task = q->getTask();
   if (task) {
+    notifier->OnPickup();
     BPS_CHECK(BytePSGlobal::IsRootDevice())
         << "only root device should enter PULL loop";
-    // TODO: allow merging
-    auto offset = task->offset;
-    auto len = task->len;
-
-    char *data;
-    BPS_CHECK(task->cpubuff);
-    data =
-        const_cast<char *>(static_cast<const char *>(task->cpubuff) + offset);
-
-    // get metadata
-    const int dtype = task->output->dtype();
-
-    // false means not to delete data when SArray is deleted
-    auto vals = new ps::SArray<char>(data, len, false);
-
-    int cmd = GetCommandType(RequestType::kDefaultPushPull, dtype);
-    auto &pskv = BytePSGlobal::EncodeDefaultKey(task->key, len);
-    // issue pull
-    BytePSGlobal::GetPS()->ZPull(pskv.keys, vals, &pskv.lens, cmd,
-                                 [vals, task, q]() {
-                                   delete vals;
-                                   FinishOrProceed(task);
-                                 });
+    for (auto &batch : DrainBatches(q, task)) {
+      if (batch.size() > 1) {
+        PullBatch(batch);
+      } else if (batch[0]->fused) {
+        // already pulled in the PUSH stage
+        FinishOrProceed(batch[0]);
+      } else {
+        PullOne(batch[0]);
+      }
+    }
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
   return true;
 }
@@ -618,13 +808,16 @@ bool RunPullLoopOnce() {
 bool RunDecompressLoopOnce() {
   QueueType this_op = DECOMPRESS;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto notifier = q->getNotifier();
+  auto version = notifier->Version();
   auto task = q->getTask();
   if (task) {
+    notifier->OnPickup();
     BPS_CHECK(BytePSGlobal::IsRootDevice())
         << "only root device should enter DECOMPRESS loop";
     BPS_CHECK(task->compressor != nullptr);
 
-    // spawn
+    // spawn, the front layers first
     BytePSGlobal::GetThreadPool()->enqueue([task]() {
       char *data = const_cast<char *>(static_cast<const char *>(task->cpubuff) +
                                       task->offset);
@@ -636,10 +829,10 @@ bool RunDecompressLoopOnce() {
       BPS_LOG(DEBUG) << "PULL with gradient compression. key=" << task->key;
 
       FinishOrProceed(task);
-    });
+    }, task->priority);
 
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
 
   return true;
@@ -694,9 +887,12 @@ void CopyHost2Device(std::shared_ptr<byteps::common::TensorTableEntry> task) {
 bool RunRootCopyHost2DeviceLoopOnce() {
   QueueType this_op = COPYH2D;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto notifier = q->getNotifier();
+  auto version = notifier->Version();
   auto task = q->getTask();
 
   if (task) {
+    notifier->OnPickup();
     auto key = task->key;
     int local_rank = BytePSGlobal::GetLocalRank();
     int local_size = BytePSGlobal::GetLocalSize();
@@ -711,7 +907,7 @@ bool RunRootCopyHost2DeviceLoopOnce() {
 
     FinishOrProceed(task);
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
   return true;
 }
@@ -739,13 +935,16 @@ bool RunNonRootCopyListenLoopOnce() {
 bool RunNonRootCopyHost2DeviceLoopOnce() {
   QueueType this_op = COPYH2D;
   auto q = BytePSGlobal::GetScheduledQueue(this_op);
+  auto notifier = q->getNotifier();
+  auto version = notifier->Version();
   auto task = q->getTask();
 
   if (task) {
+    notifier->OnPickup();
     CopyHost2Device(task);
     FinishOrProceed(task);
   } else {
-    std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    notifier->Idle(version);
   }
   return true;
 }
@@ -813,12 +1012,14 @@ void CompressLoop() {
 }
 
 void PushLoop() {
+  PinThread("push");
   while (RunPushLoopOnce() && !BytePSGlobal::ShouldShutdown()) {
   }
   BytePSGlobal::ReportThreadFinish();
 }
 
 void PullLoop() {
+  PinThread("pull");
   while (RunPullLoopOnce() && !BytePSGlobal::ShouldShutdown()) {
   }
   BytePSGlobal::ReportThreadFinish();
@@ -844,6 +1045,14 @@ void NonRootCopyListenLoop() {
   BytePSGlobal::ReportThreadFinish();
 }
 
+bool RunFusionLoopOnce() { return BytePSGlobal::GetFusion()->Poll(); }
+
+void FusionLoop() {
+  while (RunFusionLoopOnce() && !BytePSGlobal::ShouldShutdown()) {
+  }
+  BytePSGlobal::ReportThreadFinish();
+}
+
 void NonRootCopyHost2DeviceLoop() {
   CUDA_CALL(cudaSetDevice(BytePSGlobal::GetLocalRank()));
   while (RunNonRootCopyHost2DeviceLoopOnce() &&
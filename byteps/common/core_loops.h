@@ -16,9 +16,15 @@
 #ifndef BYTEPS_CORE_LOOPS_H
 #define BYTEPS_CORE_LOOPS_H
 
+#include <memory>
+
+#include "common.h"
+
 namespace byteps {
 namespace common {
 
+void FinishOrProceed(std::shared_ptr<TensorTableEntry> task);
+
 void CoordinateReduceLoop();
 
 void CoordinateBroadcastLoop();
@@ -49,6 +55,8 @@ void NonRootCopyListenLoop();
 
 void NonRootCopyHost2DeviceLoop();
 
+void FusionLoop();
+
 }  // namespace common
 }  // namespace byteps
 
@@ -16,14 +16,12 @@
 #ifndef BYTEPS_CPU_REDUCER_H
 #define BYTEPS_CPU_REDUCER_H
 
-#if __AVX__ && __F16C__
-#include <cpuid.h>
-#include <immintrin.h>
-#endif
-
 #include <cstring>
+#include <functional>
 #include <memory>
+#include <vector>
 #include "common.h"
+#include "cpu_reducer_kernels.h"
 #include "logging.h"
 
 #ifndef BYTEPS_BUILDING_SERVER
@@ -34,9 +32,26 @@ typedef void BytePSComm;
 
 #include <stdint.h>
 
+class ThreadPool;
+
 namespace byteps {
 namespace common {
 
+// The team sizes CpuReducer uses, measured once per process by timing
+// dst += src with each candidate size on buffers of a few lengths.
+struct ReducerCalibration {
+  struct Row {
+    DataType dtype;
+    // [length][team size] microseconds of one sum
+    std::vector<std::vector<double>> us;
+    // [length] the team size used for buffers of at least that length
+    std::vector<int> best;
+  };
+  std::vector<int> threads;   // candidate team sizes
+  std::vector<size_t> bytes;  // buffer lengths measured
+  std::vector<Row> rows;      // float32, float64, float16, bfloat16
+};
+
 class CpuReducer {
  public:
   CpuReducer(std::shared_ptr<BytePSComm> comm);
@@ -53,6 +68,16 @@ class CpuReducer {
   int sum(void* dst, const void* src1, const void* src2, size_t len,
           DataType dtype, float alpha);
 
+  // dst = srcs[0] + ... + srcs[num_srcs - 1], reading each source and
+  // writing dst once. dst may be srcs[0], but no other source.
+  int sum(void* dst, const void* const* srcs, size_t num_srcs, size_t len,
+          DataType dtype);
+
+  // dst = srcs[0] + alpha * (srcs[1] + ... + srcs[num_srcs - 1]), the
+  // N-ary form of dst = src1 + alpha * src2
+  int sum(void* dst, const void* const* srcs, size_t num_srcs, size_t len,
+          DataType dtype, float alpha);
+
   int copy(void* dst, const void* src, size_t len);
 
 #ifndef BYTEPS_BUILDING_SERVER
@@ -62,146 +87,69 @@ class CpuReducer {
 
   DataType GetDataType(int dtype) { return static_cast<DataType>(dtype); }
 
+  // The calibration of this process, with no rows unless it is enabled by
+  // BYTEPS_REDUCER_CALIBRATE.
+  static const ReducerCalibration& GetCalibration();
+
  private:
+  template <typename T>
+  int _sum(T* dst, const T* src, size_t len, int threads);
+  template <typename T>
+  int _sum(T* dst, const T* src1, const T* src2, size_t len, int threads);
 
-#if __AVX__ && __F16C__
-  // Query CPUID to determine AVX and F16C runtime support.
-  bool is_avx_and_f16c() {
-    static bool initialized = false;
-    static bool result = false;
-    if (!initialized) {
-      unsigned int eax, ebx, ecx, edx;
-      if (__get_cpuid(1, &eax, &ebx, &ecx, &edx)) {
-        result = (ecx & bit_AVX) && (ecx & bit_F16C);
-      }
-      initialized = true;
-    }
-    return result;
-  }
-#endif
+  template <typename T>
+  int _sum(T* dst, const T* src, size_t len, float alpha, int threads);
 
-  inline void HalfBits2Float(const unsigned short* src, float* res) {
-    unsigned h = *src;
-    int sign = ((h >> 15) & 1);
-    int exp = ((h >> 10) & 0x1f);
-    int mantissa = (h & 0x3ff);
-    unsigned f = 0;
-
-    if (exp > 0 && exp < 31) {
-      // normal
-      exp += 112;
-      f = (sign << 31) | (exp << 23) | (mantissa << 13);
-    } else if (exp == 0) {
-      if (mantissa) {
-        // subnormal
-        exp += 113;
-        while ((mantissa & (1 << 10)) == 0) {
-          mantissa <<= 1;
-          exp--;
-        }
-        mantissa &= 0x3ff;
-        f = (sign << 31) | (exp << 23) | (mantissa << 13);
-      } else {
-        // sign-preserving zero
-        f = (sign << 31);
-      }
-    } else if (exp == 31) {
-      if (mantissa) {
-        f = 0x7fffffff;  // not a number
-      } else {
-        f = (0xff << 23) | (sign << 31);  //  inf
-      }
-    }
-
-    *res = *reinterpret_cast<float const*>(&f);
-  }
+  template <typename T>
+  int _sum(T* dst, const T* src1, const T* src2, size_t len, float alpha,
+           int threads);
 
-  inline void Float2HalfBits(const float* src, unsigned short* dest) {
-    // software implementation rounds toward nearest even
-    unsigned const& s = *reinterpret_cast<unsigned const*>(src);
-    uint16_t sign = uint16_t((s >> 16) & 0x8000);
-    int16_t exp = uint16_t(((s >> 23) & 0xff) - 127);
-    int mantissa = s & 0x7fffff;
-    uint16_t u = 0;
-
-    if ((s & 0x7fffffff) == 0) {
-      // sign-preserving zero
-      *dest = sign;
-      return;
-    }
-
-    if (exp > 15) {
-      if (exp == 128 && mantissa) {
-        // not a number
-        u = 0x7fff;
-      } else {
-        // overflow to infinity
-        u = sign | 0x7c00;
-      }
-      *dest = u;
-      return;
-    }
-
-    int sticky_bit = 0;
-
-    if (exp >= -14) {
-      // normal fp32 to normal fp16
-      exp = uint16_t(exp + uint16_t(15));
-      u = uint16_t(((exp & 0x1f) << 10));
-      u = uint16_t(u | (mantissa >> 13));
-    } else {
-      // normal single-precision to subnormal half_t-precision representation
-      int rshift = (-14 - exp);
-      if (rshift < 32) {
-        mantissa |= (1 << 23);
-
-        sticky_bit = ((mantissa & ((1 << rshift) - 1)) != 0);
-
-        mantissa = (mantissa >> rshift);
-        u = (uint16_t(mantissa >> 13) & 0x3ff);
-      } else {
-        mantissa = 0;
-        u = 0;
-      }
-    }
-
-    // round to nearest even
-    int round_bit = ((mantissa >> 12) & 1);
-    sticky_bit |= ((mantissa & ((1 << 12) - 1)) != 0);
-
-    if ((round_bit && sticky_bit) || (round_bit && (u & 1))) {
-      u = uint16_t(u + 1);
-    }
-
-    u |= sign;
-
-    *dest = u;
-  }
+  template <typename T>
+  int _sum(T* dst, const T* const* srcs, size_t num_srcs, size_t len,
+           float alpha, int threads);
 
+  // The floating point types go through the kernels of the instruction set
+  // picked at runtime, see cpu_reducer_kernels.h.
   template <typename T>
-  int _sum(T* dst, const T* src, size_t len);
+  int _axpy(void (*kernel)(T*, const T*, const T*, size_t, float), void* dst,
+            const void* src1, const void* src2, size_t len, float alpha,
+            int threads);
   template <typename T>
-  int _sum(T* dst, const T* src1, const T* src2, size_t len);
+  int _sum_n(void (*kernel)(T*, const T* const*, size_t, size_t, size_t,
+                            float, bool),
+             void* dst, const void* const* srcs, size_t num_srcs, size_t len,
+             float alpha, int threads);
 
-  int _sum_float16(void* dst, const void* src, size_t len);
-  int _sum_float16(void* dst, const void* src1, const void* src2, size_t len);
+  // Runs f(begin, end) on contiguous chunks of [0, n), one per thread of a
+  // team of the given size, on the calling thread alone for one thread.
+  template <typename F>
+  void parallel_for(size_t n, int threads, F f);
 
-  template <typename T>
-  int _sum(T* dst, const T* src, size_t len, float alpha);
+  // Runs body(0), ..., body(num_chunks - 1) on the calling thread and the
+  // workers of the reducer thread pool, see BYTEPS_REDUCER_USE_THREADPOOL.
+  void run_on_pool(size_t num_chunks, const std::function<void(size_t)>& body);
 
-  template <typename T>
-  int _sum(T* dst, const T* src1, const T* src2, size_t len, float alpha);
+  // The team size for a sum over len bytes of dtype.
+  int threads_for(size_t len, DataType dtype);
 
-  int _sum_float16(void* dst, const void* src, size_t len, float alpha);
-  int _sum_float16(void* dst, const void* src1, const void* src2, size_t len,
-                   float alpha);
+  // Times dst += src with each candidate team size, see ReducerCalibration.
+  void calibrate(ReducerCalibration* calibration);
 
   float _convert_half_to_full_precision(uint16_t h);
   uint16_t _convert_full_to_half_precision(float f);
 
+  // Pins the largest OpenMP team of the calling thread to the "reducer"
+  // CPUs (see BYTEPS_THREAD_AFFINITY) on its first reduction.
+  void pin_team();
+
   std::shared_ptr<BytePSComm> _comm;
+  const ReducerKernels& _kernels;
+  // the largest team size, and the only one without calibration
   int _num_threads;
-  size_t _single_thread_threshold; 
+  bool _pin_team;
+  ThreadPool* _pool;
+  // N-ary sums moving more bytes than this use non-temporal stores
+  size_t _stream_bytes;
 };
 
 }  // namespace common
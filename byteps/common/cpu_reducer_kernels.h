@@ -0,0 +1,188 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_CPU_REDUCER_KERNELS_H
+#define BYTEPS_CPU_REDUCER_KERNELS_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#include <cstring>
+#include <string>
+
+namespace byteps {
+namespace common {
+
+// Single-threaded reduction kernels of one instruction set. CpuReducer
+// splits a buffer into chunks and runs a kernel on each chunk. Lengths are
+// in elements. For axpy, dst may be a or b. For sum_n, dst may be srcs[0],
+// and the elements [offset, offset + n) of every buffer are summed. With
+// stream, sum_n writes dst with non-temporal stores, which bypass the caches
+// for buffers that would not stay there anyway.
+struct ReducerKernels {
+  const char* isa;
+  // dst = a + alpha * b, computed in float for float16 and bfloat16
+  void (*axpy_f32)(float* dst, const float* a, const float* b, size_t n,
+                   float alpha);
+  void (*axpy_f64)(double* dst, const double* a, const double* b, size_t n,
+                   float alpha);
+  void (*axpy_f16)(uint16_t* dst, const uint16_t* a, const uint16_t* b,
+                   size_t n, float alpha);
+  void (*axpy_bf16)(uint16_t* dst, const uint16_t* a, const uint16_t* b,
+                    size_t n, float alpha);
+  // dst = srcs[0] + alpha * (srcs[1] + ... + srcs[num_srcs - 1]) for
+  // num_srcs >= 2, accumulated in float for float16 and bfloat16
+  void (*sum_n_f32)(float* dst, const float* const* srcs, size_t num_srcs,
+                    size_t offset, size_t n, float alpha, bool stream);
+  void (*sum_n_f64)(double* dst, const double* const* srcs, size_t num_srcs,
+                    size_t offset, size_t n, float alpha, bool stream);
+  void (*sum_n_f16)(uint16_t* dst, const uint16_t* const* srcs,
+                    size_t num_srcs, size_t offset, size_t n, float alpha,
+                    bool stream);
+  void (*sum_n_bf16)(uint16_t* dst, const uint16_t* const* srcs,
+                     size_t num_srcs, size_t offset, size_t n, float alpha,
+                     bool stream);
+};
+
+// The kernels for the best instruction set of this CPU, chosen by CPUID on
+// the first call. BYTEPS_REDUCER_ISA=scalar|avx2|avx512 caps the choice.
+const ReducerKernels& GetReducerKernels();
+
+// The kernels of the named instruction set, or nullptr if this CPU or
+// build does not support it.
+const ReducerKernels* FindReducerKernels(const std::string& isa);
+
+inline void HalfBits2Float(const unsigned short* src, float* res) {
+  unsigned h = *src;
+  int sign = ((h >> 15) & 1);
+  int exp = ((h >> 10) & 0x1f);
+  int mantissa = (h & 0x3ff);
+  unsigned f = 0;
+
+  if (exp > 0 && exp < 31) {
+    // normal
+    exp += 112;
+    f = (sign << 31) | (exp << 23) | (mantissa << 13);
+  } else if (exp == 0) {
+    if (mantissa) {
+      // subnormal
+      exp += 113;
+      while ((mantissa & (1 << 10)) == 0) {
+        mantissa <<= 1;
+        exp--;
+      }
+      mantissa &= 0x3ff;
+      f = (sign << 31) | (exp << 23) | (mantissa << 13);
+    } else {
+      // sign-preserving zero
+      f = (sign << 31);
+    }
+  } else if (exp == 31) {
+    if (mantissa) {
+      f = 0x7fffffff;  // not a number
+    } else {
+      f = (0xff << 23) | (sign << 31);  //  inf
+    }
+  }
+
+  std::memcpy(res, &f, sizeof(*res));
+}
+
+inline void Float2HalfBits(const float* src, unsigned short* dest) {
+  // software implementation rounds toward nearest even
+  unsigned s;
+  std::memcpy(&s, src, sizeof(s));
+  uint16_t sign = uint16_t((s >> 16) & 0x8000);
+  int16_t exp = uint16_t(((s >> 23) & 0xff) - 127);
+  int mantissa = s & 0x7fffff;
+  uint16_t u = 0;
+
+  if ((s & 0x7fffffff) == 0) {
+    // sign-preserving zero
+    *dest = sign;
+    return;
+  }
+
+  if (exp > 15) {
+    if (exp == 128 && mantissa) {
+      // not a number
+      u = 0x7fff;
+    } else {
+      // overflow to infinity
+      u = sign | 0x7c00;
+    }
+    *dest = u;
+    return;
+  }
+
+  int sticky_bit = 0;
+
+  if (exp >= -14) {
+    // normal fp32 to normal fp16
+    exp = uint16_t(exp + uint16_t(15));
+    u = uint16_t(((exp & 0x1f) << 10));
+    u = uint16_t(u | (mantissa >> 13));
+  } else {
+    // normal single-precision to subnormal half_t-precision representation
+    int rshift = (-14 - exp);
+    if (rshift < 32) {
+      mantissa |= (1 << 23);
+
+      sticky_bit = ((mantissa & ((1 << rshift) - 1)) != 0);
+
+      mantissa = (mantissa >> rshift);
+      u = (uint16_t(mantissa >> 13) & 0x3ff);
+    } else {
+      mantissa = 0;
+      u = 0;
+    }
+  }
+
+  // round to nearest even
+  int round_bit = ((mantissa >> 12) & 1);
+  sticky_bit |= ((mantissa & ((1 << 12) - 1)) != 0);
+
+  if ((round_bit && sticky_bit) || (round_bit && (u & 1))) {
+    u = uint16_t(u + 1);
+  }
+
+  u |= sign;
+
+  *dest = u;
+}
+
+inline float BFloat16Bits2Float(uint16_t h) {
+  uint32_t bits = static_cast<uint32_t>(h) << 16;
+  float f;
+  std::memcpy(&f, &bits, sizeof(f));
+  return f;
+}
+
+inline uint16_t Float2BFloat16Bits(float value) {
+  uint32_t f;
+  std::memcpy(&f, &value, sizeof(f));
+  if ((f & 0x7fffffff) > 0x7f800000) {
+    // quiet NaN, which the rounding below could turn into infinity
+    return static_cast<uint16_t>((f >> 16) | 0x40);
+  }
+  // round to nearest even
+  f += 0x7fff + ((f >> 16) & 1);
+  return static_cast<uint16_t>(f >> 16);
+}
+
+}  // namespace common
+}  // namespace byteps
+
+#endif  // BYTEPS_CPU_REDUCER_KERNELS_H
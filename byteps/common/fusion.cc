@@ -0,0 +1,421 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <cstring>
+
+#include "core_loops.h"
+#include "fusion.h"
+#include "global.h"
+#include "logging.h"
+
+namespace byteps {
+namespace common {
+
+namespace {
+
+uint64_t NowNs() {
+  return std::chrono::duration_cast<std::chrono::nanoseconds>(
+             std::chrono::steady_clock::now().time_since_epoch())
+      .count();
+}
+
+size_t Align8(size_t x) { return (x + 7) / 8 * 8; }
+
+// FNV-1a, the same on every worker unlike std::hash
+uint64_t Fnv1a(uint64_t hash, const void* data, size_t len) {
+  auto p = static_cast<const unsigned char*>(data);
+  for (size_t i = 0; i < len; ++i) {
+    hash = (hash ^ p[i]) * 0x100000001b3ull;
+  }
+  return hash;
+}
+
+// the number of elements of the membership check, one bit of the hash each
+const int kCheckBits = 64;
+
+bool IsFusibleType(int dtype) {
+  // the counters must hold the number of workers exactly
+  switch (dtype) {
+    case BYTEPS_FLOAT32:
+    case BYTEPS_FLOAT64:
+    case BYTEPS_FLOAT16:
+    case BYTEPS_INT32:
+    case BYTEPS_INT64:
+      return true;
+    case BYTEPS_BFLOAT16:
+      // integers are exact up to 256
+      return BytePSGlobal::GetNumWorker() <= 256;
+    default:
+      return false;
+  }
+}
+
+void WriteCounter(char* p, int dtype, int value) {
+  switch (dtype) {
+    case BYTEPS_FLOAT32:
+      *reinterpret_cast<float*>(p) = value;
+      break;
+    case BYTEPS_FLOAT64:
+      *reinterpret_cast<double*>(p) = value;
+      break;
+    case BYTEPS_FLOAT16:
+      // 0 or 1.0
+      *reinterpret_cast<uint16_t*>(p) = value ? 0x3c00 : 0;
+      break;
+    case BYTEPS_BFLOAT16:
+      *reinterpret_cast<uint16_t*>(p) = value ? 0x3f80 : 0;
+      break;
+    case BYTEPS_INT32:
+      *reinterpret_cast<int32_t*>(p) = value;
+      break;
+    case BYTEPS_INT64:
+      *reinterpret_cast<int64_t*>(p) = value;
+      break;
+    default:
+      BPS_CHECK(0) << "unsupported dtype " << dtype;
+  }
+}
+
+int64_t ReadCounter(const char* p, int dtype) {
+  switch (dtype) {
+    case BYTEPS_FLOAT32:
+      return std::llround(*reinterpret_cast<const float*>(p));
+    case BYTEPS_FLOAT64:
+      return std::llround(*reinterpret_cast<const double*>(p));
+    case BYTEPS_FLOAT16: {
+      // a small non-negative integer, exact up to 2048
+      uint16_t h = *reinterpret_cast<const uint16_t*>(p);
+      int exp = (h >> 10) & 0x1f;
+      if (!exp) return 0;
+      return std::llround(std::ldexp(1.0 + (h & 0x3ff) / 1024.0, exp - 15));
+    }
+    case BYTEPS_BFLOAT16:
+      return std::llround(
+          BFloat16Bits2Float(*reinterpret_cast<const uint16_t*>(p)));
+    case BYTEPS_INT32:
+      return *reinterpret_cast<const int32_t*>(p);
+    case BYTEPS_INT64:
+      return *reinterpret_cast<const int64_t*>(p);
+    default:
+      BPS_CHECK(0) << "unsupported dtype " << dtype;
+  }
+  return 0;
+}
+
+}  // namespace
+
+FusionManager::FusionManager(size_t threshold, size_t buffer_bytes,
+                             uint64_t deadline_us)
+    : _threshold(threshold),
+      _buffer_bytes(buffer_bytes),
+      _deadline_ns(deadline_us * 1000) {
+  BPS_CHECK_GE(_buffer_bytes, _threshold)
+      << "BYTEPS_FUSION_BUFFER_BYTES should not be smaller than "
+      << "BYTEPS_FUSION_THRESHOLD";
+  BPS_CHECK_LE(BytePSGlobal::GetNumWorker(), 2048)
+      << "too many workers for tensor fusion";
+  _reducer.reset(new CpuReducer(nullptr));
+}
+
+FusionManager::~FusionManager() {
+  BPS_LOG(DEBUG) << "Tensor fusion: " << _groups.size() << " group(s), "
+                 << _fused_tasks << " fused push_pull(s) in " << _rounds
+                 << " round(s)";
+}
+
+bool FusionManager::AddTensor(BPSContext& context, size_t size, int dtype) {
+  if (size > _threshold || !IsFusibleType(dtype) ||
+      context.key_list.size() != 1 || !context.kwargs.empty()) {
+    return false;
+  }
+  std::lock_guard<std::mutex> lock(_mutex);
+  auto it = _open.find(dtype);
+  FusionGroup* group = (it == _open.end()) ? nullptr : it->second;
+  if (group && (group->sealed ||
+                Align8(group->data_len) + size > _buffer_bytes)) {
+    group = nullptr;
+  }
+  if (!group) {
+    // fused keys take the declared keys from the top, so that they do not
+    // depend on how many tensors are declared later
+    uint64_t declared_key = (1 << 16) - 1 - _groups.size();
+    BPS_CHECK_GT(declared_key, BytePSGlobal::GetTensorCount())
+        << "declared keys are exhausted by tensors and fusion groups";
+    group = new FusionGroup();
+    group->key = declared_key << 16;
+    group->dtype = dtype;
+    _groups.emplace_back(group);
+    _open[dtype] = group;
+  }
+  FusionGroup::Member member;
+  member.context = &context;
+  member.offset = Align8(group->data_len);
+  member.len = size;
+  group->data_len = member.offset + size;
+  context.fusion_group = group;
+  context.fusion_index = group->members.size();
+  group->members.push_back(member);
+  BPS_LOG(DEBUG) << context.tensor_name << " joins fusion group key="
+                 << group->key << " at offset " << member.offset;
+  return true;
+}
+
+bool FusionManager::Prepare(BPSContext& context) {
+  auto group = context.fusion_group;
+  {
+    std::lock_guard<std::mutex> lock(_mutex);
+    auto& member = group->members[context.fusion_index];
+    // the first push_pull always uses the tensor's own key, as the group
+    // may still grow on other workers at this point
+    if (!member.enqueued) {
+      member.enqueued = true;
+      return false;
+    }
+    if (group->sealed) {
+      return true;
+    }
+  }
+  Seal(group);
+  return true;
+}
+
+void FusionManager::Seal(FusionGroup* group) {
+  std::lock_guard<std::mutex> seal_lock(_seal_mutex);
+  {
+    std::lock_guard<std::mutex> lock(_mutex);
+    if (group->sealed) return;
+    // no more members from now on
+    if (_open[group->dtype] == group) {
+      _open.erase(group->dtype);
+    }
+    // lay the members out by declared key, so that the buffer does not
+    // depend on the order in which they were initialized
+    auto& members = group->members;
+    std::sort(members.begin(), members.end(),
+              [](const FusionGroup::Member& a, const FusionGroup::Member& b) {
+                return a.context->declared_key < b.context->declared_key;
+              });
+    group->data_len = 0;
+    for (size_t i = 0; i < members.size(); ++i) {
+      members[i].offset = Align8(group->data_len);
+      members[i].context->fusion_index = i;
+      group->data_len = members[i].offset + members[i].len;
+    }
+  }
+
+  auto unit = getDataTypeLength(group->dtype);
+  group->counter_offset = Align8(group->data_len);
+  group->len = group->counter_offset + group->members.size() * unit;
+  auto shm_obj = BytePSGlobal::GetSharedMemoryObj();
+  group->cpubuff = (char*)shm_obj->openSharedMemory(
+      std::string("BytePS_ShM_"), group->key, Align(group->len, group->dtype));
+
+  if (BytePSGlobal::IsRootDevice()) {
+    CheckMembers(group);
+    group->send.resize(group->len);
+    group->recv.resize(group->len);
+    group->accum.resize(group->len);
+    // blocking push, also as a global barrier
+    auto ps = BytePSGlobal::GetOrInitPS();
+    auto& pskv = BytePSGlobal::EncodeDefaultKey(group->key, group->len);
+    ps::SArray<char> vals(group->send.data(), group->len, false);
+    int cmd = GetCommandType(RequestType::kDefaultPushPull, group->dtype);
+    ps->Wait(ps->ZPush(pskv.keys, vals, pskv.lens, cmd));
+  }
+
+  std::lock_guard<std::mutex> lock(_mutex);
+  for (auto& member : group->members) {
+    member.context->cpubuff = group->cpubuff + member.offset;
+  }
+  group->sealed = true;
+  BPS_LOG(DEBUG) << "Sealed fusion group key=" << group->key << " with "
+                 << group->members.size() << " tensor(s), len=" << group->len;
+}
+
+void FusionManager::CheckMembers(FusionGroup* group) {
+  // The members are the tensors initialized before the group was sealed,
+  // which may differ between workers. Each worker pushes the bits of a hash
+  // of its members as 0 or 1 to the key next to the group's, which is
+  // unused, so every summed bit is 0 or the number of workers if all agree.
+  uint64_t hash = 0xcbf29ce484222325ull;
+  hash = Fnv1a(hash, &group->len, sizeof(group->len));
+  for (auto& member : group->members) {
+    auto& name = member.context->tensor_name;
+    hash = Fnv1a(hash, name.data(), name.size() + 1);
+    hash = Fnv1a(hash, &member.len, sizeof(member.len));
+  }
+
+  auto unit = getDataTypeLength(group->dtype);
+  size_t len = kCheckBits * unit;
+  std::vector<char> send(len), recv(len);
+  for (int i = 0; i < kCheckBits; ++i) {
+    WriteCounter(send.data() + i * unit, group->dtype, (hash >> i) & 1);
+  }
+  auto ps = BytePSGlobal::GetOrInitPS();
+  auto& pskv = BytePSGlobal::EncodeDefaultKey(group->key + 1, len);
+  ps::SArray<char> vals(send.data(), len, false);
+  ps::SArray<char> out(recv.data(), len, false);
+  int cmd = GetCommandType(RequestType::kDefaultPushPull, group->dtype);
+  // the first push initializes the key
+  ps->Wait(ps->ZPush(pskv.keys, vals, pskv.lens, cmd));
+  ps->Wait(ps->ZPush(pskv.keys, vals, pskv.lens, cmd));
+  ps->Wait(ps->ZPull(pskv.keys, &out, &pskv.lens, cmd));
+
+  auto num_workers = BytePSGlobal::GetNumWorker();
+  for (int i = 0; i < kCheckBits; ++i) {
+    auto bits = ReadCounter(recv.data() + i * unit, group->dtype);
+    BPS_CHECK(bits == 0 || bits == num_workers)
+        << "fusion group key=" << group->key << " of "
+        << group->members.size() << " tensor(s), len=" << group->len
+        << ", has other tensors on other workers; initialize the tensors "
+        << "up to BYTEPS_FUSION_THRESHOLD bytes in the same order on every "
+        << "worker, or disable tensor fusion";
+  }
+}
+
+void FusionManager::Push(std::shared_ptr<TensorTableEntry> task) {
+  {
+    std::lock_guard<std::mutex> lock(_mutex);
+    auto group = task->context->fusion_group;
+    auto& member = group->members[task->context->fusion_index];
+    BPS_CHECK(!member.task) << task->tensor_name << " is already in fusion";
+    member.task = task;
+    if (!group->pending_since_ns) {
+      group->pending_since_ns = NowNs();
+    }
+    ++_fused_tasks;
+  }
+  _cv.notify_all();
+}
+
+bool FusionManager::IsDue(FusionGroup* group, uint64_t now) {
+  if (!group->sealed || group->in_flight || !group->pending_since_ns) {
+    return false;
+  }
+  size_t present = 0;
+  bool has_new = false;
+  for (auto& member : group->members) {
+    if (member.task) {
+      ++present;
+      has_new = has_new || !member.sent;
+    }
+  }
+  // all members are here, or wait no longer than the deadline for the rest
+  if (present == group->members.size() && has_new) return true;
+  return now >= group->pending_since_ns + _deadline_ns;
+}
+
+bool FusionManager::Poll() {
+  std::vector<FusionGroup*> due;
+  {
+    std::unique_lock<std::mutex> lock(_mutex);
+    auto now = NowNs();
+    uint64_t next = now + _deadline_ns;
+    for (auto& group : _groups) {
+      if (IsDue(group.get(), now)) {
+        StartRound(group.get());
+        due.push_back(group.get());
+      } else if (group->sealed && !group->in_flight &&
+                 group->pending_since_ns) {
+        next = std::min(next, group->pending_since_ns + _deadline_ns);
+      }
+    }
+    if (due.empty()) {
+      _cv.wait_for(lock, std::chrono::nanoseconds(next - now));
+      return true;
+    }
+  }
+
+  auto ps = BytePSGlobal::GetPS();
+  for (auto group : due) {
+    int cmd = GetCommandType(RequestType::kDefaultPushPull, group->dtype);
+    auto pskv = &BytePSGlobal::EncodeDefaultKey(group->key, group->len);
+    ps::SArray<char> vals(group->send.data(), group->len, false);
+    ps->ZPush(pskv->keys, vals, pskv->lens, cmd, [this, group, cmd, pskv]() {
+      auto vals = new ps::SArray<char>(group->recv.data(), group->len, false);
+      BytePSGlobal::GetPS()->ZPull(pskv->keys, vals, &pskv->lens, cmd,
+                                   [this, group, vals]() {
+                                     delete vals;
+                                     FinishRound(group);
+                                   });
+    });
+  }
+  return true;
+}
+
+void FusionManager::StartRound(FusionGroup* group) {
+  auto unit = getDataTypeLength(group->dtype);
+  memset(group->send.data(), 0, group->len);
+  for (size_t i = 0; i < group->members.size(); ++i) {
+    auto& member = group->members[i];
+    if (!member.task || member.sent) continue;
+    memcpy(group->send.data() + member.offset, group->cpubuff + member.offset,
+           member.len);
+    WriteCounter(group->send.data() + group->counter_offset + i * unit,
+                 group->dtype, 1);
+    member.sent = true;
+  }
+  group->in_flight = true;
+  ++_rounds;
+}
+
+void FusionManager::FinishRound(FusionGroup* group) {
+  auto unit = getDataTypeLength(group->dtype);
+  auto dtype = static_cast<DataType>(group->dtype);
+  std::vector<std::shared_ptr<TensorTableEntry>> done;
+  {
+    std::lock_guard<std::mutex> lock(_mutex);
+    for (size_t i = 0; i < group->members.size(); ++i) {
+      auto& member = group->members[i];
+      auto count = ReadCounter(
+          group->recv.data() + group->counter_offset + i * unit, group->dtype);
+      if (!count) continue;
+      auto accum = group->accum.data() + member.offset;
+      _reducer->sum(accum, group->recv.data() + member.offset, member.len,
+                    dtype);
+      member.count += count;
+      if (member.count < BytePSGlobal::GetNumWorker()) continue;
+
+      BPS_CHECK_EQ(member.count, BytePSGlobal::GetNumWorker())
+          << member.context->tensor_name << " is contributed too many times";
+      BPS_CHECK(member.task && member.sent)
+          << member.context->tensor_name << " is reduced without local data";
+      memcpy(group->cpubuff + member.offset, accum, member.len);
+      memset(accum, 0, member.len);
+      member.count = 0;
+      member.sent = false;
+      done.push_back(member.task);
+      member.task = nullptr;
+    }
+    group->in_flight = false;
+    group->pending_since_ns = 0;
+    for (auto& member : group->members) {
+      if (member.task) {
+        group->pending_since_ns = NowNs();
+        break;
+      }
+    }
+  }
+  _cv.notify_all();
+  for (auto& task : done) {
+    FinishOrProceed(task);
+  }
+}
+
+}  // namespace common
+}  // namespace byteps
@@ -0,0 +1,126 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_FUSION_H
+#define BYTEPS_FUSION_H
+
+#include <condition_variable>
+#include <memory>
+#include <mutex>
+#include <unordered_map>
+#include <vector>
+
+#include "common.h"
+#include "cpu_reducer.h"
+
+namespace byteps {
+namespace common {
+
+/**
+ * \brief A set of small tensors that share one key on the servers.
+ *
+ * Members join in the order of InitTensor, until the group is sealed on the
+ * second push_pull of any member; from then on every member pushes and
+ * pulls through the fused key. At sealing, the members are laid out by
+ * declared key, and the workers check that they have the same members.
+ *
+ * The fused buffer holds the data of all members followed by one counter
+ * element per member. A worker sets the counter of a member to 1 in the
+ * round that carries its data, so the pulled counter tells how many workers
+ * contributed the member. Rounds may carry only a part of the members (see
+ * BYTEPS_FUSION_DEADLINE_US); the pulled values are accumulated until all
+ * workers have contributed, and only then the member is handed to the next
+ * stage.
+ */
+struct FusionGroup {
+  struct Member {
+    BPSContext* context;
+    size_t offset;
+    size_t len;
+    bool enqueued = false;
+    // the task waiting in the PUSH stage
+    std::shared_ptr<TensorTableEntry> task;
+    // whether the data of `task` has been sent
+    bool sent = false;
+    // accumulated number of contributing workers
+    int64_t count = 0;
+  };
+
+  uint64_t key;
+  int dtype;
+  size_t data_len = 0;
+  // data_len rounded up, followed by one counter element per member
+  size_t counter_offset = 0;
+  size_t len = 0;
+  std::vector<Member> members;
+
+  bool sealed = false;
+  // shared with the other local ranks, target of D2H and source of H2D
+  char* cpubuff = nullptr;
+  // only used on the root device
+  std::vector<char> send;
+  std::vector<char> recv;
+  std::vector<char> accum;
+  bool in_flight = false;
+  uint64_t pending_since_ns = 0;
+};
+
+class FusionManager {
+ public:
+  FusionManager(size_t threshold, size_t buffer_bytes, uint64_t deadline_us);
+  ~FusionManager();
+
+  // Called at InitTensor. Returns true if the tensor joined a group.
+  bool AddTensor(BPSContext& context, size_t size, int dtype);
+  // Called at EnqueueTensor. Returns true if this push_pull goes through
+  // the fused key; may block to seal the group.
+  bool Prepare(BPSContext& context);
+  // Called by the PUSH loop for a fused task.
+  void Push(std::shared_ptr<TensorTableEntry> task);
+  // Starts the rounds that are due, then waits for new tasks or the deadline.
+  bool Poll();
+  void Notify() { _cv.notify_all(); }
+
+  size_t GetThreshold() const { return _threshold; }
+
+ private:
+  void Seal(FusionGroup* group);
+  // fails if the members of the group differ between workers
+  void CheckMembers(FusionGroup* group);
+  void StartRound(FusionGroup* group);
+  void FinishRound(FusionGroup* group);
+  bool IsDue(FusionGroup* group, uint64_t now);
+
+  size_t _threshold;
+  size_t _buffer_bytes;
+  uint64_t _deadline_ns;
+
+  std::mutex _mutex;
+  std::condition_variable _cv;
+  // serializes the blocking server initialization of sealed groups
+  std::mutex _seal_mutex;
+  std::vector<std::unique_ptr<FusionGroup>> _groups;
+  // the group that new tensors of each dtype join
+  std::unordered_map<int, FusionGroup*> _open;
+  std::unique_ptr<CpuReducer> _reducer;
+
+  uint64_t _rounds = 0;
+  uint64_t _fused_tasks = 0;
+};
+
+}  // namespace common
+}  // namespace byteps
+
+#endif  // BYTEPS_FUSION_H
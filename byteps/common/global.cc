@@ -16,8 +16,12 @@
 #include <malloc.h>
 #include <numa.h>
 
+#include <algorithm>
+#include <limits>
 #include <sstream>
+#include <string>
 
+#include "affinity.h"
 #include "compressor/compressor.h"
 #include "global.h"
 
@@ -41,6 +45,16 @@ bool BytePSGlobal::_is_distributed_job;
 bool BytePSGlobal::_is_cross_pcie_switch;
 uint32_t BytePSGlobal::_partition_bytes = 4096000;
 uint32_t BytePSGlobal::_min_compress_bytes = (1 << 16);
+size_t BytePSGlobal::_batch_bytes = 0;
+int BytePSGlobal::_batch_wait_us = 0;
+std::atomic<uint64_t> BytePSGlobal::_push_msgs{0};
+std::atomic<uint64_t> BytePSGlobal::_push_keys{0};
+std::atomic<uint64_t> BytePSGlobal::_pull_msgs{0};
+std::atomic<uint64_t> BytePSGlobal::_pull_keys{0};
+bool BytePSGlobal::_is_auto_partition = false;
+double BytePSGlobal::_partition_overhead_us = 100;
+double BytePSGlobal::_partition_bandwidth = 3000;
+int BytePSGlobal::_num_server = 1;
 
 int BytePSGlobal::_is_trace = 0;
 int BytePSGlobal::_start_step = 10;
@@ -61,6 +75,10 @@ std::string BytePSGlobal::_hash_knob;
 volatile BytePSScheduledQueue* BytePSGlobal::_queues[QueueNum] = {NULL};
 std::mutex BytePSGlobal::_queues_mutex[QueueNum];
 std::vector<std::thread*> BytePSGlobal::_threads;
+bool BytePSGlobal::_is_loop_notify = false;
+int BytePSGlobal::_loop_spin_us = 50;
+int BytePSGlobal::_loop_wait_us = 1000;
+std::shared_ptr<LoopNotifier> BytePSGlobal::_loop_notifiers[QueueNum];
 
 std::mutex BytePSGlobal::_context_mutex;
 ps::KVWorker<char>* BytePSGlobal::_ps = NULL;
@@ -81,6 +99,7 @@ cudaStream_t* BytePSGlobal::_copy_device2host_stream = NULL;
 cudaStream_t* BytePSGlobal::_copy_host2device_stream = NULL;
 std::shared_ptr<NcclManager> BytePSGlobal::_nccl_manager;
 std::shared_ptr<CpuReducer> BytePSGlobal::_cpu_reducer;
+std::shared_ptr<FusionManager> BytePSGlobal::_fusion;
 std::shared_ptr<ThreadPool> BytePSGlobal::_thread_pool;
 
 std::hash<std::string> BytePSGlobal::_built_in_hash_fn;
@@ -102,6 +121,25 @@ void BytePSGlobal::CreateScheduledQueue(QueueType queueType) {
   return;
 }
 
+std::shared_ptr<LoopNotifier> BytePSGlobal::GetLoopNotifier(
+    QueueType queueType) {
+  // REDUCE and BROADCAST are served by the same NCCL loop on the root
+  if (queueType == BROADCAST) queueType = REDUCE;
+  auto& notifier = _loop_notifiers[queueType];
+  if (!notifier) {
+    notifier = CreateLoopNotifier(queueType == REDUCE
+                                      ? std::string("REDUCE/BROADCAST")
+                                      : LogStrings[queueType]);
+  }
+  return notifier;
+}
+
+std::shared_ptr<LoopNotifier> BytePSGlobal::CreateLoopNotifier(
+    const std::string& name) {
+  return std::make_shared<LoopNotifier>(name, _is_loop_notify, _loop_spin_us,
+                                        _loop_wait_us);
+}
+
 void BytePSGlobal::Init() {
   std::lock_guard<std::mutex> lock(_init_mutex);
 
@@ -123,6 +161,19 @@ void BytePSGlobal::Init() {
                    ? std::string(getenv("BYTEPS_TRACE_DIR"))
                    : "./trace";
 
+  // How the background loops wait for work: sleep-polling or notification
+  _is_loop_notify = getenv("BYTEPS_LOOP_NOTIFY")
+                        ? atoi(getenv("BYTEPS_LOOP_NOTIFY"))
+                        : _is_loop_notify;
+  _loop_spin_us = getenv("BYTEPS_LOOP_SPIN_US")
+                      ? atoi(getenv("BYTEPS_LOOP_SPIN_US"))
+                      : _loop_spin_us;
+  _loop_wait_us = getenv("BYTEPS_LOOP_WAIT_US")
+                      ? atoi(getenv("BYTEPS_LOOP_WAIT_US"))
+                      : _loop_wait_us;
+  BPS_LOG(DEBUG) << "Background loops use "
+                 << (_is_loop_notify ? "notification" : "sleep polling");
+
   _basic_comm = std::make_shared<BytePSCommSocket>();
 
   _basic_comm->init(&_rank, &_size, &_local_rank, &_local_size, &_worker_id,
@@ -142,6 +193,21 @@ void BytePSGlobal::Init() {
   _partition_bytes = RoundUp(_partition_bytes, _local_size * _pagesize);
   BPS_LOG(DEBUG) << "Partition size round up to " << _partition_bytes
                  << " (bytes)";
+  if (getenv("BYTEPS_PARTITION_POLICY")) {
+    auto policy = std::string(getenv("BYTEPS_PARTITION_POLICY"));
+    BPS_CHECK(policy == "auto" || policy == "fixed")
+        << "BYTEPS_PARTITION_POLICY must be auto or fixed, got " << policy;
+    _is_auto_partition = (policy == "auto");
+  }
+  if (getenv("BYTEPS_PARTITION_OVERHEAD_US")) {
+    _partition_overhead_us = atof(getenv("BYTEPS_PARTITION_OVERHEAD_US"));
+  }
+  if (getenv("BYTEPS_PARTITION_BANDWIDTH_MBPS")) {
+    // MB/s is the same as bytes/us
+    _partition_bandwidth = atof(getenv("BYTEPS_PARTITION_BANDWIDTH_MBPS"));
+  }
+  BPS_CHECK_GT(_partition_overhead_us, 0);
+  BPS_CHECK_GT(_partition_bandwidth, 0);
 
   BPS_CHECK(getenv("DMLC_NUM_WORKER")) << "error: env DMLC_NUM_WORKER not set";
   _num_worker = atoi(getenv("DMLC_NUM_WORKER"));
@@ -174,9 +240,19 @@ void BytePSGlobal::Init() {
                      << _built_in_hash_coefficient;
     }
 
+    // multi-key push/pull requests
+    if (getenv("BYTEPS_BATCH_BYTES")) {
+      _batch_bytes = atoi(getenv("BYTEPS_BATCH_BYTES"));
+    }
+    if (getenv("BYTEPS_BATCH_WAIT_US")) {
+      _batch_wait_us = atoi(getenv("BYTEPS_BATCH_WAIT_US"));
+    }
+    BPS_LOG(DEBUG) << "Batch push/pull requests up to " << _batch_bytes
+                   << " bytes, wait=" << _batch_wait_us << "us";
+
     // set server load counter
-    int num_server = atoi(getenv("DMLC_NUM_SERVER"));
-    for (int i = 0; i < num_server; ++i) _server_accumulated_len.push_back(0);
+    _num_server = atoi(getenv("DMLC_NUM_SERVER"));
+    for (int i = 0; i < _num_server; ++i) _server_accumulated_len.push_back(0);
   }
 
   BPS_LOG(DEBUG) << "Number of worker=" << _num_worker << ", launching "
@@ -204,18 +280,49 @@ void BytePSGlobal::Init() {
     _cpu_reducer = std::make_shared<CpuReducer>(_basic_comm);
   }
 
+  // Fuse small tensors into shared keys
+  size_t fusion_threshold = getenv("BYTEPS_FUSION_THRESHOLD")
+                                ? atoi(getenv("BYTEPS_FUSION_THRESHOLD"))
+                                : 0;
+  bool is_async = getenv("BYTEPS_ENABLE_ASYNC")
+                      ? atoi(getenv("BYTEPS_ENABLE_ASYNC"))
+                      : false;
+  if (fusion_threshold && _is_distributed_job && !_is_cross_pcie_switch &&
+      !is_async) {
+    size_t fusion_bytes = getenv("BYTEPS_FUSION_BUFFER_BYTES")
+                              ? atoi(getenv("BYTEPS_FUSION_BUFFER_BYTES"))
+                              : _partition_bytes;
+    uint64_t fusion_deadline = getenv("BYTEPS_FUSION_DEADLINE_US")
+                                   ? atoi(getenv("BYTEPS_FUSION_DEADLINE_US"))
+                                   : 1000;
+    _fusion = std::make_shared<FusionManager>(fusion_threshold, fusion_bytes,
+                                              fusion_deadline);
+    BPS_LOG(WARNING) << "Tensor fusion is experimental, the small tensors "
+                     << "must be initialized in the same order on every "
+                     << "worker";
+    BPS_LOG(DEBUG) << "Fuse tensors up to " << fusion_threshold
+                   << " bytes into buffers of " << fusion_bytes
+                   << " bytes, deadline=" << fusion_deadline << "us";
+  }
+
+  // keys of the first declared keys are counted without locking
+  int dense_keys = getenv("BYTEPS_READY_TABLE_DENSE_KEYS")
+                       ? atoi(getenv("BYTEPS_READY_TABLE_DENSE_KEYS"))
+                       : ReadyTable::kMaxDenseKeys;
+
   // ReadyTable for Push & Pull
   if (_is_root_device) {
-    _push_table = new ReadyTable(_local_size - 1, "PUSH");
+    _push_table = new ReadyTable(_local_size - 1, "PUSH", dense_keys);
   } else {
-    _copy_table = new ReadyTable(1, "COPY");
+    _copy_table = new ReadyTable(1, "COPY", dense_keys);
   }
 
   if (_is_root_device) {
     size_t pool_size = 4;
     if (getenv("BYTEPS_THREADPOOL_SIZE")) {
       pool_size = atoi(getenv("BYTEPS_THREADPOOL_SIZE"));
-      _thread_pool.reset(new ThreadPool(pool_size));
+      _thread_pool.reset(new ThreadPool(
+          pool_size, [](size_t i) { PinThread("compress", i); }));
     }
   }
 
@@ -223,15 +330,16 @@ void BytePSGlobal::Init() {
   if (_is_cross_pcie_switch) {
     if (_cpu_reducer->isRoot()) {
       _pcie_reduce_table =
-          new ReadyTable(GetPcieSwitchNum() - 1, "PCIE_REDUCE");
+          new ReadyTable(GetPcieSwitchNum() - 1, "PCIE_REDUCE", dense_keys);
     }
   }
 
   // ReadyTable for per-PCIe-switch NCCL calls
   if (_nccl_manager->IsSignalRoot()) {
-    _reduce_table = new ReadyTable(GetPcieSwitchSize() - 1, "NCCL_REDUCE");
+    _reduce_table =
+        new ReadyTable(GetPcieSwitchSize() - 1, "NCCL_REDUCE", dense_keys);
     _broadcast_table =
-        new ReadyTable(GetPcieSwitchSize() - 1, "NCCL_BROADCAST");
+        new ReadyTable(GetPcieSwitchSize() - 1, "NCCL_BROADCAST", dense_keys);
   }
 
   // Configure the reduce strategy
@@ -322,6 +430,17 @@ void BytePSGlobal::Shutdown() {
   _should_shutdown = true;
   int total_thread_num = _threads.size();
 
+  // wake up the loops that are waiting for a task
+  for (auto& notifier : _loop_notifiers) {
+    if (notifier) notifier->Notify();
+  }
+  if (_nccl_manager) {
+    _nccl_manager->GetNotifier()->Notify();
+  }
+  if (_fusion) {
+    _fusion->Notify();
+  }
+
   for (size_t i = 0; i < _threads.size(); i++) {
     if (_threads[i]->joinable()) {
       _threads[i]->join();
@@ -342,6 +461,24 @@ void BytePSGlobal::Shutdown() {
     }
   }
 
+  if (_thread_pool && _thread_pool->getNumTasks()) {
+    std::string busy;
+    for (auto ns : _thread_pool->getBusyNs()) {
+      busy += " " + std::to_string(ns / 1000000) + "ms";
+    }
+    BPS_LOG(INFO) << "Compression thread pool: " << _thread_pool->getNumTasks()
+                  << " task(s), " << _thread_pool->getNumStolen()
+                  << " taken from another worker, busy time per worker:"
+                  << busy;
+  }
+
+  if (_push_msgs || _pull_msgs) {
+    BPS_LOG(INFO) << "Sent " << _push_msgs << " push request(s) for "
+                  << _push_keys << " key(s), " << _pull_msgs
+                  << " pull request(s) for " << _pull_keys << " key(s)";
+    _push_msgs = _push_keys = _pull_msgs = _pull_keys = 0;
+  }
+
   if (_ps) {
     // shutdown _ps and wait for the completion acks of other workers/servers
     ps::Finalize(0, true);
@@ -380,9 +517,14 @@ void BytePSGlobal::Shutdown() {
     _copy_table = NULL;
   }
 
+  for (auto& notifier : _loop_notifiers) {
+    notifier.reset();
+  }
+
   _basic_comm.reset();
   _shm_obj.reset();
   _cpu_reducer.reset();
+  _fusion.reset();
   _nccl_manager.reset();
 
   // reset state, ignore profiling state
@@ -435,6 +577,58 @@ void BytePSGlobal::ReDeclareTensor() {
   }
 }
 
+void BytePSGlobal::SetPartitionBytes(const std::string& name,
+                                     uint32_t bytes) {
+  std::lock_guard<std::mutex> lock(_context_mutex);
+  BPS_CHECK(_name_to_cxt.find(name) != _name_to_cxt.end())
+      << name << " is not initialized";
+  auto& context = _name_to_cxt[name];
+  if (context.initialized) {
+    if (bytes != context.partition_bytes) {
+      BPS_LOG(WARNING) << name << " is already partitioned with "
+                       << context.partition_bound
+                       << " bytes, ignore new partition size " << bytes;
+    }
+    return;
+  }
+  context.partition_bytes = bytes;
+}
+
+uint32_t BytePSGlobal::GetPartitionBound(size_t size, uint32_t requested) {
+  // every partition is split among local GPUs and mapped to shared memory
+  size_t unit = _local_size * _pagesize;
+  // partition index takes 16 bits of the key
+  size_t max_parts = 1 << 16;
+  size_t bound = _partition_bytes;
+  if (requested) {
+    bound = RoundUp(requested, unit);
+  } else if (_is_auto_partition) {
+    // Pick the number of partitions n that minimizes the estimated time
+    //   (ceil(n / k) + 1) * (overhead + size / n / bandwidth)
+    // where k = min(n, #servers) partitions are in flight on different
+    // servers, and the extra round fills the pipeline. All inputs are the
+    // same on every worker, so the keys are the same as well.
+    size_t best_n = 1;
+    double best_cost = -1;
+    size_t limit = std::min(max_parts - 1, DivUp(size, unit));
+    for (size_t n = 1; n <= limit; ++n) {
+      size_t k = std::min(n, (size_t)_num_server);
+      double cost = (DivUp(n, k) + 1) * (_partition_overhead_us +
+                                         1.0 * size / n / _partition_bandwidth);
+      if (best_cost < 0 || cost < best_cost) {
+        best_cost = cost;
+        best_n = n;
+      }
+    }
+    bound = RoundUp(DivUp(size, best_n), unit);
+  }
+  bound = std::min(bound,
+                   (size_t)std::numeric_limits<int>::max() / unit * unit);
+  BPS_CHECK_LT(DivUp(size, bound), max_parts)
+      << "too many partitions, size=" << size << ", bound=" << bound;
+  return bound;
+}
+
 void BytePSGlobal::RegisterCompressor(
     const std::string& name,
     std::unordered_map<std::string, std::string>& kwargs) {
@@ -444,6 +638,15 @@ void BytePSGlobal::RegisterCompressor(
   _name_to_cxt[name].kwargs = std::move(kwargs);
 }
 
+void BytePSGlobal::RegisterServerOptimizer(
+    const std::string& name,
+    std::unordered_map<std::string, std::string>& kwargs) {
+  std::lock_guard<std::mutex> lock(_context_mutex);
+  BPS_CHECK(_name_to_cxt.find(name) != _name_to_cxt.end())
+      << name << " is not initialized";
+  _name_to_cxt[name].optimizer_kwargs = std::move(kwargs);
+}
+
 // Append for communication traces
 void BytePSGlobal::SetProfileFlag(BytePSContext* ctxt) {
   if (_is_trace == 1) {
@@ -671,6 +874,7 @@ PSKV& BytePSGlobal::EncodeDefaultKey(uint64_t key, size_t len) {
     pskv.keys.push_back(ps_key);
     pskv.lens.push_back(len);
     pskv.size = len;
+    pskv.server = server;
   }
   BPS_LOG(TRACE) << "key " << key << " is encoded to " << pskv.keys[0];
   return pskv;
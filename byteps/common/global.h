@@ -18,6 +18,7 @@
 
 #include <unistd.h>
 
+#include <atomic>
 #include <map>
 #include <memory>
 #include <mutex>
@@ -30,7 +31,9 @@
 #include "common.h"
 #include "communicator.h"
 #include "cpu_reducer.h"
+#include "fusion.h"
 #include "logging.h"
+#include "loop_notifier.h"
 #include "nccl_manager.h"
 #include "ps/ps.h"
 #include "ready_table.h"
@@ -45,6 +48,7 @@ struct PSKV {
   ps::SArray<ps::Key> keys;  // n keys
   ps::SArray<int> lens;      // the length of the i-th value
   int size;
+  int server;
 };
 
 typedef void (*LoopFunction)();
@@ -81,6 +85,9 @@ class BytePSGlobal {
 
   static BytePSScheduledQueue* GetScheduledQueue(QueueType queueType);
   static void CreateScheduledQueue(QueueType queueType);
+  static std::shared_ptr<LoopNotifier> GetLoopNotifier(QueueType queueType);
+  static std::shared_ptr<LoopNotifier> CreateLoopNotifier(
+      const std::string& name);
   static ps::KVWorker<char>* GetPS() { return _ps; }
   static ps::KVWorker<char>* GetOrInitPS();
 
@@ -89,8 +96,12 @@ class BytePSGlobal {
   static bool IsResuming() { return _is_resuming; }
   static void SetResumingFlag(bool flag) {_is_resuming = flag; }
 
+  static void SetPartitionBytes(const std::string& name, uint32_t bytes);
   static void RegisterCompressor(const std::string& name, 
                                  std::unordered_map<std::string, std::string>& kwargs);
+  static void RegisterServerOptimizer(
+      const std::string& name,
+      std::unordered_map<std::string, std::string>& kwargs);
   static ps::Key GetKeyFromName(const std::string& name);
   static BPSContext& GetContextFromName(const std::string& name);
   static uint32_t GetTensorCount();
@@ -101,7 +112,17 @@ class BytePSGlobal {
   static PSKV& EncodeDefaultKey(uint64_t key, size_t len);
 
   static uint32_t GetPartitionBound() { return _partition_bytes; }
+  // partition size of a tensor of `size` bytes, `requested` is the size
+  // given at declaration (0 if none)
+  static uint32_t GetPartitionBound(size_t size, uint32_t requested);
   static uint32_t GetMinCompressBound() { return _min_compress_bytes; }
+  // tasks smaller than this may share one push/pull request, 0 disables
+  static size_t GetBatchBytes() { return _batch_bytes; }
+  static int GetBatchWaitUs() { return _batch_wait_us; }
+  static void RecordPushPullMessage(bool push, size_t num_keys) {
+    (push ? _push_msgs : _pull_msgs).fetch_add(1);
+    (push ? _push_keys : _pull_keys).fetch_add(num_keys);
+  }
 
   static cudaStream_t* GetCopyDevice2HostStream();
   static cudaStream_t* GetCopyHost2DeviceStream();
@@ -123,6 +144,8 @@ class BytePSGlobal {
 
   static std::shared_ptr<NcclManager> GetNccl() { return _nccl_manager; }
   static std::shared_ptr<CpuReducer> GetCpuReducer() { return _cpu_reducer; }
+  // nullptr if tensor fusion is disabled
+  static std::shared_ptr<FusionManager> GetFusion() { return _fusion; }
 
   static bool IsTensorSampled(uint64_t key) { return (key == _sample_key); }
 
@@ -162,6 +185,12 @@ class BytePSGlobal {
   static std::mutex _queues_mutex[QueueNum];
   static std::vector<std::thread*> _threads;
 
+  // idle strategy of the background loops
+  static bool _is_loop_notify;
+  static int _loop_spin_us;
+  static int _loop_wait_us;
+  static std::shared_ptr<LoopNotifier> _loop_notifiers[QueueNum];
+
   static std::mutex _context_mutex;
 
   static ps::KVWorker<char>* _ps;
@@ -182,6 +211,16 @@ class BytePSGlobal {
 
   static uint32_t _partition_bytes;
   static uint32_t _min_compress_bytes;
+  static size_t _batch_bytes;
+  static int _batch_wait_us;
+  static std::atomic<uint64_t> _push_msgs;
+  static std::atomic<uint64_t> _push_keys;
+  static std::atomic<uint64_t> _pull_msgs;
+  static std::atomic<uint64_t> _pull_keys;
+  static bool _is_auto_partition;
+  static double _partition_overhead_us;
+  static double _partition_bandwidth;  // bytes per us
+  static int _num_server;
 
   // (key, ready_signal_count) pair, only valid for root device
   static ReadyTable* _reduce_table;
@@ -200,6 +239,7 @@ class BytePSGlobal {
 
   static std::shared_ptr<NcclManager> _nccl_manager;
   static std::shared_ptr<CpuReducer> _cpu_reducer;
+  static std::shared_ptr<FusionManager> _fusion;
 
   // for debug sampling
   static uint64_t _sample_key;
@@ -0,0 +1,172 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_LOOP_NOTIFIER_H
+#define BYTEPS_LOOP_NOTIFIER_H
+
+#include <time.h>
+
+#include <atomic>
+#include <chrono>
+#include <condition_variable>
+#include <mutex>
+#include <string>
+#include <thread>
+
+#include "logging.h"
+
+namespace byteps {
+namespace common {
+
+/**
+ * \brief Wakes up a background loop when a queue it serves may have a task.
+ *
+ * Producers (addTask, ReadyTable updates, credit returns) call Notify(). The
+ * loop reads Version() before polling its queues and calls Idle(version) if
+ * the poll came back empty. In the default sleep mode Idle() keeps the old
+ * 1us sleep. In notify mode it spins for a bounded time and then blocks
+ * until Notify() is called; the wait is still capped by a timeout because
+ * some conditions (e.g., CUDA ready events) never notify.
+ */
+class LoopNotifier {
+ public:
+  LoopNotifier(const std::string& name, bool notify_mode, int spin_us,
+               int wait_us)
+      : _name(name),
+        _notify_mode(notify_mode),
+        _spin(std::chrono::microseconds(spin_us)),
+        _wait(std::chrono::microseconds(wait_us)) {}
+
+  ~LoopNotifier() {
+    if (_idle_calls) {
+      BPS_LOG(INFO) << "Loop " << _name
+                    << (_notify_mode ? " (notify mode)" : " (sleep mode)")
+                    << ": idle cpu=" << GetIdleCpuPercent() << "%"
+                    << ", avg pickup latency=" << GetPickupLatencyUs() << "us"
+                    << ", pickups=" << _pickups;
+    }
+  }
+
+  uint64_t Version() const { return _version.load(); }
+
+  void Notify() {
+    _last_notify_ns.store(NowNs(), std::memory_order_relaxed);
+    _version.fetch_add(1);
+    if (_waiters.load()) {
+      std::lock_guard<std::mutex> lock(_mutex);
+      _cv.notify_all();
+    }
+  }
+
+  // Called by the loop when polling returned nothing. `version` must have
+  // been read before polling, so that no notification can be missed.
+  void Idle(uint64_t version) {
+    auto wall_start = NowNs();
+    auto cpu_start = ThreadCpuNs();
+    if (!_notify_mode) {
+      std::this_thread::sleep_for(std::chrono::nanoseconds(1000));
+    } else {
+      auto spin_end = std::chrono::steady_clock::now() + _spin;
+      while (_version.load() == version &&
+             std::chrono::steady_clock::now() < spin_end) {
+        std::this_thread::yield();
+      }
+      if (_version.load() == version) {
+        std::unique_lock<std::mutex> lock(_mutex);
+        _waiters.fetch_add(1);
+        _cv.wait_for(lock, _wait,
+                     [this, version] { return _version.load() != version; });
+        _waiters.fetch_sub(1);
+      }
+    }
+    _idle_wall_ns += NowNs() - wall_start;
+    _idle_cpu_ns += ThreadCpuNs() - cpu_start;
+    ++_idle_calls;
+    _was_idle = true;
+  }
+
+  // Blocks until Notify() is called after `version` was read, or until
+  // `deadline`, without spinning, e.g., while waiting for more tasks to
+  // batch.
+  void WaitUntil(uint64_t version,
+                 std::chrono::steady_clock::time_point deadline) {
+    if (_version.load() != version) return;
+    std::unique_lock<std::mutex> lock(_mutex);
+    _waiters.fetch_add(1);
+    _cv.wait_until(lock, deadline,
+                   [this, version] { return _version.load() != version; });
+    _waiters.fetch_sub(1);
+  }
+
+  // Called by the loop when polling returned a task.
+  void OnPickup() {
+    if (!_was_idle) return;
+    _was_idle = false;
+    auto now = NowNs();
+    auto notified = _last_notify_ns.load(std::memory_order_relaxed);
+    if (notified && now >= notified) {
+      _pickup_ns += now - notified;
+      ++_pickups;
+    }
+  }
+
+  // Share of the idle wall time that the loop thread spent on a CPU.
+  double GetIdleCpuPercent() const {
+    return _idle_wall_ns ? 100.0 * _idle_cpu_ns / _idle_wall_ns : 0.0;
+  }
+
+  // Average time from the last notification to the loop picking a task up
+  // after having been idle.
+  double GetPickupLatencyUs() const {
+    return _pickups ? _pickup_ns / 1e3 / _pickups : 0.0;
+  }
+
+ private:
+  static uint64_t NowNs() {
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+               std::chrono::steady_clock::now().time_since_epoch())
+        .count();
+  }
+
+  static uint64_t ThreadCpuNs() {
+    struct timespec ts;
+    clock_gettime(CLOCK_THREAD_CPUTIME_ID, &ts);
+    return ts.tv_sec * 1000000000ULL + ts.tv_nsec;
+  }
+
+  std::string _name;
+  bool _notify_mode;
+  std::chrono::microseconds _spin;
+  std::chrono::microseconds _wait;
+
+  std::atomic<uint64_t> _version{0};
+  std::atomic<int> _waiters{0};
+  std::atomic<uint64_t> _last_notify_ns{0};
+  std::mutex _mutex;
+  std::condition_variable _cv;
+
+  // only touched by the loop thread
+  bool _was_idle = false;
+  uint64_t _idle_calls = 0;
+  uint64_t _idle_wall_ns = 0;
+  uint64_t _idle_cpu_ns = 0;
+  uint64_t _pickups = 0;
+  uint64_t _pickup_ns = 0;
+};
+
+}  // namespace common
+}  // namespace byteps
+
+#endif  // BYTEPS_LOOP_NOTIFIER_H
@@ -46,6 +46,7 @@ void NcclGroupEntry::DestroyEvents() {
 
 NcclManager::NcclManager(std::shared_ptr<BytePSComm> comm) {
   _global_comm = comm;
+  _notifier = BytePSGlobal::CreateLoopNotifier("SYNC_NCCL");
   InitGlobalEnv();
   ConstructRings();
   return;
@@ -165,8 +166,11 @@ void NcclManager::InitGlobalEnv() {  // init all global env/param here
 }
 
 void NcclManager::EnqueueGroup(std::shared_ptr<NcclGroupEntry> e) {
-  std::lock_guard<std::mutex> lock(_nccl_mutex);
-  _nccl_pipeline.push(e);
+  {
+    std::lock_guard<std::mutex> lock(_nccl_mutex);
+    _nccl_pipeline.push(e);
+  }
+  _notifier->Notify();
   return;
 }
 
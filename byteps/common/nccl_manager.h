@@ -21,6 +21,7 @@
 #include <vector>
 #include "common.h"
 #include "communicator.h"
+#include "loop_notifier.h"
 #include "scheduled_queue.h"
 
 namespace byteps {
@@ -66,6 +67,7 @@ class NcclManager {
   int GetGroupSize() { return _nccl_group_size; }
   void EnqueueGroup(std::shared_ptr<NcclGroupEntry> e);
   std::shared_ptr<NcclGroupEntry> DequeueGroup();
+  std::shared_ptr<LoopNotifier> GetNotifier() { return _notifier; }
 
   virtual cudaStream_t GetStream(uint64_t key, QueueType op);
   virtual ncclComm_t GetComm(uint64_t key, QueueType op);
@@ -95,6 +97,7 @@ class NcclManager {
   // for pipelining nccl
   std::mutex _nccl_mutex;
   std::queue<std::shared_ptr<NcclGroupEntry>> _nccl_pipeline;
+  std::shared_ptr<LoopNotifier> _notifier;
 
   std::shared_ptr<BytePSComm> _signal_comm;
   std::shared_ptr<BytePSComm> _global_comm;
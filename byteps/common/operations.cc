@@ -17,6 +17,7 @@
 #include <unistd.h>
 
 #include <cstring>
+#include <functional>
 #include <memory>
 #include <thread>
 
@@ -49,6 +50,9 @@ void byteps_lazy_init() {
     if (BytePSGlobal::IsRootDevice()) {
       func.push_back(PullLoop);
       func.push_back(DecompressLoop);
+      if (BytePSGlobal::GetFusion()) {
+        func.push_back(FusionLoop);
+      }
     }
   }
 
@@ -135,6 +139,166 @@ extern "C" PyObject* byteps_get_pushpull_speed() {
   return ret;
 }
 
+extern "C" PyObject* byteps_get_scheduling_credit() {
+  // ctypes releases the GIL before calling into the library
+  PyGILState_STATE gstate = PyGILState_Ensure();
+  PyObject* ret = PyDict_New();
+  for (int i = 0; i < QueueNum; i++) {
+    auto q = BytePSGlobal::GetScheduledQueue(static_cast<QueueType>(i));
+    if (!q) continue;
+    auto window = q->getCreditWindow();
+    if (window < 0) continue;
+    PyObject* value = PyLong_FromLongLong(window);
+    PyDict_SetItemString(ret, LogStrings[i].c_str(), value);
+    Py_DECREF(value);
+  }
+  PyGILState_Release(gstate);
+  return ret;
+}
+
+extern "C" PyObject* byteps_get_threadpool_busy_time() {
+  PyGILState_STATE gstate = PyGILState_Ensure();
+  PyObject* ret = PyList_New(0);
+  auto pool = BytePSGlobal::GetThreadPool();
+  if (pool) {
+    for (auto ns : pool->getBusyNs()) {
+      PyObject* value = PyFloat_FromDouble(ns / 1e9);
+      PyList_Append(ret, value);
+      Py_DECREF(value);
+    }
+  }
+  PyGILState_Release(gstate);
+  return ret;
+}
+
+namespace {
+
+const char* DataTypeName(DataType dtype) {
+  switch (dtype) {
+    case BYTEPS_FLOAT32:
+      return "float32";
+    case BYTEPS_FLOAT64:
+      return "float64";
+    case BYTEPS_FLOAT16:
+      return "float16";
+    case BYTEPS_BFLOAT16:
+      return "bfloat16";
+    default:
+      return "other";
+  }
+}
+
+PyObject* UInt64List(const uint64_t* values, int n) {
+  PyObject* list = PyList_New(n);
+  for (int i = 0; i < n; i++) {
+    PyList_SetItem(list, i, PyLong_FromUnsignedLongLong(values[i]));
+  }
+  return list;
+}
+
+}  // namespace
+
+extern "C" PyObject* byteps_get_queue_stats(int reset) {
+  std::vector<std::string> names;
+  std::vector<QueueStats::Snapshot> stats;
+  for (int i = 0; i < QueueNum; i++) {
+    auto q = BytePSGlobal::GetScheduledQueue(static_cast<QueueType>(i));
+    if (!q) continue;
+    names.push_back(LogStrings[i]);
+    stats.push_back(q->getStats(reset));
+  }
+  int n = stats.size();
+
+  PyGILState_STATE gstate = PyGILState_Ensure();
+  PyObject* ret = PyDict_New();
+  auto set = [ret](const char* name, PyObject* value) {
+    PyDict_SetItemString(ret, name, value);
+    Py_DECREF(value);
+  };
+  auto column = [&](const char* name,
+                    std::function<uint64_t(const QueueStats::Snapshot&)> f) {
+    std::vector<uint64_t> values;
+    for (auto& s : stats) values.push_back(f(s));
+    set(name, UInt64List(values.data(), n));
+  };
+  PyObject* queue = PyList_New(n);
+  for (int i = 0; i < n; i++) {
+    PyList_SetItem(queue, i, PyUnicode_FromString(names[i].c_str()));
+  }
+  set("queue", queue);
+  column("tasks", [](const QueueStats::Snapshot& s) { return s.tasks; });
+  column("depth", [](const QueueStats::Snapshot& s) { return s.depth; });
+  column("max_depth",
+         [](const QueueStats::Snapshot& s) { return s.max_depth; });
+  column("wait_us_total", [](const QueueStats::Snapshot& s) {
+    return s.wait_ns_total / 1000;
+  });
+  column("service_us_total", [](const QueueStats::Snapshot& s) {
+    return s.service_ns_total / 1000;
+  });
+  column("blocked_by_credit",
+         [](const QueueStats::Snapshot& s) { return s.blocked_by_credit; });
+  column("blocked_by_ready_table", [](const QueueStats::Snapshot& s) {
+    return s.blocked_by_ready_table;
+  });
+  PyObject* wait_hist = PyList_New(n);
+  PyObject* service_hist = PyList_New(n);
+  for (int i = 0; i < n; i++) {
+    PyList_SetItem(wait_hist, i,
+                   UInt64List(stats[i].wait_hist, QueueStats::kNumBuckets));
+    PyList_SetItem(service_hist, i, UInt64List(stats[i].service_hist,
+                                               QueueStats::kNumBuckets));
+  }
+  set("wait_hist", wait_hist);
+  set("service_hist", service_hist);
+  uint64_t bounds[QueueStats::kNumBuckets];
+  for (int i = 0; i < QueueStats::kNumBuckets; i++) bounds[i] = 1ULL << i;
+  set("hist_bounds_us", UInt64List(bounds, QueueStats::kNumBuckets));
+  PyGILState_Release(gstate);
+  return ret;
+}
+
+extern "C" PyObject* byteps_get_reducer_calibration() {
+  PyGILState_STATE gstate = PyGILState_Ensure();
+  PyObject* ret = PyDict_New();
+  auto& calibration = CpuReducer::GetCalibration();
+  if (!calibration.rows.empty()) {
+    PyObject* threads = PyList_New(calibration.threads.size());
+    for (size_t i = 0; i < calibration.threads.size(); i++) {
+      PyList_SetItem(threads, i, PyLong_FromLong(calibration.threads[i]));
+    }
+    PyDict_SetItemString(ret, "threads", threads);
+    Py_DECREF(threads);
+    PyObject* bytes = PyList_New(calibration.bytes.size());
+    for (size_t i = 0; i < calibration.bytes.size(); i++) {
+      PyList_SetItem(bytes, i, PyLong_FromSize_t(calibration.bytes[i]));
+    }
+    PyDict_SetItemString(ret, "bytes", bytes);
+    Py_DECREF(bytes);
+    for (auto& row : calibration.rows) {
+      PyObject* entry = PyDict_New();
+      PyObject* us = PyList_New(row.us.size());
+      PyObject* best = PyList_New(row.best.size());
+      for (size_t i = 0; i < row.us.size(); i++) {
+        PyObject* times = PyList_New(row.us[i].size());
+        for (size_t j = 0; j < row.us[i].size(); j++) {
+          PyList_SetItem(times, j, PyFloat_FromDouble(row.us[i][j]));
+        }
+        PyList_SetItem(us, i, times);
+        PyList_SetItem(best, i, PyLong_FromLong(row.best[i]));
+      }
+      PyDict_SetItemString(entry, "us", us);
+      PyDict_SetItemString(entry, "best", best);
+      Py_DECREF(us);
+      Py_DECREF(best);
+      PyDict_SetItemString(ret, DataTypeName(row.dtype), entry);
+      Py_DECREF(entry);
+    }
+  }
+  PyGILState_Release(gstate);
+  return ret;
+}
+
 Status CheckInitialized() { return BytePSGlobal::CheckInit(); }
 
 void PartitionTensor(
@@ -143,7 +307,7 @@ void PartitionTensor(
   BPS_CHECK(entry->counter_ptr)
       << entry->tensor_name << " counter pointer is null";
   size_t size = entry->tensor ? entry->tensor->size() : entry->output->size();
-  size_t bound = BytePSGlobal::GetPartitionBound();
+  size_t bound = entry->context->partition_bound;
   size_t accumulated = 0;
   int i = 0;
 
@@ -168,6 +332,7 @@ void PartitionTensor(
     e->len = ((size - accumulated) > bound) ? bound : (size - accumulated);
     e->counter_ptr = entry->counter_ptr;
     e->total_partnum = entry->total_partnum;
+    e->fused = entry->fused;
     if (!entry->context->compressor_list.empty()) {
       e->compressor = entry->context->compressor_list[i];
     }
@@ -204,6 +369,10 @@ Status EnqueueTensor(BPSContext &context, std::shared_ptr<Tensor> input,
   }
 
   std::shared_ptr<TensorTableEntry> e(new TensorTableEntry);
+  if (context.fusion_group) {
+    // may switch context.cpubuff to the fused buffer
+    e->fused = BytePSGlobal::GetFusion()->Prepare(context);
+  }
   e->tensor_name = name;
   e->context = &context;
   e->tensor = input;
@@ -289,7 +458,8 @@ void InitTensor(BPSContext &context, size_t size, int dtype, void *cpubuff) {
 
   BPS_CHECK_GT(size, 0) << "init tensor size not larger than 0";
   // Get metadata
-  auto bound = BytePSGlobal::GetPartitionBound();
+  auto bound = BytePSGlobal::GetPartitionBound(size, context.partition_bytes);
+  context.partition_bound = bound;
   auto &name = context.tensor_name;
   context.buff_len = size;
   size_t accumulated = 0;
@@ -310,7 +480,7 @@ void InitTensor(BPSContext &context, size_t size, int dtype, void *cpubuff) {
         ((size - accumulated) > bound) ? bound : (size - accumulated);
   }
   BPS_LOG(DEBUG) << name << " partitioned to " << context.key_list.size()
-                 << " part(s)"
+                 << " part(s) of " << bound << " bytes"
                  << ", total_len=" << size << ", key_range=["
                  << context.key_list.front() << ", " << context.key_list.back()
                  << "]"
@@ -362,6 +532,9 @@ void InitTensor(BPSContext &context, size_t size, int dtype, void *cpubuff) {
   if (size < BytePSGlobal::GetMinCompressBound()) {
     context.kwargs.clear();
   }
+  if (BytePSGlobal::GetFusion()) {
+    BytePSGlobal::GetFusion()->AddTensor(context, size, dtype);
+  }
   while (accumulated < size) {
     auto key = key_list[i];
     int len = ((size - accumulated) > bound) ? bound : (size - accumulated);
@@ -407,6 +580,20 @@ void InitTensor(BPSContext &context, size_t size, int dtype, void *cpubuff) {
     }
   }
 
+  if (!context.optimizer_kwargs.empty() && BytePSGlobal::IsDistributed() &&
+      BytePSGlobal::IsRootDevice()) {
+    auto ps = BytePSGlobal::GetOrInitPS();
+    auto content = compressor::Serialize(context.optimizer_kwargs);
+    auto len = content.size();
+    auto data = const_cast<char *>(content.c_str());
+    for (auto key : key_list) {
+      auto &kv = BytePSGlobal::EncodeDefaultKey(key, len);
+      ps::SArray<char> vals(data, len, false);
+      int cmd = GetCommandType(RequestType::kServerOptimizer, dtype);
+      ps->Wait(ps->ZPush(kv.keys, vals, kv.lens, cmd));
+    }
+  }
+
   context.initialized = true;
 
   BPS_LOG(TRACE) << "Finish Init " << name << ", size=" << size
@@ -421,11 +608,21 @@ bool IsTensorDeclared(const std::string &name) {
   return BytePSGlobal::IsTensorDeclared(name);
 }
 
+void SetPartitionBytes(const std::string &name, uint32_t bytes) {
+  return BytePSGlobal::SetPartitionBytes(name, bytes);
+}
+
 void RegisterCompressor(const std::string &name,
                         std::unordered_map<std::string, std::string> &kwargs) {
   return BytePSGlobal::RegisterCompressor(name, kwargs);
 }
 
+void RegisterServerOptimizer(
+    const std::string &name,
+    std::unordered_map<std::string, std::string> &kwargs) {
+  return BytePSGlobal::RegisterServerOptimizer(name, kwargs);
+}
+
 std::shared_ptr<std::vector<QueueType>> GetPushQueueList(int device) {
   auto queue_list = std::make_shared<std::vector<QueueType>>();
 
@@ -61,6 +61,14 @@ int byteps_local_size();
 
 extern "C" PyObject* byteps_get_pushpull_speed();
 
+extern "C" PyObject* byteps_get_scheduling_credit();
+
+extern "C" PyObject* byteps_get_threadpool_busy_time();
+
+extern "C" PyObject* byteps_get_queue_stats(int reset);
+
+extern "C" PyObject* byteps_get_reducer_calibration();
+
 // Below are all for Framework plugins
 Status EnqueueTensor(BPSContext &context, std::shared_ptr<Tensor> input,
                      std::shared_ptr<Tensor> output,
@@ -74,9 +82,21 @@ void InitTensor(BPSContext &context, size_t size, int dtype, void *cpubuff);
 // Only call these in Framework plugins for the best performance
 bool IsTensorDeclared(const std::string &name);
 
+// Must be called before the first push_pull of the tensor, 0 means the
+// default partition policy
+void SetPartitionBytes(const std::string &name, uint32_t bytes);
+
 void RegisterCompressor(const std::string &name,
                         std::unordered_map<std::string, std::string> &kwargs);
 
+// The server applies the optimizer of the tensor to its weights, which the
+// workers then push gradients to and pull, for asynchronous training only.
+// Must be called before the first push_pull of the tensor. Only the PyTorch
+// plugin calls it so far.
+void RegisterServerOptimizer(
+    const std::string &name,
+    std::unordered_map<std::string, std::string> &kwargs);
+
 BPSContext &GetContextFromName(const std::string &name);
 
 std::shared_ptr<std::vector<QueueType>> GetPushQueueList(int device);
@@ -15,33 +15,119 @@
 
 #include "ready_table.h"
 
+#include <algorithm>
+
 #include "logging.h"
 
 namespace byteps {
 namespace common {
 
+ReadyTable::ReadyTable(int ready_count, const char* name, int dense_keys) {
+  _ready_count = ready_count;
+  _table_name = std::string(name);
+  BPS_CHECK_LE(dense_keys, kMaxDenseKeys);
+  _dense_keys = std::max(dense_keys, 0);
+  _dense.reset(new std::atomic<std::atomic<int>*>[_dense_keys]);
+  for (int i = 0; i < _dense_keys; ++i) {
+    _dense[i] = nullptr;
+  }
+}
+
+ReadyTable::~ReadyTable() {
+  for (int i = 0; i < _dense_keys; ++i) {
+    delete[] _dense[i].load();
+  }
+}
+
+std::atomic<int>* ReadyTable::GetCounter(uint64_t key, bool create) {
+  uint64_t declared_key = key >> 16;
+  uint64_t partition = key & 0xffff;
+  auto counters = _dense[declared_key].load();
+  if (!counters) {
+    if (!create) return nullptr;
+    auto fresh = new std::atomic<int>[kDensePartitions];
+    for (int i = 0; i < kDensePartitions; ++i) {
+      fresh[i] = 0;
+    }
+    // another thread may have been first
+    if (_dense[declared_key].compare_exchange_strong(counters, fresh)) {
+      counters = fresh;
+    } else {
+      delete[] fresh;
+    }
+  }
+  return &counters[partition];
+}
+
 // below are methods for accessing/modifying the _ready_table
 bool ReadyTable::IsKeyReady(uint64_t key) {
+  if (IsDenseKey(key)) {
+    auto counter = GetCounter(key, false);
+    return counter && counter->load() == _ready_count;
+  }
   std::lock_guard<std::mutex> lock(_table_mutex);
   return _ready_table[key] == (_ready_count);
 }
 
 int ReadyTable::AddReadyCount(uint64_t key) {
-  std::lock_guard<std::mutex> lock(_table_mutex);
-  BPS_CHECK_LT(_ready_table[key], _ready_count)
-      << _table_name << ": " << _ready_table[key] << ", " << (_ready_count);
-  return ++_ready_table[key];
+  int cnt;
+  if (IsDenseKey(key)) {
+    cnt = GetCounter(key, true)->fetch_add(1) + 1;
+    BPS_CHECK_LE(cnt, _ready_count)
+        << _table_name << ": " << cnt - 1 << ", " << (_ready_count);
+  } else {
+    std::lock_guard<std::mutex> lock(_table_mutex);
+    BPS_CHECK_LT(_ready_table[key], _ready_count)
+        << _table_name << ": " << _ready_table[key] << ", " << (_ready_count);
+    cnt = ++_ready_table[key];
+  }
+  if (cnt == _ready_count) NotifyListeners(key);
+  return cnt;
 }
 
 int ReadyTable::SetReadyCount(uint64_t key, int cnt) {
-  std::lock_guard<std::mutex> lock(_table_mutex);
-  _ready_table[key] = cnt;
+  if (IsDenseKey(key)) {
+    GetCounter(key, true)->store(cnt);
+  } else {
+    std::lock_guard<std::mutex> lock(_table_mutex);
+    _ready_table[key] = cnt;
+  }
+  if (cnt == _ready_count) NotifyListeners(key);
+  return cnt;
 }
 
 void ReadyTable::ClearReadyCount(uint64_t key) {
+  if (IsDenseKey(key)) {
+    auto counter = GetCounter(key, false);
+    if (counter) counter->store(0);
+    return;
+  }
   std::lock_guard<std::mutex> lock(_table_mutex);
   _ready_table[key] = 0;
 }
 
+void ReadyTable::AddListener(std::shared_ptr<LoopNotifier> notifier) {
+  std::lock_guard<std::mutex> lock(_table_mutex);
+  for (auto& l : _listeners) {
+    if (l == notifier) return;
+  }
+  _listeners.push_back(notifier);
+}
+
+void ReadyTable::AddKeyListener(std::function<void(uint64_t)> listener) {
+  std::lock_guard<std::mutex> lock(_table_mutex);
+  _key_listeners.push_back(listener);
+}
+
+void ReadyTable::NotifyListeners(uint64_t key) {
+  // listeners are only added while the queues are being created
+  for (auto& l : _key_listeners) {
+    l(key);
+  }
+  for (auto& l : _listeners) {
+    l->Notify();
+  }
+}
+
 }  // namespace common
 }  // namespace byteps
@@ -16,32 +16,66 @@
 #ifndef BYTEPS_READY_TABLE_H
 #define BYTEPS_READY_TABLE_H
 
+#include <atomic>
+#include <functional>
+#include <memory>
 #include <mutex>
 #include <thread>
 #include <unordered_map>
+#include <vector>
+
+#include "loop_notifier.h"
 
 namespace byteps {
 namespace common {
 
+/**
+ * \brief Counts the ready signals of each key.
+ *
+ * Keys are (declared_key << 16 | partition). Keys whose declared key is below
+ * `dense_keys` and whose partition is below kDensePartitions are counted in
+ * atomic counters without locking; the counters of a declared key are
+ * allocated on its first signal. Other keys fall back to a map behind a
+ * mutex.
+ */
 class ReadyTable {
  public:
-  ReadyTable(int ready_count, const char* name) {
-    _ready_count = ready_count;
-    _table_name = std::string(name);
-  }
+  static const int kDensePartitions = 256;
+  static const int kMaxDenseKeys = 1 << 16;
+
+  ReadyTable(int ready_count, const char* name,
+             int dense_keys = kMaxDenseKeys);
+  ~ReadyTable();
   // methods to access or modify the _ready_table
   bool IsKeyReady(uint64_t key);
   int AddReadyCount(uint64_t key);
   int SetReadyCount(uint64_t key, int cnt);
   void ClearReadyCount(uint64_t key);
+  // wake up the loops whose queues are gated by this table
+  void AddListener(std::shared_ptr<LoopNotifier> notifier);
+  // called with every key that becomes ready, before the loops are woken
+  void AddKeyListener(std::function<void(uint64_t)> listener);
 
  private:
+  void NotifyListeners(uint64_t key);
+  bool IsDenseKey(uint64_t key) const {
+    return (key >> 16) < (uint64_t)_dense_keys &&
+           (key & 0xffff) < kDensePartitions;
+  }
+  // the counter of a dense key; without `create`, nullptr if no key of its
+  // declared key has been signaled yet
+  std::atomic<int>* GetCounter(uint64_t key, bool create);
+
+  int _dense_keys;
+  std::unique_ptr<std::atomic<std::atomic<int>*>[]> _dense;
   // (key, ready_signal_count) pair, only valid for root device
   std::unordered_map<uint64_t, int> _ready_table;
   // use this mutex to access/modify the _ready_table
   std::mutex _table_mutex;
   int _ready_count;
   std::string _table_name;
+  std::vector<std::shared_ptr<LoopNotifier>> _listeners;
+  std::vector<std::function<void(uint64_t)>> _key_listeners;
 };
 
 }  // namespace common
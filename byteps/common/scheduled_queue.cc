@@ -16,6 +16,7 @@
 #include "scheduled_queue.h"
 
 #include <algorithm>
+#include <chrono>
 
 #include "global.h"
 #include "logging.h"
@@ -23,6 +24,16 @@
 namespace byteps {
 namespace common {
 
+namespace {
+
+uint64_t NowNs() {
+  return std::chrono::duration_cast<std::chrono::nanoseconds>(
+             std::chrono::steady_clock::now().time_since_epoch())
+      .count();
+}
+
+}  // namespace
+
 BytePSScheduledQueue::BytePSScheduledQueue(QueueType type) {
   if (type == REDUCE && BytePSGlobal::GetNccl()->IsSignalRoot()) {
     _is_scheduled = true;
@@ -33,16 +44,38 @@ BytePSScheduledQueue::BytePSScheduledQueue(QueueType type) {
   size_t credit_in_partition = BytePSGlobal::GetNccl()->GetGroupSize() + 1;
 
   auto byteps_scheduling_credit = getenv("BYTEPS_SCHEDULING_CREDIT");
-  credit_in_partition =
-      byteps_scheduling_credit ? atoi(byteps_scheduling_credit) : 0;
+  bool is_auto_credit = byteps_scheduling_credit &&
+                        std::string(byteps_scheduling_credit) == "auto";
+  if (!is_auto_credit) {
+    credit_in_partition =
+        byteps_scheduling_credit ? atoi(byteps_scheduling_credit) : 0;
+  }
   if (!credit_in_partition) {  // disable scheduling by default
     _is_scheduled = false;
   }
 
   _qt = type;
+  _sq.reset(new TaskIndex(_is_scheduled));
+  int64_t partition_bytes = BytePSGlobal::GetPartitionBound();
   _credits = _is_scheduled
-                 ? BytePSGlobal::GetPartitionBound() * credit_in_partition
+                 ? partition_bytes * credit_in_partition
                  : 34359738368;  // 32GB, basically disabling credit control
+  _credit_window = _credits;
+  if (_is_scheduled && is_auto_credit) {
+    // start from (group size + 1) partitions, never go below one partition
+    // so that any task can be scheduled
+    int64_t max_credit = getenv("BYTEPS_SCHEDULING_CREDIT_MAX")
+                             ? atoi(getenv("BYTEPS_SCHEDULING_CREDIT_MAX"))
+                             : 64;
+    BPS_CHECK_GE(max_credit, 1);
+    _credit_ctrl.reset(new CreditController(
+        _credits, partition_bytes,
+        partition_bytes * std::max(max_credit, (int64_t)credit_in_partition),
+        partition_bytes));
+    BPS_LOG(DEBUG) << "Queue " << LogStrings[_qt]
+                   << " uses automatic credit tuning, initial window="
+                   << _credits << " bytes";
+  }
   _rt = nullptr;
 
   switch (_qt) {
@@ -77,27 +110,34 @@ BytePSScheduledQueue::BytePSScheduledQueue(QueueType type) {
     default:
       break;
   }
+
+  _notifier = BytePSGlobal::GetLoopNotifier(_qt);
+  if (_rt) {
+    // the queue may be destroyed before the table
+    auto woken = std::make_shared<WokenKeys>();
+    _woken = woken;
+    _rt->AddKeyListener([woken](uint64_t key) {
+      std::lock_guard<std::mutex> lock(woken->mutex);
+      woken->keys.push_back(key);
+    });
+    _rt->AddListener(_notifier);
+  }
 }
 
 void BytePSScheduledQueue::addTask(std::shared_ptr<TensorTableEntry> entry) {
-  std::lock_guard<std::mutex> lock(_mutex);
-  _sq.push_back(entry);
-  if (_is_scheduled) {
-    // TODO: below can be optimized to O(n) using insertion sort
-    std::sort(
-        _sq.begin(), _sq.end(),
-        [](std::shared_ptr<TensorTableEntry> a,
-           std::shared_ptr<TensorTableEntry> b) {
-          if (a->priority == b->priority) {
-            return (a->key < b->key);  // from the first partition to the last
-          }
-          return (a->priority > b->priority);  // from higher priority to lower
-        });
-  }
-  BPS_CHECK(entry->tensor_name != "");
-  BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
-                 << " addTask: " << entry->tensor_name << " key: " << entry->key
-                 << " rank: " << BytePSGlobal::GetLocalRank();
+  {
+    std::lock_guard<std::mutex> lock(_mutex);
+    // from higher priority to lower, then from the first partition to the last
+    entry->enqueue_ns = NowNs();
+    _sq->insert(entry);
+    _stats.onAdd(_sq->size());
+    BPS_CHECK(entry->tensor_name != "");
+    BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
+                   << " addTask: " << entry->tensor_name
+                   << " key: " << entry->key
+                   << " rank: " << BytePSGlobal::GetLocalRank();
+  }
+  _notifier->Notify();
   return;
 }
 
@@ -124,84 +164,127 @@ void BytePSScheduledQueue::recorderTs(std::shared_ptr<TensorTableEntry> task) {
 
 std::shared_ptr<TensorTableEntry> BytePSScheduledQueue::getTask() {
   std::lock_guard<std::mutex> lock(_mutex);
-  std::shared_ptr<TensorTableEntry> task;
-  // TODO: below can be optimized -- if we take task from the tail, erase() can
-  // be faster
-  for (auto it = _sq.begin(); it != _sq.end(); ++it) {
-    if ((*it)->ready_event) {
-      if (!(*it)->ready_event->Ready()) {
-        continue;
+  // give the tasks set aside another chance once they may run
+  if (_rt) {
+    std::vector<uint64_t> keys;
+    {
+      std::lock_guard<std::mutex> woken_lock(_woken->mutex);
+      keys.swap(_woken->keys);
+    }
+    for (auto key : keys) _sq->wakeKey(key);
+  }
+  if (_is_scheduled) {
+    _sq->wakeCredit(_credits, _credits >= _credit_window);
+  }
+  auto task = _sq->popFirst([&](const TaskIndex::Task &t) {
+    if (t->ready_event) {
+      if (!t->ready_event->Ready()) {
+        return TaskIndex::kByEvent;
       }
     }
     if (_is_scheduled) {
-      if ((*it)->len > _credits) {
-        continue;
+      // a partition larger than the whole window (e.g., a tensor declared
+      // with a large partition size) may only run alone
+      if ((int64_t)t->len > _credits && _credits < _credit_window) {
+        return TaskIndex::kByCredit;
       }
     }
     if (_rt) {
-      if (!_rt->IsKeyReady((*it)->key)) {
-        continue;
+      if (!_rt->IsKeyReady(t->key)) {
+        return TaskIndex::kByReadyTable;
       }
-      _rt->ClearReadyCount((*it)->key);
     }
-    task = *it;
-    _sq.erase(it);
-    if (_is_scheduled) {
-      _credits -= task->len;
+    return TaskIndex::kRunnable;
+  });
+  if (!task) {
+    if (_sq->hasBlocked(TaskIndex::kByCredit)) _stats.onBlockedByCredit();
+    if (_sq->hasBlocked(TaskIndex::kByReadyTable)) {
+      _stats.onBlockedByReadyTable();
     }
-
-    BPS_CHECK(task->tensor_name != "");
-    BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
-                   << " getTask: " << task->tensor_name << " key: " << task->key
-                   << " rank: " << BytePSGlobal::GetLocalRank();
-    task->ready_event = nullptr;
-    // Add for profiling communication traces
-    recorderTs(task);
-    return task;
+    return nullptr;
   }
-  return nullptr;
+  if (_rt) {
+    _rt->ClearReadyCount(task->key);
+  }
+  if (_is_scheduled) {
+    _credits -= task->len;
+  }
+  task->dequeue_ns = NowNs();
+  _stats.onWait(task->dequeue_ns - task->enqueue_ns);
+
+  BPS_CHECK(task->tensor_name != "");
+  BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
+                 << " getTask: " << task->tensor_name << " key: " << task->key
+                 << " rank: " << BytePSGlobal::GetLocalRank();
+  task->ready_event = nullptr;
+  // Add for profiling communication traces
+  recorderTs(task);
+  return task;
 }
 
 std::shared_ptr<TensorTableEntry> BytePSScheduledQueue::getTask(uint64_t key) {
   BPS_CHECK(!_is_scheduled);
   std::lock_guard<std::mutex> lock(_mutex);
-  std::shared_ptr<TensorTableEntry> task;
-  for (auto it = _sq.begin(); it != _sq.end(); ++it) {
-    if ((*it)->ready_event) {
-      BPS_CHECK((*it)->ready_event->Ready());
-    }
-    if ((*it)->key != (uint64_t)key) {
-      continue;
-    }
-    task = *it;
-    _sq.erase(it);
-
-    BPS_CHECK(task->tensor_name != "");
-    BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
-                   << " getTask(key): " << task->tensor_name
-                   << " key: " << task->key
-                   << " rank: " << BytePSGlobal::GetLocalRank();
-    task->ready_event = nullptr;
-    // Add for profiling communication traces
-    recorderTs(task);
-    return task;
+  auto task = _sq->pop(key);
+  if (!task) {
+    return nullptr;
+  }
+  if (task->ready_event) {
+    BPS_CHECK(task->ready_event->Ready());
   }
-  return nullptr;
+  task->dequeue_ns = NowNs();
+  _stats.onWait(task->dequeue_ns - task->enqueue_ns);
+
+  BPS_CHECK(task->tensor_name != "");
+  BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
+                 << " getTask(key): " << task->tensor_name
+                 << " key: " << task->key
+                 << " rank: " << BytePSGlobal::GetLocalRank();
+  task->ready_event = nullptr;
+  // Add for profiling communication traces
+  recorderTs(task);
+  return task;
 }
 
 uint32_t BytePSScheduledQueue::pendingSize() {
   std::lock_guard<std::mutex> lock(_mutex);
-  return _sq.size();
+  return _sq->size();
 }
 
-void BytePSScheduledQueue::reportFinish(int size) {
+void BytePSScheduledQueue::reportFinish(
+    std::shared_ptr<TensorTableEntry> task) {
+  uint64_t now = NowNs();
+  _stats.onService(now - task->dequeue_ns);
   if (_is_scheduled) {
-    std::lock_guard<std::mutex> lock(_mutex);
-    _credits += size;
+    {
+      std::lock_guard<std::mutex> lock(_mutex);
+      _credits += task->len;
+      if (_credit_ctrl) {
+        auto delta = _credit_ctrl->onFinish(task->len, now - task->dequeue_ns,
+                                            now);
+        _credits += delta;
+        _credit_window += delta;
+        if (delta) {
+          BPS_LOG(TRACE) << "Queue " << LogStrings[_qt]
+                         << " credit window: " << _credit_ctrl->window();
+        }
+      }
+    }
+    _notifier->Notify();
   }
   return;
 }
 
+int64_t BytePSScheduledQueue::getCreditWindow() {
+  if (!_is_scheduled) return -1;
+  std::lock_guard<std::mutex> lock(_mutex);
+  return _credit_window;
+}
+
+QueueStats::Snapshot BytePSScheduledQueue::getStats(bool reset) {
+  return _stats.get(pendingSize(), reset);
+}
+
 void BytePSScheduledQueue::reset(uint64_t key, int cnt) {
   std::lock_guard<std::mutex> lock(_mutex);
   if(_rt) {
@@ -16,16 +16,394 @@
 #ifndef BYTEPS_SCHEDULED_QUEUE_H
 #define BYTEPS_SCHEDULED_QUEUE_H
 
+#include <algorithm>
 #include <atomic>
+#include <map>
 #include <memory>
+#include <set>
 #include <unordered_map>
 #include <vector>
 #include "common.h"
+#include "loop_notifier.h"
 #include "ready_table.h"
 
 namespace byteps {
 namespace common {
 
+// Ordered index of the pending tasks of one queue. With priority ordering,
+// tasks are sorted by (priority desc, key asc); otherwise they keep their
+// arrival order. Insertion and removal are O(log n), and lookups by key go
+// through a secondary index instead of a linear scan.
+//
+// Tasks found blocked by popFirst are set aside by the reason, so that they
+// are not checked again on every call: those of the ReadyTable until
+// wakeKey() is called with their key, those over the credit until
+// wakeCredit() lets them fit. Tasks waiting for their ready event are
+// polled, since the events signal nothing.
+class TaskIndex {
+ public:
+  typedef std::shared_ptr<TensorTableEntry> Task;
+  enum Blocked { kRunnable, kByEvent, kByReadyTable, kByCredit };
+
+  TaskIndex(bool by_priority) : _by_priority(by_priority), _seq(0) {}
+
+  void insert(Task task);
+  // The first task in order for which check() returns kRunnable.
+  template <typename Check>
+  Task popFirst(Check check);
+  // The earliest task of a key, blocked or not.
+  Task pop(uint64_t key);
+  void wakeKey(uint64_t key);
+  // wakes the tasks of up to `credits` bytes, or all of them if `all`
+  void wakeCredit(int64_t credits, bool all);
+  bool hasBlocked(Blocked blocked) const;
+  size_t size() const { return _tasks.size(); }
+  bool empty() const { return _tasks.empty(); }
+
+ private:
+  struct Order {
+    int priority;
+    uint64_t key;
+    uint64_t seq;
+    bool operator<(const Order& other) const {
+      if (priority != other.priority) return priority > other.priority;
+      if (key != other.key) return key < other.key;
+      return seq < other.seq;
+    }
+  };
+  struct Entry {
+    Task task;
+    Blocked blocked;
+  };
+  typedef std::map<Order, Entry> OrderedTasks;
+  typedef OrderedTasks::iterator Iter;
+  struct IterLess {
+    bool operator()(const Iter& a, const Iter& b) const {
+      return a->first < b->first;
+    }
+  };
+
+  // moves a task to the set of `blocked`
+  void attach(Iter it, Blocked blocked);
+  // removes a task from its set
+  void detach(Iter it);
+  void erase(Iter it);
+
+  bool _by_priority;
+  uint64_t _seq;
+  // all tasks
+  OrderedTasks _tasks;
+  std::unordered_multimap<uint64_t, Iter> _by_key;
+  // the tasks in one of these, by their `blocked`
+  std::set<Iter, IterLess> _runnable;
+  std::set<Iter, IterLess> _by_event;
+  std::unordered_multimap<uint64_t, Iter> _by_ready_table;
+  std::multimap<size_t, Iter> _by_credit;
+};
+
+inline void TaskIndex::insert(Task task) {
+  Order order;
+  order.priority = _by_priority ? task->priority : 0;
+  order.key = _by_priority ? task->key : 0;
+  order.seq = _seq++;
+  auto it = _tasks.emplace(order, Entry{task, kRunnable}).first;
+  _by_key.emplace(task->key, it);
+  _runnable.insert(it);
+}
+
+inline TaskIndex::Task TaskIndex::pop(uint64_t key) {
+  auto range = _by_key.equal_range(key);
+  if (range.first == range.second) return nullptr;
+  auto earliest = range.first;
+  for (auto it = range.first; it != range.second; ++it) {
+    if (it->second->first.seq < earliest->second->first.seq) earliest = it;
+  }
+  auto it = earliest->second;
+  auto task = it->second.task;
+  detach(it);
+  erase(it);
+  return task;
+}
+
+inline void TaskIndex::wakeKey(uint64_t key) {
+  auto range = _by_ready_table.equal_range(key);
+  for (auto k = range.first; k != range.second; ++k) {
+    k->second->second.blocked = kRunnable;
+    _runnable.insert(k->second);
+  }
+  _by_ready_table.erase(range.first, range.second);
+}
+
+inline void TaskIndex::wakeCredit(int64_t credits, bool all) {
+  while (!_by_credit.empty() &&
+         (all || (int64_t)_by_credit.begin()->first <= credits)) {
+    auto it = _by_credit.begin()->second;
+    it->second.blocked = kRunnable;
+    _runnable.insert(it);
+    _by_credit.erase(_by_credit.begin());
+  }
+}
+
+inline bool TaskIndex::hasBlocked(Blocked blocked) const {
+  switch (blocked) {
+    case kByEvent:
+      return !_by_event.empty();
+    case kByReadyTable:
+      return !_by_ready_table.empty();
+    case kByCredit:
+      return !_by_credit.empty();
+    default:
+      return false;
+  }
+}
+
+inline void TaskIndex::attach(Iter it, Blocked blocked) {
+  it->second.blocked = blocked;
+  switch (blocked) {
+    case kByEvent:
+      _by_event.insert(it);
+      break;
+    case kByReadyTable:
+      _by_ready_table.emplace(it->second.task->key, it);
+      break;
+    case kByCredit:
+      _by_credit.emplace(it->second.task->len, it);
+      break;
+    default:
+      _runnable.insert(it);
+  }
+}
+
+inline void TaskIndex::detach(Iter it) {
+  switch (it->second.blocked) {
+    case kByEvent:
+      _by_event.erase(it);
+      break;
+    case kByReadyTable: {
+      auto range = _by_ready_table.equal_range(it->second.task->key);
+      for (auto k = range.first; k != range.second; ++k) {
+        if (k->second == it) {
+          _by_ready_table.erase(k);
+          break;
+        }
+      }
+      break;
+    }
+    case kByCredit: {
+      auto range = _by_credit.equal_range(it->second.task->len);
+      for (auto k = range.first; k != range.second; ++k) {
+        if (k->second == it) {
+          _by_credit.erase(k);
+          break;
+        }
+      }
+      break;
+    }
+    default:
+      _runnable.erase(it);
+  }
+}
+
+inline void TaskIndex::erase(Iter it) {
+  auto range = _by_key.equal_range(it->second.task->key);
+  for (auto k = range.first; k != range.second; ++k) {
+    if (k->second == it) {
+      _by_key.erase(k);
+      break;
+    }
+  }
+  _tasks.erase(it);
+}
+
+template <typename Check>
+TaskIndex::Task TaskIndex::popFirst(Check check) {
+  for (auto e = _by_event.begin(); e != _by_event.end();) {
+    auto& event = (*e)->second.task->ready_event;
+    if (event && !event->Ready()) {
+      ++e;
+      continue;
+    }
+    (*e)->second.blocked = kRunnable;
+    _runnable.insert(*e);
+    e = _by_event.erase(e);
+  }
+  while (!_runnable.empty()) {
+    auto it = *_runnable.begin();
+    _runnable.erase(_runnable.begin());
+    auto blocked = check(it->second.task);
+    if (blocked != kRunnable) {
+      attach(it, blocked);
+      continue;
+    }
+    auto task = it->second.task;
+    erase(it);
+    return task;
+  }
+  return nullptr;
+}
+
+class CreditController {
+ public:
+  CreditController(int64_t init, int64_t min, int64_t max, int64_t step)
+      : _window(init), _min(min), _max(max), _step(step) {}
+
+  // Record a finished task. Returns the change of the window in bytes.
+  int64_t onFinish(int64_t bytes, uint64_t latency_ns, uint64_t now_ns);
+  int64_t window() const { return _window; }
+
+ private:
+  int64_t _window;
+  int64_t _min;
+  int64_t _max;
+  int64_t _step;
+
+  // statistics of the current epoch
+  uint64_t _epoch_start_ns = 0;
+  int64_t _epoch_bytes = 0;
+  uint64_t _epoch_latency_ns = 0;
+  int _epoch_tasks = 0;
+
+  double _base_latency_ns = 0;
+  double _last_throughput = 0;
+};
+
+inline int64_t CreditController::onFinish(int64_t bytes, uint64_t latency_ns,
+                                          uint64_t now_ns) {
+  if (!_epoch_start_ns) {
+    _epoch_start_ns = now_ns > latency_ns ? now_ns - latency_ns : now_ns;
+  }
+  _epoch_bytes += bytes;
+  _epoch_latency_ns += latency_ns;
+  ++_epoch_tasks;
+  if (_epoch_bytes < _window || _epoch_tasks < 4 || now_ns <= _epoch_start_ns) {
+    return 0;
+  }
+
+  double latency = 1.0 * _epoch_latency_ns / _epoch_tasks;
+  double throughput = 1.0 * _epoch_bytes / (now_ns - _epoch_start_ns);
+  if (!_base_latency_ns || latency < _base_latency_ns) {
+    _base_latency_ns = latency;
+  }
+
+  int64_t old_window = _window;
+  if (latency < 1.25 * _base_latency_ns ||
+      throughput > 1.1 * _last_throughput) {
+    _window += _step;
+  } else if (latency > 2 * _base_latency_ns &&
+             throughput < 1.05 * _last_throughput) {
+    _window = _window * 3 / 4;
+  }
+  _window = std::max(_min, std::min(_max, _window));
+
+  _last_throughput = throughput;
+  _epoch_start_ns = now_ns;
+  _epoch_bytes = 0;
+  _epoch_latency_ns = 0;
+  _epoch_tasks = 0;
+  return _window - old_window;
+}
+
+// Always-on counters of one scheduled queue. Times are kept in log2
+// histograms: bucket 0 counts times below 1us, bucket i counts times in
+// [2^(i-1), 2^i) us, and the last bucket also counts everything above.
+class QueueStats {
+ public:
+  static const int kNumBuckets = 24;
+
+  struct Snapshot {
+    uint64_t wait_hist[kNumBuckets];
+    uint64_t service_hist[kNumBuckets];
+    uint64_t wait_ns_total;
+    uint64_t service_ns_total;
+    uint64_t tasks;
+    uint64_t blocked_by_credit;
+    uint64_t blocked_by_ready_table;
+    uint64_t depth;
+    uint64_t max_depth;
+  };
+
+  QueueStats() { reset(); }
+
+  void onAdd(size_t depth) {
+    auto max_depth = _max_depth.load(std::memory_order_relaxed);
+    while (depth > max_depth &&
+           !_max_depth.compare_exchange_weak(max_depth, depth)) {
+    }
+  }
+  void onWait(uint64_t ns) {
+    _wait_hist[bucket(ns)].fetch_add(1, std::memory_order_relaxed);
+    _wait_ns_total.fetch_add(ns, std::memory_order_relaxed);
+  }
+  void onService(uint64_t ns) {
+    _service_hist[bucket(ns)].fetch_add(1, std::memory_order_relaxed);
+    _service_ns_total.fetch_add(ns, std::memory_order_relaxed);
+    _tasks.fetch_add(1, std::memory_order_relaxed);
+  }
+  // a poll that found no runnable task because of the credits / ReadyTable
+  void onBlockedByCredit() {
+    _blocked_by_credit.fetch_add(1, std::memory_order_relaxed);
+  }
+  void onBlockedByReadyTable() {
+    _blocked_by_ready_table.fetch_add(1, std::memory_order_relaxed);
+  }
+
+  // With `reset`, the counters restart from zero after being read.
+  Snapshot get(size_t depth, bool reset);
+  void reset();
+
+ private:
+  static int bucket(uint64_t ns) {
+    uint64_t us = ns / 1000;
+    int b = 0;
+    while (us && b < kNumBuckets - 1) {
+      us >>= 1;
+      ++b;
+    }
+    return b;
+  }
+
+  std::atomic<uint64_t> _wait_hist[kNumBuckets];
+  std::atomic<uint64_t> _service_hist[kNumBuckets];
+  std::atomic<uint64_t> _wait_ns_total;
+  std::atomic<uint64_t> _service_ns_total;
+  std::atomic<uint64_t> _tasks;
+  std::atomic<uint64_t> _blocked_by_credit;
+  std::atomic<uint64_t> _blocked_by_ready_table;
+  std::atomic<uint64_t> _max_depth;
+};
+
+inline QueueStats::Snapshot QueueStats::get(size_t depth, bool reset) {
+  auto read = [reset](std::atomic<uint64_t>& x) {
+    return reset ? x.exchange(0) : x.load();
+  };
+  Snapshot s;
+  for (int i = 0; i < kNumBuckets; ++i) {
+    s.wait_hist[i] = read(_wait_hist[i]);
+    s.service_hist[i] = read(_service_hist[i]);
+  }
+  s.wait_ns_total = read(_wait_ns_total);
+  s.service_ns_total = read(_service_ns_total);
+  s.tasks = read(_tasks);
+  s.blocked_by_credit = read(_blocked_by_credit);
+  s.blocked_by_ready_table = read(_blocked_by_ready_table);
+  s.depth = depth;
+  s.max_depth = std::max<uint64_t>(read(_max_depth), depth);
+  return s;
+}
+
+inline void QueueStats::reset() {
+  for (int i = 0; i < kNumBuckets; ++i) {
+    _wait_hist[i] = 0;
+    _service_hist[i] = 0;
+  }
+  _wait_ns_total = 0;
+  _service_ns_total = 0;
+  _tasks = 0;
+  _blocked_by_credit = 0;
+  _blocked_by_ready_table = 0;
+  _max_depth = 0;
+}
+
 class BytePSScheduledQueue {
  public:
   BytePSScheduledQueue(QueueType type);
@@ -35,17 +413,33 @@ class BytePSScheduledQueue {
   std::shared_ptr<TensorTableEntry> getTask();
   std::shared_ptr<TensorTableEntry> getTask(uint64_t key);
   uint32_t pendingSize();
-  void reportFinish(int size);
+  void reportFinish(std::shared_ptr<TensorTableEntry> task);
+  // in-flight byte budget, or -1 if credit scheduling is disabled
+  int64_t getCreditWindow();
   void reset(uint64_t key, int cnt);
+  std::shared_ptr<LoopNotifier> getNotifier() { return _notifier; }
+  QueueStats::Snapshot getStats(bool reset);
 
  private:
-  // TODO: use priority queue or heap
-  std::vector<std::shared_ptr<TensorTableEntry>> _sq;
+  std::unique_ptr<TaskIndex> _sq;
   std::mutex _mutex;
-  uint64_t _credits;
+  int64_t _credits;
+  int64_t _credit_window;
+  // only set with BYTEPS_SCHEDULING_CREDIT=auto
+  std::unique_ptr<CreditController> _credit_ctrl;
   bool _is_scheduled;
   QueueType _qt;
   ReadyTable *_rt;
+  // the keys made ready by _rt since the last getTask, added by the
+  // ReadyTable without taking _mutex
+  struct WokenKeys {
+    std::mutex mutex;
+    std::vector<uint64_t> keys;
+  };
+  std::shared_ptr<WokenKeys> _woken;
+  // wakes up the loop that serves this queue
+  std::shared_ptr<LoopNotifier> _notifier;
+  QueueStats _stats;
 };
 
 }  // namespace common
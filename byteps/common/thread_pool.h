@@ -1,9 +1,19 @@
 /*
- * Copy From https://github.com/progschj/ThreadPool/blob/master/ThreadPool.h
+ * Based on https://github.com/progschj/ThreadPool/blob/master/ThreadPool.h
+ *
+ * Every worker owns a queue of pending tasks ordered by priority (higher
+ * first, FIFO among equal priorities). Tasks submitted by a worker go to its
+ * own queue, other submissions are spread round-robin. An idle worker takes
+ * the most urgent task among the heads of all queues, so a high-priority
+ * task never waits behind the low-priority backlog of one worker while
+ * another worker is free. Each queue has its own lock, so submission and
+ * execution do not contend on a single mutex.
  */
 #ifndef THREAD_POOL_H
 #define THREAD_POOL_H
 
+#include <atomic>
+#include <chrono>
 #include <condition_variable>
 #include <functional>
 #include <future>
@@ -16,58 +26,173 @@
 
 class ThreadPool {
  public:
-  ThreadPool(size_t);
+  // `on_start` is called by each worker with its index before any task
+  ThreadPool(size_t, std::function<void(size_t)> on_start = nullptr);
   template <class F>
-  void enqueue(F&& f);
+  void enqueue(F&& f, int priority = 0);
   ~ThreadPool();
 
+  size_t size() const { return workers.size(); }
+  // time spent running tasks, per worker
+  std::vector<uint64_t> getBusyNs() const;
+  // number of tasks run, and of those taken from another worker's queue
+  uint64_t getNumTasks() const { return num_tasks.load(); }
+  uint64_t getNumStolen() const { return num_stolen.load(); }
+
  private:
+  struct Task {
+    int priority;
+    uint64_t seq;
+    std::function<void()> func;
+    bool operator<(const Task& other) const {
+      // std::priority_queue pops the largest
+      if (priority != other.priority) return priority < other.priority;
+      return seq > other.seq;
+    }
+  };
+
+  struct WorkerQueue {
+    std::mutex mutex;
+    std::priority_queue<Task> tasks;
+    std::atomic<uint64_t> busy_ns{0};
+  };
+
+  bool pop(size_t self, Task* task);
+  void run(size_t self);
+
   // need to keep track of threads so we can join them
   std::vector<std::thread> workers;
-  // the task queue
-  std::queue<std::function<void()> > tasks;
+  std::vector<std::unique_ptr<WorkerQueue> > queues;
+
+  // number of tasks in all queues
+  std::atomic<size_t> pending;
+  std::atomic<uint64_t> seq;
+  std::atomic<uint64_t> next_queue;
+  std::atomic<uint64_t> num_tasks;
+  std::atomic<uint64_t> num_stolen;
 
-  // synchronization
-  std::mutex queue_mutex;
+  // synchronization of idle workers
+  std::mutex sleep_mutex;
   std::condition_variable condition;
-  bool stop;
+  std::atomic<int> sleepers;
+  std::atomic<bool> stop;
+
+  // the pool and worker index of the current thread, if it is a worker
+  struct Current {
+    ThreadPool* pool = nullptr;
+    size_t index = 0;
+  };
+  static Current& current() {
+    static thread_local Current c;
+    return c;
+  }
 };
 
 // the constructor just launches some amount of workers
-inline ThreadPool::ThreadPool(size_t threads) : stop(false) {
-  for (size_t i = 0; i < threads; ++i)
-    workers.emplace_back([this] {
-      for (;;) {
-        std::function<void()> task;
-
-        {
-          std::unique_lock<std::mutex> lock(this->queue_mutex);
-          this->condition.wait(
-              lock, [this] { return this->stop || !this->tasks.empty(); });
-          if (this->stop && this->tasks.empty()) return;
-          task = std::move(this->tasks.front());
-          this->tasks.pop();
-        }
-
-        task();
-      }
+inline ThreadPool::ThreadPool(size_t threads,
+                              std::function<void(size_t)> on_start)
+    : pending(0),
+      seq(0),
+      next_queue(0),
+      num_tasks(0),
+      num_stolen(0),
+      sleepers(0),
+      stop(false) {
+  if (threads == 0) throw std::invalid_argument("ThreadPool of no thread");
+  for (size_t i = 0; i < threads; ++i) {
+    queues.emplace_back(new WorkerQueue());
+  }
+  for (size_t i = 0; i < threads; ++i) {
+    workers.emplace_back([this, i, on_start] {
+      if (on_start) on_start(i);
+      run(i);
     });
+  }
+}
+
+// Takes the most urgent task among the queue heads, preferring the own
+// queue on ties.
+inline bool ThreadPool::pop(size_t self, Task* task) {
+  while (pending.load()) {
+    size_t victim = queues.size();
+    int best = 0;
+    for (size_t k = 0; k < queues.size(); ++k) {
+      size_t i = (self + k) % queues.size();
+      std::lock_guard<std::mutex> lock(queues[i]->mutex);
+      if (queues[i]->tasks.empty()) continue;
+      int priority = queues[i]->tasks.top().priority;
+      if (victim == queues.size() || priority > best) {
+        victim = i;
+        best = priority;
+      }
+    }
+    if (victim == queues.size()) return false;
+    std::lock_guard<std::mutex> lock(queues[victim]->mutex);
+    // may have been taken meanwhile, then look again
+    if (queues[victim]->tasks.empty()) continue;
+    *task = std::move(const_cast<Task&>(queues[victim]->tasks.top()));
+    queues[victim]->tasks.pop();
+    pending.fetch_sub(1);
+    if (victim != self) num_stolen.fetch_add(1);
+    return true;
+  }
+  return false;
+}
+
+inline void ThreadPool::run(size_t self) {
+  current().pool = this;
+  current().index = self;
+  for (;;) {
+    Task task;
+    if (!pop(self, &task)) {
+      std::unique_lock<std::mutex> lock(this->sleep_mutex);
+      this->sleepers.fetch_add(1);
+      this->condition.wait(
+          lock, [this] { return this->stop || this->pending.load(); });
+      this->sleepers.fetch_sub(1);
+      if (this->stop && !this->pending.load()) return;
+      continue;
+    }
+
+    auto start = std::chrono::steady_clock::now();
+    task.func();
+    auto busy = std::chrono::duration_cast<std::chrono::nanoseconds>(
+                    std::chrono::steady_clock::now() - start)
+                    .count();
+    queues[self]->busy_ns.fetch_add(busy);
+    num_tasks.fetch_add(1);
+  }
 }
 
 // add new work item to the pool
 template <class F>
-void ThreadPool::enqueue(F&& f) {
+void ThreadPool::enqueue(F&& f, int priority) {
+  if (stop) throw std::runtime_error("enqueue on stopped ThreadPool");
+  size_t i = (current().pool == this) ? current().index
+                                      : next_queue.fetch_add(1) % queues.size();
   {
-    std::lock_guard<std::mutex> lock(queue_mutex);
-    if (stop) throw std::runtime_error("enqueue on stopped ThreadPool");
-    tasks.emplace(std::forward<F>(f));
+    std::lock_guard<std::mutex> lock(queues[i]->mutex);
+    queues[i]->tasks.push(Task{priority, seq.fetch_add(1),
+                               std::function<void()>(std::forward<F>(f))});
+    pending.fetch_add(1);
+  }
+  if (sleepers.load()) {
+    // a worker between its check of `pending` and wait() holds the lock
+    std::lock_guard<std::mutex> lock(sleep_mutex);
+    condition.notify_one();
   }
-  condition.notify_one();
 }
+
+inline std::vector<uint64_t> ThreadPool::getBusyNs() const {
+  std::vector<uint64_t> ret;
+  for (auto& q : queues) ret.push_back(q->busy_ns.load());
+  return ret;
+}
+
 // the destructor joins all threads
 inline ThreadPool::~ThreadPool() {
   {
-    std::unique_lock<std::mutex> lock(queue_mutex);
+    std::unique_lock<std::mutex> lock(sleep_mutex);
     stop = true;
   }
   condition.notify_all();
@@ -27,7 +27,9 @@ import mxnet.ndarray as nd
 from byteps.mxnet.compression import Compression
 from byteps.mxnet.ops import (byteps_declare_tensor, byteps_push_pull, init,
                               local_rank, local_size, rank, resume, shutdown,
-                              size, suspend)
+                              size, suspend, get_scheduling_credit,
+                              get_threadpool_busy_time, get_queue_stats,
+                              get_reducer_calibration)
 
 parameter_index = 0
 
@@ -150,7 +150,14 @@ extern "C" void byteps_mxnet_declare_tensor(char* name, int num_args,
     kwargs[key] = val;
   }
 
-  if (num_args > 0) {
+  // not a compressor argument
+  auto iter = kwargs.find("partition_bytes");
+  if (iter != kwargs.end()) {
+    common::SetPartitionBytes(tensor_name, std::stoul(iter->second));
+    kwargs.erase(iter);
+  }
+
+  if (!kwargs.empty()) {
     common::RegisterCompressor(tensor_name, kwargs);
   }
 
@@ -39,6 +39,10 @@ size = _basics.size
 local_size = _basics.local_size
 rank = _basics.rank
 local_rank = _basics.local_rank
+get_scheduling_credit = _basics.get_scheduling_credit
+get_threadpool_busy_time = _basics.get_threadpool_busy_time
+get_queue_stats = _basics.get_queue_stats
+get_reducer_calibration = _basics.get_reducer_calibration
 
 dll_path = os.path.join(os.path.dirname(__file__),
                         'c_lib' + get_ext_suffix())
@@ -86,7 +90,8 @@ def byteps_declare_tensor(name, **kwargs):
 
     Arguments:
         name : str, tensor name
-        **kwargs: extra params w.r.t gradient compression  
+        **kwargs: extra params w.r.t gradient compression, or
+            byteps_partition_bytes for the partition size of this tensor
 
     Returns:
         None
@@ -28,6 +28,10 @@ const DataType TensorUtil::GetDType(NDArray* tensor) {
       return DataType::BYTEPS_FLOAT64;
     case mshadow::kFloat16:
       return DataType::BYTEPS_FLOAT16;
+#if MXNET_VERSION >= 10700
+    case mshadow::kBfloat16:
+      return DataType::BYTEPS_BFLOAT16;
+#endif
     case mshadow::kUint8:
       return DataType::BYTEPS_UINT8;
     case mshadow::kInt32:
@@ -64,6 +68,11 @@ const void* TensorUtil::GetData(NDArray* tensor) {
       return static_cast<void*>(tensor->data().dptr<double>());
     case mshadow::kFloat16:
       return static_cast<void*>(tensor->data().dptr<mshadow::half::half_t>());
+#if MXNET_VERSION >= 10700
+    case mshadow::kBfloat16:
+      return static_cast<void*>(
+          tensor->data().dptr<mshadow::bfloat::bf16_t>());
+#endif
     case mshadow::kUint8:
       return static_cast<void*>(tensor->data().dptr<uint8_t>());
     case mshadow::kInt32:
@@ -91,6 +100,11 @@ int64_t TensorUtil::GetSize(NDArray* tensor) {
     case mshadow::kFloat16:
       element_size = kFloat16Size;
       break;
+#if MXNET_VERSION >= 10700
+    case mshadow::kBfloat16:
+      element_size = kBFloat16Size;
+      break;
+#endif
     case mshadow::kUint8:
       element_size = kUInt8Size;
       break;
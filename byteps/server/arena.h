@@ -0,0 +1,122 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_SERVER_ARENA_H
+#define BYTEPS_SERVER_ARENA_H
+
+#include <numa.h>
+#include <sys/mman.h>
+
+#include <algorithm>
+#include <mutex>
+#include <vector>
+
+#include "ps/ps.h"
+
+namespace byteps {
+namespace server {
+
+/**
+ * \brief Hands out aligned slices of a few large mappings.
+ *
+ * Memory is mapped in chunks of at least `chunk_bytes`, backed by huge pages
+ * if asked (MAP_HUGETLB if the system has reserved them, transparent huge
+ * pages otherwise) and bound to `numa_node` if it is not -1. Slices are never
+ * freed one by one, all memory is unmapped with the arena. Fresh slices are
+ * zero-filled.
+ */
+class MemoryArena {
+ public:
+  MemoryArena(size_t chunk_bytes, bool hugepage, int numa_node)
+      : _chunk_bytes(chunk_bytes), _hugepage(hugepage), _numa_node(numa_node) {}
+
+  ~MemoryArena() {
+    for (auto& chunk : _chunks) munmap(chunk.base, chunk.size);
+  }
+
+  void* Allocate(size_t size, size_t alignment) {
+    std::lock_guard<std::mutex> lock(_mutex);
+    if (_chunks.empty() || !Fits(_chunks.back(), size, alignment)) {
+      NewChunk(size + alignment);
+    }
+    auto& chunk = _chunks.back();
+    size_t offset = RoundUp(chunk.used, alignment);
+    chunk.used = offset + size;
+    _used += size;
+    return chunk.base + offset;
+  }
+
+  // bytes mapped, and bytes handed out
+  size_t reserved() const {
+    std::lock_guard<std::mutex> lock(_mutex);
+    return _reserved;
+  }
+  size_t used() const {
+    std::lock_guard<std::mutex> lock(_mutex);
+    return _used;
+  }
+  size_t num_chunks() const {
+    std::lock_guard<std::mutex> lock(_mutex);
+    return _chunks.size();
+  }
+
+ private:
+  struct Chunk {
+    char* base;
+    size_t size;
+    size_t used;
+  };
+
+  static size_t RoundUp(size_t x, size_t y) { return (x + y - 1) / y * y; }
+
+  static bool Fits(const Chunk& chunk, size_t size, size_t alignment) {
+    return RoundUp(chunk.used, alignment) + size <= chunk.size;
+  }
+
+  void NewChunk(size_t min_bytes) {
+    // huge pages are 2MB on all platforms we run on
+    const size_t kHugePage = 2 << 20;
+    size_t size = RoundUp(std::max(min_bytes, _chunk_bytes), kHugePage);
+    void* p = MAP_FAILED;
+    if (_hugepage) {
+      p = mmap(nullptr, size, PROT_READ | PROT_WRITE,
+               MAP_PRIVATE | MAP_ANONYMOUS | MAP_HUGETLB, -1, 0);
+    }
+    if (p == MAP_FAILED) {
+      p = mmap(nullptr, size, PROT_READ | PROT_WRITE,
+               MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+      CHECK(p != MAP_FAILED) << "failed to map " << size << " bytes: "
+                             << strerror(errno);
+      if (_hugepage) madvise(p, size, MADV_HUGEPAGE);
+    }
+    // before the pages are touched
+    if (_numa_node >= 0) numa_tonode_memory(p, size, _numa_node);
+    _chunks.push_back({static_cast<char*>(p), size, 0});
+    _reserved += size;
+  }
+
+  size_t _chunk_bytes;
+  bool _hugepage;
+  int _numa_node;
+  mutable std::mutex _mutex;
+  std::vector<Chunk> _chunks;
+  size_t _reserved = 0;
+  size_t _used = 0;
+};
+
+}  // namespace server
+}  // namespace byteps
+
+#endif  // BYTEPS_SERVER_ARENA_H
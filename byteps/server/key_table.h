@@ -0,0 +1,147 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_SERVER_KEY_TABLE_H
+#define BYTEPS_SERVER_KEY_TABLE_H
+
+#include <atomic>
+#include <memory>
+#include <mutex>
+#include <unordered_map>
+
+namespace byteps {
+namespace server {
+
+/**
+ * \brief Per-key state of the server, looked up without locking.
+ *
+ * Keys are (declared_key << 16 | partition), as encoded by the workers. The
+ * slots of a declared key are allocated when one of its partitions is first
+ * seen, i.e., in the init round, and the entries are published through
+ * atomic pointers, so that looking up a known key takes no lock. Other keys
+ * go to maps sharded by key. Entries are never removed, and their addresses
+ * stay valid until the table is destroyed.
+ */
+template <typename T>
+class KeyTable {
+ public:
+  static const int kDensePartitions = 256;
+  static const int kMaxDenseKeys = 1 << 16;
+  static const int kNumShards = 64;
+
+  KeyTable() : _dense(new std::atomic<Slot*>[kMaxDenseKeys]) {
+    for (int i = 0; i < kMaxDenseKeys; ++i) {
+      _dense[i] = nullptr;
+    }
+  }
+
+  ~KeyTable() {
+    for (int i = 0; i < kMaxDenseKeys; ++i) {
+      auto slots = _dense[i].load();
+      if (!slots) continue;
+      for (int j = 0; j < kDensePartitions; ++j) {
+        delete slots[j].load();
+      }
+      delete[] slots;
+    }
+  }
+
+  // the entry of `key`, value-initialized on first use
+  T* Get(uint64_t key) {
+    if (!IsDenseKey(key)) {
+      auto& shard = _shards[ShardOf(key)];
+      std::lock_guard<std::mutex> lock(shard.mutex);
+      auto& entry = shard.entries[key];
+      if (!entry) entry.reset(new T());
+      return entry.get();
+    }
+    auto& slot = GetSlots(key >> 16)[key & 0xffff];
+    auto entry = slot.load();
+    if (entry) return entry;
+    auto fresh = new T();
+    // another thread may have been first
+    if (slot.compare_exchange_strong(entry, fresh)) return fresh;
+    delete fresh;
+    return entry;
+  }
+
+  // the entry of `key`, or nullptr if it has never been used
+  T* Find(uint64_t key) {
+    if (!IsDenseKey(key)) {
+      auto& shard = _shards[ShardOf(key)];
+      std::lock_guard<std::mutex> lock(shard.mutex);
+      auto it = shard.entries.find(key);
+      return it == shard.entries.end() ? nullptr : it->second.get();
+    }
+    auto slots = _dense[key >> 16].load();
+    return slots ? slots[key & 0xffff].load() : nullptr;
+  }
+
+  // calls f(key, entry) for all entries
+  template <typename F>
+  void ForEach(F f) {
+    for (int i = 0; i < kMaxDenseKeys; ++i) {
+      auto slots = _dense[i].load();
+      if (!slots) continue;
+      for (int j = 0; j < kDensePartitions; ++j) {
+        auto entry = slots[j].load();
+        if (entry) f(((uint64_t)i << 16) | j, entry);
+      }
+    }
+    for (auto& shard : _shards) {
+      std::lock_guard<std::mutex> lock(shard.mutex);
+      for (auto& it : shard.entries) f(it.first, it.second.get());
+    }
+  }
+
+ private:
+  typedef std::atomic<T*> Slot;
+
+  struct Shard {
+    std::mutex mutex;
+    std::unordered_map<uint64_t, std::unique_ptr<T> > entries;
+  };
+
+  static bool IsDenseKey(uint64_t key) {
+    return (key >> 16) < (uint64_t)kMaxDenseKeys &&
+           (key & 0xffff) < kDensePartitions;
+  }
+
+  static size_t ShardOf(uint64_t key) {
+    return (key ^ (key >> 16)) % kNumShards;
+  }
+
+  Slot* GetSlots(uint64_t declared_key) {
+    auto slots = _dense[declared_key].load();
+    if (slots) return slots;
+    auto fresh = new Slot[kDensePartitions];
+    for (int i = 0; i < kDensePartitions; ++i) {
+      fresh[i] = nullptr;
+    }
+    if (_dense[declared_key].compare_exchange_strong(slots, fresh)) {
+      return fresh;
+    }
+    delete[] fresh;
+    return slots;
+  }
+
+  std::unique_ptr<std::atomic<Slot*>[]> _dense;
+  Shard _shards[kNumShards];
+};
+
+}  // namespace server
+}  // namespace byteps
+
+#endif  // BYTEPS_SERVER_KEY_TABLE_H
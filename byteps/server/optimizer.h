@@ -0,0 +1,193 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+#ifndef BYTEPS_SERVER_OPTIMIZER_H
+#define BYTEPS_SERVER_OPTIMIZER_H
+
+#include <cmath>
+#include <cstdlib>
+#include <memory>
+#include <string>
+
+#include "../common/common.h"
+#include "../common/compressor/common.h"
+#include "ps/ps.h"
+
+namespace byteps {
+namespace server {
+
+using common::compressor::kwargs_t;
+
+/**
+ * \brief Optimizer applied by the server to the weights in its store, for
+ * asynchronous training.
+ *
+ * Workers push gradients and pull the updated weights, the optimizer state
+ * only lives on the server. The hyperparameters are sent by the workers when
+ * they declare the tensor, with the same names as in torch.optim: type (sgd
+ * or adam), lr, momentum, nesterov, weight_decay, beta1, beta2 and eps.
+ */
+class ServerOptimizer {
+ public:
+  virtual ~ServerOptimizer() = default;
+
+  // weight -= update(grad), both of `len` bytes of the dtype of the key
+  virtual void Update(void* weight, const void* grad) = 0;
+
+  // nullptr if the type is unknown
+  static std::unique_ptr<ServerOptimizer> Create(const kwargs_t& kwargs,
+                                                 size_t len, int dtype);
+
+ protected:
+  ServerOptimizer(const kwargs_t& kwargs, size_t len, int dtype)
+      : _kwargs(kwargs), _len(len), _dtype(dtype) {}
+
+  float GetFloat(const std::string& name, float default_value) const {
+    auto it = _kwargs.find(name);
+    return it == _kwargs.end() ? default_value : atof(it->second.c_str());
+  }
+
+  // zero-filled state of the size of the weights
+  common::compressor::buffer_t NewState() const {
+    return common::compressor::AllocateBuffer(_len, true);
+  }
+
+  kwargs_t _kwargs;
+  size_t _len;
+  int _dtype;
+};
+
+// SGD with momentum and weight decay, as torch.optim.SGD without dampening
+class SGDOptimizer : public ServerOptimizer {
+ public:
+  SGDOptimizer(const kwargs_t& kwargs, size_t len, int dtype)
+      : ServerOptimizer(kwargs, len, dtype),
+        _lr(GetFloat("lr", 0.01)),
+        _momentum(GetFloat("momentum", 0)),
+        _weight_decay(GetFloat("weight_decay", 0)),
+        _nesterov(GetFloat("nesterov", 0) != 0) {
+    if (_momentum) _buf = NewState();
+  }
+
+  void Update(void* weight, const void* grad) override {
+    switch (_dtype) {
+      case common::BYTEPS_FLOAT32:
+        return UpdateImpl(reinterpret_cast<float*>(weight),
+                          reinterpret_cast<const float*>(grad));
+      case common::BYTEPS_FLOAT64:
+        return UpdateImpl(reinterpret_cast<double*>(weight),
+                          reinterpret_cast<const double*>(grad));
+      default:
+        CHECK(0) << "unsupported dtype for the server optimizer: " << _dtype;
+    }
+  }
+
+ private:
+  template <typename T>
+  void UpdateImpl(T* weight, const T* grad) {
+    auto buf = reinterpret_cast<T*>(_buf.get());
+    for (size_t i = 0; i < _len / sizeof(T); ++i) {
+      T d = grad[i] + _weight_decay * weight[i];
+      if (_momentum) {
+        // the buffer starts from the first gradient
+        buf[i] = _steps ? _momentum * buf[i] + d : d;
+        d = _nesterov ? d + _momentum * buf[i] : buf[i];
+      }
+      weight[i] -= _lr * d;
+    }
+    ++_steps;
+  }
+
+  float _lr;
+  float _momentum;
+  float _weight_decay;
+  bool _nesterov;
+  uint64_t _steps = 0;
+  common::compressor::buffer_t _buf;
+};
+
+// Adam with L2 weight decay, as torch.optim.Adam without amsgrad
+class AdamOptimizer : public ServerOptimizer {
+ public:
+  AdamOptimizer(const kwargs_t& kwargs, size_t len, int dtype)
+      : ServerOptimizer(kwargs, len, dtype),
+        _lr(GetFloat("lr", 0.001)),
+        _beta1(GetFloat("beta1", 0.9)),
+        _beta2(GetFloat("beta2", 0.999)),
+        _eps(GetFloat("eps", 1e-8)),
+        _weight_decay(GetFloat("weight_decay", 0)),
+        _m(NewState()),
+        _v(NewState()) {}
+
+  void Update(void* weight, const void* grad) override {
+    switch (_dtype) {
+      case common::BYTEPS_FLOAT32:
+        return UpdateImpl(reinterpret_cast<float*>(weight),
+                          reinterpret_cast<const float*>(grad));
+      case common::BYTEPS_FLOAT64:
+        return UpdateImpl(reinterpret_cast<double*>(weight),
+                          reinterpret_cast<const double*>(grad));
+      default:
+        CHECK(0) << "unsupported dtype for the server optimizer: " << _dtype;
+    }
+  }
+
+ private:
+  template <typename T>
+  void UpdateImpl(T* weight, const T* grad) {
+    auto m = reinterpret_cast<T*>(_m.get());
+    auto v = reinterpret_cast<T*>(_v.get());
+    ++_steps;
+    T bias1 = 1 - std::pow((T)_beta1, (T)_steps);
+    T bias2 = 1 - std::pow((T)_beta2, (T)_steps);
+    T step_size = _lr / bias1;
+    T sqrt_bias2 = std::sqrt(bias2);
+    for (size_t i = 0; i < _len / sizeof(T); ++i) {
+      T g = grad[i] + _weight_decay * weight[i];
+      m[i] = _beta1 * m[i] + (1 - _beta1) * g;
+      v[i] = _beta2 * v[i] + (1 - _beta2) * g * g;
+      weight[i] -= step_size * m[i] / (std::sqrt(v[i]) / sqrt_bias2 + _eps);
+    }
+  }
+
+  float _lr;
+  float _beta1;
+  float _beta2;
+  float _eps;
+  float _weight_decay;
+  uint64_t _steps = 0;
+  common::compressor::buffer_t _m;
+  common::compressor::buffer_t _v;
+};
+
+inline std::unique_ptr<ServerOptimizer> ServerOptimizer::Create(
+    const kwargs_t& kwargs, size_t len, int dtype) {
+  auto it = kwargs.find("type");
+  std::string type = it == kwargs.end() ? "" : it->second;
+  if (type == "sgd") {
+    return std::unique_ptr<ServerOptimizer>(
+        new SGDOptimizer(kwargs, len, dtype));
+  }
+  if (type == "adam") {
+    return std::unique_ptr<ServerOptimizer>(
+        new AdamOptimizer(kwargs, len, dtype));
+  }
+  return nullptr;
+}
+
+}  // namespace server
+}  // namespace byteps
+
+#endif  // BYTEPS_SERVER_OPTIMIZER_H
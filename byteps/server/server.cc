@@ -14,6 +14,7 @@
 // =============================================================================
 
 #include "server.h"
+#include "../common/affinity.h"
 #include "../common/compressor/utils.h"
 #include "queue.h"
 
@@ -26,87 +27,244 @@ using namespace ps;
 std::vector<PriorityQueue*> engine_queues_;
 std::vector<std::thread*> engine_threads_;
 
-BytePSArray* GetStore(uint64_t key) {
-  std::lock_guard<std::mutex> lock(store_mu_);
-  return &store_[key];
+uint64_t NowNs() {
+  return std::chrono::duration_cast<std::chrono::nanoseconds>(
+             std::chrono::steady_clock::now().time_since_epoch())
+      .count();
+}
+
+BytePSArray* GetStore(uint64_t key) { return store_.Get(key); }
+
+common::compressor::Compressor* GetCompressor(uint64_t key) {
+  auto compressor = compressor_map_.Find(key);
+  return compressor ? compressor->get() : nullptr;
+}
+
+// The NUMA node of the engine thread of a key, or -1.
+int GetNumaNode(uint64_t key, size_t len) {
+  if (!sync_mode_ || is_engine_blocking_ || engine_numa_node_.empty()) {
+    return -1;
+  }
+  return engine_numa_node_[GetThreadID(key, len)];
+}
+
+// Zero-filled memory that lives until the server shuts down.
+void* ArenaAllocate(size_t size, int numa_node) {
+  MemoryArena* arena;
+  {
+    std::lock_guard<std::mutex> lock(arena_mu_);
+    auto& slot = arenas_[numa_node];
+    if (!slot) {
+      slot.reset(new MemoryArena(arena_chunk_bytes_, arena_hugepage_,
+                                 numa_node));
+    }
+    arena = slot.get();
+  }
+  auto chunks = arena->num_chunks();
+  auto p = arena->Allocate(size, sysconf(_SC_PAGESIZE));
+  if (arena->num_chunks() != chunks) {
+    LOG(INFO) << "Server memory arena of NUMA node " << numa_node << ": "
+              << (arena->reserved() >> 20) << " MB in "
+              << arena->num_chunks() << " chunk(s)";
+  }
+  return p;
+}
+
+void* AllocateStore(uint64_t key, size_t size) {
+  void* p;
+  if (arena_chunk_bytes_) {
+    p = ArenaAllocate(size, GetNumaNode(key, size));
+  } else {
+    PageAlignedMalloc(&p, size);
+  }
+  return p;
+}
+
+ServerOptimizerState* GetOptimizer(uint64_t key) {
+  auto state = optimizer_map_.Find(key);
+  return (state && state->optimizer) ? state : nullptr;
+}
+
+// The first push of every worker to a key with a server-side optimizer
+// carries its initial weights, of which the store keeps the first. Later
+// pushes are gradients.
+void ApplyOptimizer(ServerOptimizerState* state, BytePSArray* stored,
+                    const char* recved, int sender) {
+  if (state->initialized.insert(sender).second) {
+    if (state->initialized.size() == 1) {
+      bps_reducer_->copy(stored->tensor, recved, stored->len);
+    }
+    return;
+  }
+  state->optimizer->Update(stored->tensor, recved);
+}
+
+uint64_t GetBatchId(const ps::KVMeta& req) {
+  return (static_cast<uint64_t>(req.sender) << 32) |
+         static_cast<uint32_t>(req.timestamp);
+}
+
+// Records the response of `key` if `req` is a multi-key request, and sends
+// the whole response after the last key. Returns false for single-key
+// requests, which are responded as before.
+bool AddBatchResponse(uint64_t key, const ps::KVMeta& req, const char* data,
+                      size_t len, ps::KVServer<char>* server) {
+  if (!num_batch_response_.load()) return false;
+  std::lock_guard<std::mutex> lock(batch_mu_);
+  auto iterator = batch_response_.find(GetBatchId(req));
+  if (iterator == batch_response_.end()) return false;
+  auto& batch = iterator->second;
+  if (!req.push) {
+    auto& val = batch.vals[batch.index.at(key)];
+    val.CopyFrom(data, len);
+  }
+  if (--batch.pending) return true;
+
+  ps::KVPairs<char> response;
+  if (!req.push) {
+    response.keys.resize(batch.vals.size());
+    response.lens.resize(batch.vals.size());
+    size_t total = 0;
+    for (auto& val : batch.vals) total += val.size();
+    response.vals.resize(total);
+    for (auto& it : batch.index) {
+      response.keys[it.second] = EncodeKey(it.first);
+    }
+    size_t offset = 0;
+    for (size_t i = 0; i < batch.vals.size(); ++i) {
+      response.lens[i] = batch.vals[i].size();
+      memcpy(response.vals.data() + offset, batch.vals[i].data(),
+             batch.vals[i].size());
+      offset += batch.vals[i].size();
+    }
+  }
+  server->Response(batch.req_meta, response);
+  batch_response_.erase(iterator);
+  num_batch_response_.fetch_sub(1);
+  return true;
 }
 
 void SendPushResponse(uint64_t key, const ps::KVMeta& req,
                       ps::KVServer<char>* server) {
-  auto iterator = push_response_map_.find(key);
-  if (iterator == push_response_map_.end()) {  // new key
-    ps::KVPairs<char> response;
-    push_response_map_[key] = response;  // add to the map
-    server->Response(req, response);
-  } else {  // not new key, then reuse the memory address to avoid ibv_reg_mr on
-            // RDMA data path
-    ps::KVPairs<char>* response = &iterator->second;
-    server->Response(req, *response);
-  }
+  if (AddBatchResponse(key, req, nullptr, 0, server)) return;
+  // reuse the memory address to avoid ibv_reg_mr on RDMA data path
+  server->Response(req, *push_response_map_.Get(key));
 }
 
-void SendPullResponse(const DataHandleType type, const uint64_t key,
-                      const ps::KVMeta& req_meta, ps::KVServer<char>* server) {
-  std::lock_guard<std::mutex> lock(pullresp_mu_);
-  auto& updates = update_buf_[key];
+// Sends the merged value of a key to all `reqs`. Every pull of every worker
+// and round is answered with the same KVPairs, whose values share the merged
+// buffer without a copy; it is only rebuilt if that buffer changes. ps-lite
+// still sends, and serializes the meta of, one message per request.
+void SendPullResponses(const DataHandleType type, const uint64_t key,
+                       const std::vector<ps::KVMeta>& reqs,
+                       ps::KVServer<char>* server) {
+  if (reqs.empty()) return;
+  // the pulls of a key are responded either by the request handler or under
+  // the flag_mu_ of its engine thread, never concurrently
+  auto& updates = *update_buf_.Get(key);
   CHECK(updates.merged.tensor) << "init " << key << " first";
   char* data = updates.merged.tensor;
   auto len = updates.merged.len;
 
-  // send pull response
-  auto iterator = pull_response_map_.find(key);
-  if (iterator == pull_response_map_.end()) {  // new key
-    ps::KVPairs<char> response;
-    response.keys = {EncodeKey(key)};
-    response.lens = {len};
-    response.vals = ps::SArray<char>(data, len, false);  // zero copy
-    pull_response_map_[key] = response;                  // add to the map
-    server->Response(req_meta, response);
-  } else {  // not new key, then reuse the memory address to avoid ibv_reg_mr on
-            // RDMA data path
-    ps::KVPairs<char>* response = &iterator->second;
-
-    auto p = static_cast<char*>(data);
-    CHECK(p);
+  // reuse the memory address to avoid ibv_reg_mr on RDMA data path
+  auto response = pull_response_map_.Get(key);
+  if (response->vals.data() != data || response->vals.size() != len) {
+    response->keys = {EncodeKey(key)};
     response->lens = {len};
-    response->vals = ps::SArray<char>(p, len, false);
+    response->vals = ps::SArray<char>(data, len, false);  // zero copy
+  }
+  for (const auto& req_meta : reqs) {
+    if (AddBatchResponse(key, req_meta, data, len, server)) continue;
     server->Response(req_meta, *response);
   }
 }
 
+void SendPullResponse(const DataHandleType type, const uint64_t key,
+                      const ps::KVMeta& req_meta, ps::KVServer<char>* server) {
+  SendPullResponses(type, key, std::vector<ps::KVMeta>(1, req_meta), server);
+}
+
+// Responds to the registration requests of a key once all workers have sent
+// theirs.
+void RespondAfterAllWorkers(uint64_t key, const ps::KVMeta& req_meta,
+                            ps::KVServer<char>* server) {
+  // buffer the request meta
+  auto& updates = *update_buf_.Get(key);
+  updates.request.push_back(req_meta);
+  // should send response after collecting all init push
+  if (updates.request.size() < (size_t)ps::NumWorkers()) return;
+
+  for (const auto& req : updates.request) {
+    SendPushResponse(key, req, server);
+  }
+  updates.request.clear();
+}
+
+// Sums the staged pushes into dst in one pass. For the first pushes of a
+// round dst is overwritten, otherwise they are added to it.
+void SumStaged(void* dst, const std::vector<ps::KVPairs<char> >& staged,
+               bool overwrite, size_t len, int dtype) {
+  std::vector<const void*> srcs;
+  if (!overwrite) srcs.push_back(dst);
+  for (auto& push : staged) srcs.push_back(push.vals.data());
+  CHECK_GE(bps_reducer_->sum(dst, srcs.data(), srcs.size(), len,
+                             bps_reducer_->GetDataType(dtype)),
+           0);
+}
+
+// Counts a sum of `bytes` that started at `start` for the statistics.
+void CountSum(size_t tid, KeyStats* key_stats, uint64_t start, size_t bytes) {
+  auto ns = NowNs() - start;
+  engine_stats_[tid].sum_ns.fetch_add(ns, std::memory_order_relaxed);
+  engine_stats_[tid].sum_bytes.fetch_add(bytes, std::memory_order_relaxed);
+  key_stats->sum_ns.fetch_add(ns, std::memory_order_relaxed);
+}
+
 void BytePSServerEngineThread(int i) {
+  common::PinThread("engine", i);
   auto& q = engine_queues_[i];
+  auto& stats = engine_stats_[i];
   while (true) {
     BytePSEngineMessage msg;
     q->WaitAndPop(&msg);
     if (msg.ops == TERMINATE) break;
+    auto start = NowNs();
+    stats.queued.fetch_sub(1, std::memory_order_relaxed);
+    stats.num_messages.fetch_add(1, std::memory_order_relaxed);
+    auto key_stats = key_stats_.Get(msg.key);
     // do some check
     CHECK(msg.dst);
     CHECK(msg.src);
 
-    auto iter = compressor_map_.find(msg.key);
-    if (iter != compressor_map_.end()) {
+    auto compressor = GetCompressor(msg.key);
+    if (compressor) {
       // compress
       if (msg.ops == ALL_RECV) {
         common::compressor::tensor_t grad(reinterpret_cast<char*>(msg.src),
                                           msg.len, msg.type.dtype);
-        auto compressed = iter->second->Compress(grad);
+        auto compressed = compressor->Compress(grad);
         // 1. compress
-        auto& updates = update_buf_[msg.key];
+        auto& updates = *update_buf_.Get(msg.key);
         updates.merged.tensor = compressed.data;
         updates.merged.len = compressed.size;
+        auto ns = NowNs() - start;
+        stats.compress_ns.fetch_add(ns, std::memory_order_relaxed);
+        key_stats->compress_ns.fetch_add(ns, std::memory_order_relaxed);
       } else {  // decompress
         auto compressed_len = msg.sarray.lens[0];
         CHECK_LE(compressed_len, msg.len);
         common::compressor::tensor_t compressed(
             reinterpret_cast<char*>(msg.src), compressed_len, msg.type.dtype);
-        auto decompressed = iter->second->Decompress(compressed);
+        auto decompressed = compressor->Decompress(compressed);
         msg.src = decompressed.data;
+        auto ns = NowNs() - start;
+        stats.decompress_ns.fetch_add(ns, std::memory_order_relaxed);
+        key_stats->decompress_ns.fetch_add(ns, std::memory_order_relaxed);
       }
     } else {
       if (msg.ops == ALL_RECV) {
         // 2. no compress
-        auto& updates = update_buf_[msg.key];
+        auto& updates = *update_buf_.Get(msg.key);
         updates.merged.tensor = reinterpret_cast<char*>(msg.src);
         updates.merged.len = msg.len;
       }
@@ -125,7 +283,13 @@ void BytePSServerEngineThread(int i) {
                     << "src_addr: " << DEBUG_PRINT_TENSOR_ADDRESS(msg.src)
                     << "\t";
         }
-        bps_reducer_->copy(msg.dst, msg.src, msg.len);
+        if (msg.staged.empty()) {
+          bps_reducer_->copy(msg.dst, msg.src, msg.len);
+        } else {
+          auto sum_start = NowNs();
+          SumStaged(msg.dst, msg.staged, true, msg.len, msg.type.dtype);
+          CountSum(i, key_stats, sum_start, msg.len * msg.staged.size());
+        }
         if (is_debug) {
           std::lock_guard<std::mutex> lock(debug_mu_);
           LOG(INFO) << "stage: ENGINE_COPY_MERGED_TO_STORE_AFTER \t"
@@ -140,31 +304,28 @@ void BytePSServerEngineThread(int i) {
 
       case ALL_RECV: {
         std::lock_guard<std::mutex> lock(flag_mu_[i]);
-        if (is_push_finished_[i].find(msg.key) == is_push_finished_[i].end()) {
-          is_push_finished_[i][msg.key] = false;
-          pull_cnt_[i][msg.key] = 0;
-          seen_sender_[i][msg.key].clear();
-        }
-        is_push_finished_[i][msg.key] = true;
-
-        auto it = q_pull_reqmeta_[i][msg.key].begin();
-        while (it != q_pull_reqmeta_[i][msg.key].end()) {
-          if (seen_sender_[i][msg.key].find(it->sender) ==
-              seen_sender_[i][msg.key].end()) {
-            SendPullResponse(msg.type, msg.key, *it, byteps_server_);
-            pull_cnt_[i][msg.key] += 1;
-            seen_sender_[i][msg.key].insert(it->sender);
-            it = q_pull_reqmeta_[i][msg.key].erase(it);
-          } else {
-            ++it;
-          }
-          if (pull_cnt_[i][msg.key] == (size_t)ps::NumWorkers()) {
-            is_push_finished_[i][msg.key] = false;
-            pull_cnt_[i][msg.key] = 0;
-            seen_sender_[i][msg.key].clear();
-            break;
+        auto& pulls = *pull_state_.Get(msg.key);
+        pulls.push_finished = true;
+
+        // each waiting pull is looked at once, those of workers that already
+        // got this round go back to the ring for the next one
+        std::vector<ps::KVMeta> ready;
+        uint64_t wait_ns = 0;
+        auto now = NowNs();
+        for (size_t n = pulls.num_pending(); n > 0 && pulls.push_finished;
+             --n) {
+          auto pull = pulls.PopPending();
+          auto rank = ps::Postoffice::IDtoRank(pull.req_meta.sender);
+          if (pulls.HasResponded(rank)) {
+            pulls.PushPending(pull.req_meta, pull.arrival_ns);
+            continue;
           }
+          wait_ns += now - pull.arrival_ns;
+          ready.push_back(std::move(pull.req_meta));
+          pulls.MarkResponded(rank);
         }
+        SendPullResponses(msg.type, msg.key, ready, byteps_server_);
+        key_stats->pull_wait_ns.fetch_add(wait_ns, std::memory_order_relaxed);
       } break;
 
       case SUM_RECV: {
@@ -179,7 +340,14 @@ void BytePSServerEngineThread(int i) {
                     << "src_addr: " << DEBUG_PRINT_TENSOR_ADDRESS(msg.src)
                     << "\t";
         }
-        CHECK_GE(bps_reducer_->sum(msg.dst, msg.src, msg.len, bps_type), 0);
+        auto sum_start = NowNs();
+        if (msg.staged.empty()) {
+          CHECK_GE(bps_reducer_->sum(msg.dst, msg.src, msg.len, bps_type), 0);
+          CountSum(i, key_stats, sum_start, msg.len);
+        } else {
+          SumStaged(msg.dst, msg.staged, false, msg.len, msg.type.dtype);
+          CountSum(i, key_stats, sum_start, msg.len * msg.staged.size());
+        }
         if (is_debug) {
           std::lock_guard<std::mutex> lock(debug_mu_);
           LOG(INFO) << "stage: ENGINE_SUM_RECV_AFTER \t"
@@ -194,13 +362,272 @@ void BytePSServerEngineThread(int i) {
       default:
         CHECK(0);
     }
+
+    auto busy = NowNs() - start;
+    engine_busy_ns_[i].fetch_add(busy);
+    if (msg.engine_key) {
+      msg.engine_key->busy_ns.fetch_add(busy);
+      msg.engine_key->inflight.fetch_sub(1);
+    }
   }
 }  // namespace server
 
-void BytePSHandler(const ps::KVMeta& req_meta,
-                   const ps::KVPairs<char>& req_data,
-                   ps::KVServer<char>* server) {
-  std::lock_guard<std::mutex> lock(handle_mu_);  // push & pull may have racing
+void PushToEngine(size_t tid, BytePSEngineMessage& msg) {
+  msg.engine_key = GetEngineKey(msg.key);
+  msg.engine_key->inflight.fetch_add(1);
+  engine_stats_[tid].queued.fetch_add(1, std::memory_order_relaxed);
+  engine_queues_[tid]->Push(msg);
+}
+
+bool IsStaged(uint64_t key) {
+  return stage_pushes_ > 1 && !is_engine_blocking_ && !GetCompressor(key) &&
+         !GetOptimizer(key);
+}
+
+// Sums the staged pushes of a key into the store, by its engine thread in
+// synchronous mode, or right away in asynchronous mode.
+void FlushStaged(uint64_t key) {
+  auto& updates = *update_buf_.Get(key);
+  if (updates.staged.empty()) return;
+  auto stored = GetStore(key);
+  num_staged_pushes_ += updates.staged.size();
+  ++num_staged_passes_;
+  if (sync_mode_) {
+    auto tid = GetThreadID(key, stored->len);
+    BytePSEngineMessage msg = {timestamp_++,
+                               updates.staged_type,
+                               key,
+                               stored->tensor,
+                               updates.staged[0].vals.data(),
+                               stored->len,
+                               updates.staged_first ? COPY_FIRST : SUM_RECV};
+    msg.staged.swap(updates.staged);
+    PushToEngine(tid, msg);
+  } else {
+    SumStaged(stored->tensor, updates.staged, false, stored->len,
+              stored->dtype);
+  }
+  updates.staged.clear();
+  updates.staged_first = false;
+  updates.staged_since_ns = 0;
+  staged_keys_.erase(key);
+}
+
+// Stages a push, and sums the staged pushes once there are
+// BYTEPS_SERVER_STAGE_PUSHES of them or the round is complete.
+void StagePush(uint64_t key, DataHandleType type,
+               const ps::KVPairs<char>& req_data) {
+  auto& updates = *update_buf_.Get(key);
+  if (updates.staged.empty()) {
+    updates.staged_type = type;
+    updates.staged_first = sync_mode_ && updates.request.empty();
+    updates.staged_since_ns = NowNs();
+    staged_keys_.insert(key);
+  }
+  updates.staged.push_back(req_data);
+  if (updates.staged.size() >= stage_pushes_ ||
+      (sync_mode_ &&
+       updates.request.size() + 1 == (size_t)ps::NumWorkers())) {
+    FlushStaged(key);
+  }
+}
+
+// Flushes the staged pushes that have waited BYTEPS_SERVER_STAGE_DEADLINE_US,
+// and returns the time until the next of the others is due.
+uint64_t FlushExpiredStages() {
+  uint64_t next = stage_deadline_ns_;
+  if (staged_keys_.empty()) return next;
+  auto now = NowNs();
+  std::vector<uint64_t> expired;
+  for (auto key : staged_keys_) {
+    auto waited = now - update_buf_.Get(key)->staged_since_ns;
+    if (waited >= stage_deadline_ns_) {
+      expired.push_back(key);
+    } else {
+      next = std::min(next, stage_deadline_ns_ - waited);
+    }
+  }
+  for (auto key : expired) FlushStaged(key);
+  return next;
+}
+
+// Flushes the staged pushes at their deadline, as a round may get no more
+// requests until they are summed, e.g., when the rest of the workers are
+// late or in asynchronous training without a pull. A push staged while the
+// thread waits a whole deadline is summed within twice the deadline.
+void BytePSServerStageThread() {
+  std::unique_lock<std::mutex> lock(stage_mu_);
+  uint64_t next = stage_deadline_ns_;
+  // at most once per microsecond with a deadline of 0
+  while (!stage_cv_.wait_for(
+      lock, std::chrono::nanoseconds(std::max<uint64_t>(next, 1000)),
+      [] { return stage_stop_; })) {
+    std::lock_guard<std::mutex> handle_lock(handle_mu_);
+    next = FlushExpiredStages();
+  }
+}
+
+// The number of pushes of the slowest worker to a key.
+uint64_t MinClock(const StalenessState& state) {
+  if (state.clock.size() < (size_t)ps::NumWorkers()) return 0;
+  auto min_clock = std::numeric_limits<uint64_t>::max();
+  for (auto& it : state.clock) min_clock = std::min(min_clock, it.second);
+  return min_clock;
+}
+
+// Whether a worker is at most BYTEPS_SERVER_STALENESS rounds ahead of the
+// slowest one.
+bool IsWithinStaleness(const StalenessState& state, int sender,
+                       uint64_t min_clock) {
+  auto it = state.clock.find(sender);
+  auto clock = (it == state.clock.end()) ? 0 : it->second;
+  return clock <= min_clock + staleness_;
+}
+
+void SendAsyncPullResponse(const DataHandleType type, uint64_t key,
+                           const ps::KVMeta& req_meta,
+                           ps::KVServer<char>* server) {
+  // the worker should see its own pushes
+  FlushStaged(key);
+  SendPullResponse(type, key, req_meta, server);
+}
+
+// Counts a push of a worker in asynchronous training with bounded
+// staleness, and responds to the pulls that are no longer held back by the
+// slowest worker.
+void AdvanceClock(const DataHandleType type, uint64_t key, int sender,
+                  ps::KVServer<char>* server) {
+  auto& state = *staleness_map_.Get(key);
+  ++state.clock[sender];
+  if (state.blocked_pulls.empty()) return;
+  auto min_clock = MinClock(state);
+  auto key_stats = key_stats_.Get(key);
+  auto it = state.blocked_pulls.begin();
+  while (it != state.blocked_pulls.end()) {
+    if (!IsWithinStaleness(state, it->sender, min_clock)) {
+      ++it;
+      continue;
+    }
+    auto arrival = key_stats->pull_arrival_ns.find(it->sender);
+    if (arrival != key_stats->pull_arrival_ns.end()) {
+      key_stats->pull_wait_ns.fetch_add(NowNs() - arrival->second,
+                                        std::memory_order_relaxed);
+      key_stats->pull_arrival_ns.erase(arrival);
+    }
+    SendAsyncPullResponse(type, key, *it, server);
+    it = state.blocked_pulls.erase(it);
+  }
+}
+
+// Records how late a push arrives after the first one of its round, and
+// warns about workers beyond BYTEPS_SERVER_STRAGGLER_THRESHOLD_MS.
+void RecordLateness(uint64_t key, UpdateBuf& updates, int sender) {
+  auto now = NowNs();
+  if (updates.request.empty()) updates.round_start_ns = now;
+  auto rank = ps::Postoffice::IDtoRank(sender);
+  CHECK_LT(rank, ps::NumWorkers());
+  auto& lateness = worker_lateness_[rank];
+  auto ns = now - updates.round_start_ns;
+  lateness.num_pushes.fetch_add(1, std::memory_order_relaxed);
+  lateness.sum_ns.fetch_add(ns, std::memory_order_relaxed);
+  if (ns > lateness.max_ns.load(std::memory_order_relaxed)) {
+    lateness.max_ns.store(ns, std::memory_order_relaxed);
+  }
+  if (updates.request.size() + 1 == (size_t)ps::NumWorkers()) {
+    lateness.num_last.fetch_add(1, std::memory_order_relaxed);
+  }
+  int bucket = 0;
+  for (auto us = ns / 1000; us > 1 && bucket + 1 < WorkerLateness::kBuckets;
+       us >>= 1) {
+    ++bucket;
+  }
+  lateness.buckets[bucket].fetch_add(1, std::memory_order_relaxed);
+
+  // at most one warning per worker and second
+  if (straggler_threshold_ns_ && ns > straggler_threshold_ns_ &&
+      now - lateness.last_warning_ns > 1000000000ULL) {
+    lateness.last_warning_ns = now;
+    LOG(WARNING) << "Worker " << rank << " pushed key=" << key << " "
+                 << ns / 1000000 << "ms after the first worker";
+  }
+}
+
+// Measures the load of the engine threads once per interval, and plans to
+// move the key that best evens out the busiest and the idlest thread. The
+// key moves at the start of its next round, see MaybeMigrateKey().
+void MaybeRebalance() {
+  auto now = NowNs();
+  if (now - last_rebalance_ns_ < rebalance_interval_ns_) return;
+  last_rebalance_ns_ = now;
+
+  std::vector<uint64_t> busy(engine_thread_num_);
+  uint64_t total = 0;
+  size_t busiest = 0, idlest = 0;
+  for (size_t i = 0; i < engine_thread_num_; ++i) {
+    auto ns = engine_busy_ns_[i].load();
+    busy[i] = ns - engine_last_busy_ns_[i];
+    engine_last_busy_ns_[i] = ns;
+    total += busy[i];
+    if (busy[i] > busy[busiest]) busiest = i;
+    if (busy[i] < busy[idlest]) idlest = i;
+  }
+
+  std::unordered_map<uint64_t, uint64_t> key_busy;
+  hash_cache_.ForEach([&](uint64_t key, EngineKey* engine_key) {
+    auto ns = engine_key->busy_ns.load();
+    if (engine_key->tid.load(std::memory_order_acquire) == busiest) {
+      key_busy[key] = ns - engine_key->last_busy_ns;
+    }
+    engine_key->last_busy_ns = ns;
+  });
+  if (!total) return;
+
+  double mean = (double)total / engine_thread_num_;
+  last_imbalance_ = busy[busiest] / mean;
+  if (!first_imbalance_) first_imbalance_.store(last_imbalance_);
+  if (!enable_rebalance_ || last_imbalance_ <= rebalance_threshold_) return;
+
+  // the largest key that does not make the idlest thread the new busiest
+  uint64_t gap = busy[busiest] - busy[idlest];
+  uint64_t best_key = 0, best_busy = 0;
+  for (auto& it : key_busy) {
+    if (it.second < gap && it.second > best_busy) {
+      best_key = it.first;
+      best_busy = it.second;
+    }
+  }
+  if (!best_busy) return;
+  std::lock_guard<std::mutex> lock(hash_mu_);
+  GetEngineKey(best_key)->migrate_to.store(idlest, std::memory_order_release);
+  LOG(INFO) << "Engine load imbalance " << last_imbalance_
+            << " (max/mean busy time), move key=" << best_key
+            << " from engine thread " << busiest << " to " << idlest;
+}
+
+// Moves a key planned by MaybeRebalance() to its new engine thread. Only
+// done at the first push of a round, with no engine message or pull of the
+// key pending, so that all state of the round stays on one thread.
+void MaybeMigrateKey(uint64_t key) {
+  auto engine_key = GetEngineKey(key);
+  int to = engine_key->migrate_to.load(std::memory_order_acquire);
+  if (to < 0 || engine_key->inflight.load()) return;
+  size_t from = engine_key->tid.load(std::memory_order_acquire);
+  {
+    std::lock_guard<std::mutex> lock(flag_mu_[from]);
+    auto pulls = pull_state_.Find(key);
+    if (pulls && !pulls->IsIdle()) return;
+  }
+  std::lock_guard<std::mutex> lock(hash_mu_);
+  engine_key->tid.store(to, std::memory_order_release);
+  engine_key->migrate_to.store(-1, std::memory_order_release);
+  acc_load_[from] -= engine_key->len;
+  acc_load_[to] += engine_key->len;
+  ++num_key_migrations_;
+}
+
+void BytePSHandleKey(const ps::KVMeta& req_meta,
+                     const ps::KVPairs<char>& req_data,
+                     ps::KVServer<char>* server) {
   DataHandleType type = DepairDataHandleType(req_meta.cmd);
   // CHECK_EQ(type.requestType, RequestType::kDefaultPushPull);
   // do some check
@@ -221,33 +648,48 @@ void BytePSHandler(const ps::KVMeta& req_meta,
 
   // register compressor
   if (type.requestType == RequestType::kCompressedPushPull) {
-    if (compressor_map_.find(key) == compressor_map_.end()) {
+    if (!GetCompressor(key)) {
       std::string content{reinterpret_cast<char*>(req_data.vals.data()),
                           static_cast<size_t>(req_data.lens[0])};
       auto kwargs = byteps::common::compressor::Deserialize(content);
       auto stored = GetStore(key);
       size_t aligned_size = byteps::common::Align(stored->len, stored->dtype);
+      // the buffers of the compressor are allocated by the constructors
+      compressor_numa_node_ = GetNumaNode(key, stored->len);
       auto compressor_ptr =
           byteps::common::compressor::CompressorRegistry::Create(
               kwargs, aligned_size,
               static_cast<byteps::common::DataType>(stored->dtype));
       CHECK_NE(compressor_ptr, nullptr);
-      compressor_map_[key] = std::move(compressor_ptr);
+      *compressor_map_.Get(key) = std::move(compressor_ptr);
       if (log_key_info_) {
         LOG(INFO) << "register compressor for key=" << key;
       }
     }
+    RespondAfterAllWorkers(key, req_meta, server);
+    return;
+  }
 
-    // buffer the request meta
-    auto& updates = update_buf_[key];
-    updates.request.push_back(req_meta);
-    // should send response after collecting all init push
-    if (updates.request.size() < (size_t)ps::NumWorkers()) return;
-
-    for (const auto& req : updates.request) {
-      SendPushResponse(key, req, server);
+  // register the server-side optimizer
+  if (type.requestType == RequestType::kServerOptimizer) {
+    CHECK(!sync_mode_)
+        << "the server-side optimizer is only for asynchronous training";
+    auto& state = *optimizer_map_.Get(key);
+    if (!state.optimizer) {
+      std::string content{reinterpret_cast<char*>(req_data.vals.data()),
+                          static_cast<size_t>(req_data.lens[0])};
+      auto kwargs = byteps::common::compressor::Deserialize(content);
+      auto stored = GetStore(key);
+      state.optimizer =
+          ServerOptimizer::Create(kwargs, stored->len, stored->dtype);
+      CHECK(state.optimizer) << "unknown server optimizer \"" << kwargs["type"]
+                             << "\" for key=" << key;
+      if (log_key_info_) {
+        LOG(INFO) << "register " << kwargs["type"]
+                  << " optimizer for key=" << key;
+      }
     }
-    updates.request.clear();
+    RespondAfterAllWorkers(key, req_meta, server);
     return;
   }
 
@@ -259,12 +701,12 @@ void BytePSHandler(const ps::KVMeta& req_meta,
     auto recved = reinterpret_cast<char*>(req_data.vals.data());
 
     if (!stored->tensor) {
-      if (sync_mode_ && (update_buf_.find(key) == update_buf_.end())) {
-        update_buf_[key].merged.len = len;
-        update_buf_[key].merged.dtype = type.dtype;
+      if (sync_mode_ && !update_buf_.Find(key)) {
+        update_buf_.Get(key)->merged.len = len;
+        update_buf_.Get(key)->merged.dtype = type.dtype;
       }
       // buffer the request meta
-      auto& updates = update_buf_[key];
+      auto& updates = *update_buf_.Get(key);
       updates.request.push_back(req_meta);
       // should send response after collecting all init push
       if (updates.request.size() < (size_t)ps::NumWorkers()) return;
@@ -276,21 +718,41 @@ void BytePSHandler(const ps::KVMeta& req_meta,
       }
       // init stored buffer, use page aligned memory
       size_t aligned_size = common::Align(len, type.dtype);
-      PageAlignedMalloc((void**)&stored->tensor, aligned_size);
+      stored->tensor = (char*)AllocateStore(key, aligned_size);
       stored->len = len;
       stored->dtype = type.dtype;
       CHECK(stored->tensor);
 
       bps_reducer_->copy(stored->tensor, recved,
                          len);  // we may not need this copy
+      if (!sync_mode_) {
+        // asynchronous pulls return the store itself
+        updates.merged.tensor = stored->tensor;
+        updates.merged.len = len;
+        updates.merged.dtype = type.dtype;
+      }
       for (const auto& req : updates.request) {
         SendPushResponse(key, req, server);
       }
       updates.request.clear();
     } else {
-      auto& updates = update_buf_[key];
+      auto key_stats = key_stats_.Get(key);
+      key_stats->push_bytes.fetch_add(len, std::memory_order_relaxed);
+      key_stats->num_pushes.fetch_add(1, std::memory_order_relaxed);
+      auto& updates = *update_buf_.Get(key);
+      if (sync_mode_) RecordLateness(key, updates, req_meta.sender);
       auto tid = GetThreadID(key, len);
-      if (updates.request.empty()) {  // from the first incoming worker
+      if (sync_mode_ && !is_engine_blocking_ && updates.request.empty()) {
+        MaybeRebalance();
+        MaybeMigrateKey(key);
+        tid = GetThreadID(key, len);
+      }
+      if (IsStaged(key)) {
+        if (updates.request.empty()) {
+          updates.merged.tmp_sarray = req_data;
+        }
+        StagePush(key, type, req_data);
+      } else if (updates.request.empty()) {  // from the first incoming worker
         if (sync_mode_) {
           if (debug_mode_ && (debug_key_ == key)) {
             std::lock_guard<std::mutex> lock(debug_mu_);
@@ -306,7 +768,9 @@ void BytePSHandler(const ps::KVMeta& req_meta,
           BytePSEngineMessage msg = {timestamp_++,   type,     key,
                                      stored->tensor, recved,   stored->len,
                                      COPY_FIRST,     req_data, req_meta};
-          engine_queues_[tid]->Push(msg);
+          PushToEngine(tid, msg);
+        } else if (GetOptimizer(key)) {  // async mode, update the weights
+          ApplyOptimizer(GetOptimizer(key), stored, recved, req_meta.sender);
         } else {  // async mode, directly add to the buffer
           CHECK_GE(bps_reducer_->sum((void*)stored->tensor, (void*)recved, len,
                                      bps_reducer_->GetDataType(stored->dtype)),
@@ -334,7 +798,7 @@ void BytePSHandler(const ps::KVMeta& req_meta,
           BytePSEngineMessage msg = {timestamp_++,   type,     key,
                                      stored->tensor, recved,   stored->len,
                                      SUM_RECV,       req_data, req_meta};
-          engine_queues_[tid]->Push(msg);
+          PushToEngine(tid, msg);
         }
       }
       // add a worker information (request.size() is the # workers received)
@@ -359,51 +823,206 @@ void BytePSHandler(const ps::KVMeta& req_meta,
           BytePSEngineMessage msg = {
               timestamp_++,   type,        key,     stored->tensor,
               stored->tensor, stored->len, ALL_RECV};
-          engine_queues_[tid]->Push(msg);
+          PushToEngine(tid, msg);
           engine_queues_[tid]->ClearCounter(key);
         }
         updates.request.clear();
       } else if (!sync_mode_) {
         // async: clean the request buffer
         updates.request.clear();
+        if (staleness_ >= 0) AdvanceClock(type, key, req_meta.sender, server);
       }
     }
   } else {  // pull request
     auto stored = GetStore(key);
     CHECK(stored->tensor) << "Should init the buffer for key=" << key
                           << " first";
-    if (is_engine_blocking_ || !sync_mode_) {
+    key_stats_.Get(key)->num_pulls.fetch_add(1, std::memory_order_relaxed);
+    if (!sync_mode_) {
+      auto state = (staleness_ >= 0) ? staleness_map_.Get(key) : nullptr;
+      if (state &&
+          !IsWithinStaleness(*state, req_meta.sender, MinClock(*state))) {
+        // wait for the slowest worker to catch up
+        state->blocked_pulls.push_back(req_meta);
+        key_stats_.Get(key)->pull_arrival_ns[req_meta.sender] = NowNs();
+      } else {
+        SendAsyncPullResponse(type, key, req_meta, server);
+      }
+    } else if (is_engine_blocking_) {
       SendPullResponse(type, key, req_meta, server);
     } else {
       auto tid = GetThreadID(key, 0);
       std::lock_guard<std::mutex> lock(flag_mu_[tid]);
-      if (is_push_finished_[tid].find(key) == is_push_finished_[tid].end()) {
-        is_push_finished_[tid][key] = false;
-        pull_cnt_[tid][key] = 0;
-        seen_sender_[tid][key].clear();
-      }
-
-      auto it = seen_sender_[tid][key].find(req_meta.sender);
-      if (is_push_finished_[tid][key] && (it == seen_sender_[tid][key].end())) {
+      auto& pulls = *pull_state_.Get(key);
+      auto rank = ps::Postoffice::IDtoRank(req_meta.sender);
+      CHECK_LT(rank, ps::NumWorkers());
+      if (pulls.push_finished && !pulls.HasResponded(rank)) {
         // push already finished && not received the associated pull response
         // yet
         SendPullResponse(type, key, req_meta, server);
-        pull_cnt_[tid][key] += 1;
-        seen_sender_[tid][key].insert(req_meta.sender);
-
-        if (pull_cnt_[tid][key] == (size_t)ps::NumWorkers()) {
-          is_push_finished_[tid][key] = false;
-          pull_cnt_[tid][key] = 0;
-          seen_sender_[tid][key].clear();
-        }
+        pulls.MarkResponded(rank);
       } else {
         // push not finished, put into the queue, and wait for the engine
-        q_pull_reqmeta_[tid][key].push_back(req_meta);
+        pulls.PushPending(req_meta, NowNs());
       }
     }
   }
 }
 
+void BytePSHandler(const ps::KVMeta& req_meta,
+                   const ps::KVPairs<char>& req_data,
+                   ps::KVServer<char>* server) {
+  std::lock_guard<std::mutex> lock(handle_mu_);  // push & pull may have racing
+  FlushExpiredStages();
+  if (req_data.keys.size() == 1) {
+    BytePSHandleKey(req_meta, req_data, server);
+    return;
+  }
+
+  // a multi-key request (BYTEPS_BATCH_BYTES on the worker), handled as one
+  // request per key and responded once
+  DataHandleType type = DepairDataHandleType(req_meta.cmd);
+  CHECK(type.requestType == RequestType::kDefaultPushPull)
+      << "only default push/pull can be batched";
+  auto num_keys = req_data.keys.size();
+  CHECK_GT(num_keys, 1);
+  {
+    std::lock_guard<std::mutex> lock(batch_mu_);
+    auto& batch = batch_response_[GetBatchId(req_meta)];
+    CHECK_EQ(batch.index.size(), 0) << "duplicated request id";
+    batch.req_meta = req_meta;
+    batch.pending = num_keys;
+    batch.vals.resize(req_meta.push ? 0 : num_keys);
+    for (size_t i = 0; i < num_keys; ++i) {
+      batch.index[DecodeKey(req_data.keys[i])] = i;
+    }
+    num_batch_response_.fetch_add(1);
+  }
+  if (req_meta.push) {
+    CHECK_EQ(req_data.lens.size(), num_keys);
+  }
+  size_t offset = 0;
+  for (size_t i = 0; i < num_keys; ++i) {
+    ps::KVPairs<char> key_data;
+    key_data.keys = req_data.keys.segment(i, i + 1);
+    if (req_meta.push) {
+      key_data.lens = req_data.lens.segment(i, i + 1);
+      key_data.vals = req_data.vals.segment(offset, offset + req_data.lens[i]);
+      offset += req_data.lens[i];
+    }
+    BytePSHandleKey(req_meta, key_data, server);
+  }
+}
+
+// Writes the counters of the engine threads, the hottest keys (by engine
+// time, then by pushed bytes) and the server as one JSON line.
+void WriteStats(std::ostream& os, int rank) {
+  auto ms = std::chrono::duration_cast<std::chrono::milliseconds>(
+                std::chrono::system_clock::now().time_since_epoch())
+                .count();
+  os << "{\"time_ms\": " << ms << ", \"rank\": " << rank
+     << ", \"engines\": [";
+  for (size_t i = 0; engine_stats_ && i < engine_thread_num_; ++i) {
+    auto& stats = engine_stats_[i];
+    os << (i ? ", " : "") << "{\"id\": " << i
+       << ", \"queue\": " << stats.queued.load()
+       << ", \"messages\": " << stats.num_messages.load()
+       << ", \"busy_us\": " << engine_busy_ns_[i].load() / 1000
+       << ", \"sum_us\": " << stats.sum_ns.load() / 1000
+       << ", \"sum_bytes\": " << stats.sum_bytes.load()
+       << ", \"compress_us\": " << stats.compress_ns.load() / 1000
+       << ", \"decompress_us\": " << stats.decompress_ns.load() / 1000
+       << "}";
+  }
+  os << "], \"keys\": [";
+
+  struct HotKey {
+    uint64_t key;
+    KeyStats* stats;
+    EngineKey* engine_key;
+    uint64_t busy_ns;
+  };
+  std::vector<HotKey> keys;
+  key_stats_.ForEach([&](uint64_t key, KeyStats* stats) {
+    auto engine_key = hash_cache_.Find(key);
+    keys.push_back({key, stats, engine_key,
+                    engine_key ? engine_key->busy_ns.load() : 0});
+  });
+  auto hotter = [](const HotKey& a, const HotKey& b) {
+    if (a.busy_ns != b.busy_ns) return a.busy_ns > b.busy_ns;
+    return a.stats->push_bytes.load() > b.stats->push_bytes.load();
+  };
+  if (stats_top_keys_ && keys.size() > stats_top_keys_) {
+    std::partial_sort(keys.begin(), keys.begin() + stats_top_keys_,
+                      keys.end(), hotter);
+    keys.resize(stats_top_keys_);
+  } else {
+    std::sort(keys.begin(), keys.end(), hotter);
+  }
+  for (size_t i = 0; i < keys.size(); ++i) {
+    auto stats = keys[i].stats;
+    os << (i ? ", " : "") << "{\"key\": " << keys[i].key << ", \"engine\": "
+       << (keys[i].engine_key ? (int)keys[i].engine_key->tid.load() : -1)
+       << ", \"push_bytes\": " << stats->push_bytes.load()
+       << ", \"pushes\": " << stats->num_pushes.load()
+       << ", \"pulls\": " << stats->num_pulls.load()
+       << ", \"pull_wait_us\": " << stats->pull_wait_ns.load() / 1000
+       << ", \"busy_us\": " << keys[i].busy_ns / 1000
+       << ", \"sum_us\": " << stats->sum_ns.load() / 1000
+       << ", \"compress_us\": " << stats->compress_ns.load() / 1000
+       << ", \"decompress_us\": " << stats->decompress_ns.load() / 1000
+       << "}";
+  }
+
+  os << "], \"workers\": [";
+  for (int i = 0; worker_lateness_ && i < ps::NumWorkers(); ++i) {
+    auto& lateness = worker_lateness_[i];
+    os << (i ? ", " : "") << "{\"rank\": " << i
+       << ", \"pushes\": " << lateness.num_pushes.load()
+       << ", \"lateness_sum_us\": " << lateness.sum_ns.load() / 1000
+       << ", \"lateness_max_us\": " << lateness.max_ns.load() / 1000
+       << ", \"last_pushes\": " << lateness.num_last.load()
+       << ", \"lateness_buckets\": [";
+    for (int b = 0; b < WorkerLateness::kBuckets; ++b) {
+      os << (b ? ", " : "") << lateness.buckets[b].load();
+    }
+    os << "]}";
+  }
+  os << "], \"load_imbalance\": " << last_imbalance_.load()
+     << ", \"key_migrations\": " << num_key_migrations_.load()
+     << ", \"staged_pushes\": " << num_staged_pushes_.load()
+     << ", \"staged_passes\": " << num_staged_passes_.load()
+     << ", \"arenas\": [";
+  {
+    std::lock_guard<std::mutex> lock(arena_mu_);
+    bool first = true;
+    for (auto& it : arenas_) {
+      os << (first ? "" : ", ") << "{\"numa_node\": " << it.first
+         << ", \"used_bytes\": " << it.second->used()
+         << ", \"reserved_bytes\": " << it.second->reserved()
+         << ", \"chunks\": " << it.second->num_chunks() << "}";
+      first = false;
+    }
+  }
+  os << "]}";
+}
+
+// Appends the statistics to BYTEPS_SERVER_STATS_FILE every interval, and
+// once more at shutdown.
+void BytePSServerStatsThread(int rank) {
+  std::ofstream out(stats_file_, std::ios::app);
+  CHECK(out) << "failed to open " << stats_file_;
+  std::unique_lock<std::mutex> lock(stats_mu_);
+  while (true) {
+    bool stop = stats_cv_.wait_for(
+        lock, std::chrono::milliseconds(stats_interval_ms_),
+        [] { return stats_stop_; });
+    WriteStats(out, rank);
+    out << std::endl;
+    if (stop) break;
+  }
+}
+
 void init_global_env() {
   // enable to print key profile
   log_key_info_ = GetEnv("PS_KEY_LOG", false);
@@ -418,6 +1037,14 @@ void init_global_env() {
   if (!sync_mode_)
     LOG(INFO) << "BytePS server is enabled asynchronous training";
 
+  // bounded staleness of asynchronous training
+  staleness_ = GetEnv("BYTEPS_SERVER_STALENESS", -1);
+  if (staleness_ >= 0) {
+    CHECK(!sync_mode_) << "BYTEPS_SERVER_STALENESS needs BYTEPS_ENABLE_ASYNC";
+    LOG(INFO) << "Workers may be at most " << staleness_
+              << " round(s) ahead of the slowest one";
+  }
+
   // debug mode
   debug_mode_ = GetEnv("BYTEPS_SERVER_DEBUG", false);
   debug_key_ = GetEnv("BYTEPS_SERVER_DEBUG_KEY", 0);
@@ -436,6 +1063,37 @@ void init_global_env() {
   enable_schedule_ = GetEnv("BYTEPS_SERVER_ENABLE_SCHEDULE", false);
   if (enable_schedule_)
     LOG(INFO) << "Enable engine scheduling for BytePS server";
+
+  // measure the load of the engine threads, and move keys between them
+  rebalance_interval_ns_ =
+      GetEnv("BYTEPS_SERVER_REBALANCE_INTERVAL_MS", 1000) * 1000000ULL;
+  enable_rebalance_ = GetEnv("BYTEPS_SERVER_ENABLE_REBALANCE", false);
+  auto threshold = getenv("BYTEPS_SERVER_REBALANCE_THRESHOLD");
+  if (threshold) rebalance_threshold_ = atof(threshold);
+  if (enable_rebalance_)
+    LOG(INFO) << "Enable engine load rebalancing, threshold "
+              << rebalance_threshold_;
+
+  // sum the pushes of a key in one pass
+  stage_pushes_ = GetEnv("BYTEPS_SERVER_STAGE_PUSHES", 0);
+  stage_deadline_ns_ =
+      GetEnv("BYTEPS_SERVER_STAGE_DEADLINE_US", 100) * 1000ULL;
+  if (stage_pushes_ > 1)
+    LOG(INFO) << "Stage up to " << stage_pushes_ << " pushes of a key, for "
+              << stage_deadline_ns_ / 1000 << "us at most";
+
+  // memory arena, off by default
+  arena_chunk_bytes_ = (size_t)GetEnv("BYTEPS_SERVER_ARENA_CHUNK_MB", 0)
+                       << 20;
+  arena_hugepage_ = GetEnv("BYTEPS_SERVER_HUGEPAGE", false);
+
+  // statistics
+  auto stats_file = getenv("BYTEPS_SERVER_STATS_FILE");
+  if (stats_file) stats_file_ = stats_file;
+  stats_interval_ms_ = GetEnv("BYTEPS_SERVER_STATS_INTERVAL_MS", 10000);
+  stats_top_keys_ = GetEnv("BYTEPS_SERVER_STATS_TOP_KEYS", 10);
+  straggler_threshold_ns_ =
+      GetEnv("BYTEPS_SERVER_STRAGGLER_THRESHOLD_MS", 0) * 1000000ULL;
 }
 
 extern "C" void byteps_server() {
@@ -444,30 +1102,33 @@ extern "C" void byteps_server() {
   // cpu reducer
   bps_reducer_ = new byteps::common::CpuReducer(nullptr);
 
-  // flag mu and its protected map
+  // flag mu, which guards the pull state of the keys of each engine thread
   std::vector<std::mutex> tmp_flagmu(engine_thread_num_);
-  std::vector<std::unordered_map<uint64_t, bool> > tmp_ispushfinished(
-      engine_thread_num_);
-  std::vector<std::unordered_map<uint64_t, std::vector<ps::KVMeta> > >
-      tmp_qpullreqmeta(engine_thread_num_);
-  std::vector<std::unordered_map<uint64_t, std::set<int> > > tmp_seensender(
-      engine_thread_num_);
-  std::vector<std::unordered_map<uint64_t, size_t> > tmp_pullcnt(
-      engine_thread_num_);
   flag_mu_.swap(tmp_flagmu);
-  is_push_finished_.swap(tmp_ispushfinished);
-  q_pull_reqmeta_.swap(tmp_qpullreqmeta);
-  seen_sender_.swap(tmp_seensender);
-  pull_cnt_.swap(tmp_pullcnt);
   CHECK_EQ(flag_mu_.size(), engine_thread_num_);
-  CHECK_EQ(is_push_finished_.size(), engine_thread_num_);
-  CHECK_EQ(q_pull_reqmeta_.size(), engine_thread_num_);
-  CHECK_EQ(pull_cnt_.size(), engine_thread_num_);
 
   // init the engine
   for (size_t i = 0; i < engine_thread_num_; ++i) {
     acc_load_.push_back(0);
   }
+  engine_busy_ns_.reset(new std::atomic<uint64_t>[engine_thread_num_]);
+  for (size_t i = 0; i < engine_thread_num_; ++i) engine_busy_ns_[i] = 0;
+  engine_last_busy_ns_.assign(engine_thread_num_, 0);
+  engine_stats_.reset(new EngineStats[engine_thread_num_]);
+
+  // keep the memory of a key on the node of its engine thread
+  auto& engine_cpus = common::GetAffinityCpus("engine");
+  if (!engine_cpus.empty() && numa_available() >= 0) {
+    for (size_t i = 0; i < engine_thread_num_; ++i) {
+      engine_numa_node_.push_back(
+          numa_node_of_cpu(engine_cpus[i % engine_cpus.size()]));
+    }
+  }
+  if (arena_chunk_bytes_) {
+    common::compressor::SetBufferAllocator([](size_t size) {
+      return (char*)ArenaAllocate(size, compressor_numa_node_);
+    });
+  }
   if (sync_mode_) {
     for (size_t i = 0; i < engine_thread_num_; ++i) {
       auto q = new PriorityQueue(enable_schedule_);
@@ -483,6 +1144,19 @@ extern "C" void byteps_server() {
   byteps_server_ = new KVServer<SERVER_DATA_TYPE>(0);
   byteps_server_->set_request_handle(BytePSHandler);
   StartAsync(0, "byteps_server\0");
+  // the number of workers is known once started, and pushes only come after
+  // the barrier below
+  worker_lateness_.reset(new WorkerLateness[ps::NumWorkers()]);
+  if (!stats_file_.empty()) {
+    // one file per server
+    stats_file_ += "." + std::to_string(ps::MyRank());
+    LOG(INFO) << "Write server statistics to " << stats_file_ << " every "
+              << stats_interval_ms_ << "ms";
+    stats_thread_ = new std::thread(&BytePSServerStatsThread, ps::MyRank());
+  }
+  if (stage_pushes_ > 1 && !is_engine_blocking_) {
+    stage_thread_ = new std::thread(&BytePSServerStageThread);
+  }
   if (!Postoffice::Get()->is_recovery()) {
     Postoffice::Get()->Barrier(
         0, ps::kWorkerGroup + ps::kServerGroup + ps::kScheduler);
@@ -490,6 +1164,26 @@ extern "C" void byteps_server() {
 
   // clean the server resource
   Finalize(0, true);
+  if (stats_thread_) {
+    {
+      std::lock_guard<std::mutex> lock(stats_mu_);
+      stats_stop_ = true;
+    }
+    stats_cv_.notify_one();
+    stats_thread_->join();
+    delete stats_thread_;
+    stats_thread_ = nullptr;
+  }
+  if (stage_thread_) {
+    {
+      std::lock_guard<std::mutex> lock(stage_mu_);
+      stage_stop_ = true;
+    }
+    stage_cv_.notify_one();
+    stage_thread_->join();
+    delete stage_thread_;
+    stage_thread_ = nullptr;
+  }
   if (byteps_server_) {
     delete byteps_server_;
     byteps_server_ = nullptr;
@@ -502,11 +1196,34 @@ extern "C" void byteps_server() {
   msg.ops = TERMINATE;
   for (auto q : engine_queues_) q->Push(msg);
   for (auto t : engine_threads_) t->join();
+  if (sync_mode_ && !is_engine_blocking_) {
+    std::stringstream busy;
+    for (size_t i = 0; i < engine_thread_num_; ++i) {
+      busy << " " << engine_busy_ns_[i].load() / 1000000;
+    }
+    LOG(INFO) << "Engine busy ms per thread:" << busy.str()
+              << ", load imbalance (max/mean) first " << first_imbalance_
+              << " last " << last_imbalance_ << ", " << num_key_migrations_
+              << " key migration(s)";
+  }
+  if (num_staged_passes_) {
+    LOG(INFO) << "Summed " << num_staged_pushes_ << " staged push(es) in "
+              << num_staged_passes_ << " pass(es)";
+  }
 
-  for (auto& it : store_) {
-    if (it.second.tensor) {
-      free(it.second.tensor);
+  if (arena_chunk_bytes_) {
+    for (auto& it : arenas_) {
+      LOG(INFO) << "Server memory arena of NUMA node " << it.first << ": "
+                << (it.second->used() >> 20) << " MB used of "
+                << (it.second->reserved() >> 20) << " MB in "
+                << it.second->num_chunks() << " chunk(s)";
     }
+  } else {
+    store_.ForEach([](uint64_t key, BytePSArray* stored) {
+      if (stored->tensor) {
+        free(stored->tensor);
+      }
+    });
   }
   
   LOG(INFO) << "byteps has been shutdown";
@@ -16,15 +16,26 @@
 #ifndef BYTEPS_SERVER_H
 #define BYTEPS_SERVER_H
 
+#include <atomic>
 #include <chrono>
 #include <cmath>
+#include <condition_variable>
 #include <cstdlib>
+#include <fstream>
+#include <limits>
+#include <map>
+#include <memory>
 #include <set>
+#include <sstream>
+#include <unordered_set>
 #include <unistd.h>
 #include "ps/ps.h"
 #include "../common/cpu_reducer.h"
 #include "../common/compressor/compressor.h"
 #include "../common/compressor/compressor_registry.h"
+#include "arena.h"
+#include "key_table.h"
+#include "optimizer.h"
 
 namespace byteps {
 namespace server {
@@ -37,7 +48,7 @@ namespace server {
 using namespace ps;
 
 enum class RequestType {
-  kDefaultPushPull, kRowSparsePushPull, kCompressedPushPull
+  kDefaultPushPull, kRowSparsePushPull, kCompressedPushPull, kServerOptimizer
 };
 
 enum BytePSEngineOperation {
@@ -64,6 +75,75 @@ struct BytePSArray {
 struct UpdateBuf {
   std::vector<ps::KVMeta> request;
   BytePSArray merged;
+  // pushes to be summed in one pass (BYTEPS_SERVER_STAGE_PUSHES)
+  std::vector<ps::KVPairs<char> > staged;
+  DataHandleType staged_type;
+  // whether the staged pushes start a round, i.e., overwrite the store
+  bool staged_first;
+  uint64_t staged_since_ns;
+  // arrival of the first push of the round
+  uint64_t round_start_ns;
+};
+
+// the engine thread of a key, and the load the key puts on it
+struct EngineKey {
+  static constexpr size_t kNoEngineThread = std::numeric_limits<size_t>::max();
+  // written under hash_mu_, read without it; kNoEngineThread until the first
+  // push has placed the key
+  std::atomic<size_t> tid{kNoEngineThread};
+  size_t len = 0;
+  // the engine thread to move to at the next round boundary, or -1
+  std::atomic<int> migrate_to{-1};
+  // engine messages not processed yet
+  std::atomic<int> inflight{0};
+  std::atomic<uint64_t> busy_ns{0};
+  // busy_ns at the last rebalance check
+  uint64_t last_busy_ns = 0;
+};
+
+// counters of a key for BYTEPS_SERVER_STATS_FILE, cumulative
+struct KeyStats {
+  std::atomic<uint64_t> push_bytes{0};
+  std::atomic<uint64_t> num_pushes{0};
+  std::atomic<uint64_t> num_pulls{0};
+  // from the arrival of a pull to its response, for pulls that waited
+  std::atomic<uint64_t> pull_wait_ns{0};
+  std::atomic<uint64_t> sum_ns{0};
+  std::atomic<uint64_t> compress_ns{0};
+  std::atomic<uint64_t> decompress_ns{0};
+  // arrival of the held pulls by sender in asynchronous training, guarded by
+  // handle_mu_
+  std::unordered_map<int, uint64_t> pull_arrival_ns;
+};
+
+// counters of an engine thread, cumulative except the queue length
+struct EngineStats {
+  std::atomic<int64_t> queued{0};
+  std::atomic<uint64_t> num_messages{0};
+  std::atomic<uint64_t> sum_ns{0};
+  std::atomic<uint64_t> sum_bytes{0};
+  std::atomic<uint64_t> compress_ns{0};
+  std::atomic<uint64_t> decompress_ns{0};
+};
+
+// how late the pushes of a worker arrive after the first push of their
+// round, over all keys, in synchronous training
+struct WorkerLateness {
+  static const int kBuckets = 24;
+  std::atomic<uint64_t> num_pushes{0};
+  std::atomic<uint64_t> sum_ns{0};
+  std::atomic<uint64_t> max_ns{0};
+  // rounds in which the worker pushed last
+  std::atomic<uint64_t> num_last{0};
+  // bucket b counts lateness in [2^b, 2^(b+1)) microseconds, bucket 0 also
+  // below 1us, and the last one everything above
+  std::atomic<uint64_t> buckets[kBuckets];
+  // last warning about the worker, only used by the request handler
+  uint64_t last_warning_ns = 0;
+
+  WorkerLateness() {
+    for (auto& bucket : buckets) bucket = 0;
+  }
 };
 
 struct BytePSEngineMessage {
@@ -76,6 +156,9 @@ struct BytePSEngineMessage {
   BytePSEngineOperation ops;
   ps::KVPairs<char> sarray; // to temporarily hold it and auto release
   ps::KVMeta req_meta;
+  EngineKey* engine_key;
+  // staged pushes that replace src, summed into dst in one pass
+  std::vector<ps::KVPairs<char> > staged;
 };
 
 static DataHandleType DepairDataHandleType(int cmd) {
@@ -95,37 +178,187 @@ static DataHandleType DepairDataHandleType(int cmd) {
 KVServer<SERVER_DATA_TYPE>* byteps_server_;
 byteps::common::CpuReducer* bps_reducer_;
 
-std::mutex pullresp_mu_;
-std::unordered_map<uint64_t, ps::KVPairs<char> > push_response_map_;
-std::unordered_map<uint64_t, ps::KVPairs<char> > pull_response_map_;
+// the responses of each key, reused to keep the RDMA memory registered
+KeyTable<ps::KVPairs<char> > push_response_map_;
+KeyTable<ps::KVPairs<char> > pull_response_map_;
+
+// multi-key requests, responded once all their keys are done
+struct BatchResponse {
+  ps::KVMeta req_meta;
+  size_t pending;
+  // position of each key in the request
+  std::unordered_map<uint64_t, size_t> index;
+  // pull only: the value of each key
+  std::vector<ps::SArray<char> > vals;
+};
+std::mutex batch_mu_;
+std::atomic<int> num_batch_response_{0};
+std::unordered_map<uint64_t, BatchResponse> batch_response_;
+
+// The pulls of a key in synchronous training, guarded by the flag_mu_ of the
+// engine thread of the key. Workers are tracked by rank in a bitmap, and the
+// waiting pulls in a ring, so that a round costs O(#workers).
+class PullState {
+ public:
+  struct PendingPull {
+    ps::KVMeta req_meta;
+    uint64_t arrival_ns;
+  };
+
+  // whether all pushes of the round are summed
+  bool push_finished = false;
+
+  bool HasResponded(int rank) const {
+    return !_responded.empty() && ((_responded[rank / 64] >> (rank % 64)) & 1);
+  }
+
+  // returns true once all workers got the result, and starts the next round
+  bool MarkResponded(int rank) {
+    if (_responded.empty()) _responded.resize((ps::NumWorkers() + 63) / 64);
+    _responded[rank / 64] |= 1ULL << (rank % 64);
+    if (++_num_responded < (size_t)ps::NumWorkers()) return false;
+    push_finished = false;
+    _num_responded = 0;
+    std::fill(_responded.begin(), _responded.end(), 0);
+    return true;
+  }
+
+  // the pulls that wait for the round to finish, or for the next round if
+  // their worker got the result of this one
+  size_t num_pending() const { return _num_pending; }
+
+  void PushPending(const ps::KVMeta& req_meta, uint64_t arrival_ns) {
+    // a worker has at most one pull in this round and one in the next
+    if (_num_pending == _pending.size()) {
+      std::vector<PendingPull> ring(std::max<size_t>(
+          2 * _pending.size(), 2 * (size_t)ps::NumWorkers()));
+      for (size_t i = 0; i < _num_pending; ++i) {
+        ring[i] = std::move(_pending[(_head + i) % _pending.size()]);
+      }
+      _pending.swap(ring);
+      _head = 0;
+    }
+    _pending[(_head + _num_pending) % _pending.size()] = {req_meta,
+                                                          arrival_ns};
+    ++_num_pending;
+  }
+
+  PendingPull PopPending() {
+    auto pull = std::move(_pending[_head]);
+    _head = (_head + 1) % _pending.size();
+    --_num_pending;
+    return pull;
+  }
+
+  // no round in progress, the key can move to another engine thread
+  bool IsIdle() const {
+    return !push_finished && !_num_responded && !_num_pending;
+  }
+
+ private:
+  std::vector<uint64_t> _responded;
+  size_t _num_responded = 0;
+  std::vector<PendingPull> _pending;
+  size_t _head = 0;
+  size_t _num_pending = 0;
+};
 
 // push & pull flag
 std::vector<std::mutex> flag_mu_;
-std::vector<std::unordered_map<uint64_t, bool> > is_push_finished_;
-std::vector<std::unordered_map<uint64_t, std::vector<ps::KVMeta> > > q_pull_reqmeta_;
-std::vector<std::unordered_map<uint64_t, std::set<int> > > seen_sender_;
-std::vector<std::unordered_map<uint64_t, size_t> > pull_cnt_;
+KeyTable<PullState> pull_state_;
 
 // byteps handler
 std::mutex handle_mu_;
-std::unordered_map<uint64_t, UpdateBuf> update_buf_;
-std::unordered_map<uint64_t, std::unique_ptr<common::compressor::Compressor>> compressor_map_;
+KeyTable<UpdateBuf> update_buf_;
+KeyTable<std::unique_ptr<common::compressor::Compressor> > compressor_map_;
+
+// server-side optimizers (asynchronous training only)
+struct ServerOptimizerState {
+  std::unique_ptr<ServerOptimizer> optimizer;
+  // the workers whose initial weights have arrived
+  std::set<int> initialized;
+};
+KeyTable<ServerOptimizerState> optimizer_map_;
+
+// bounded staleness in asynchronous training
+struct StalenessState {
+  // the number of pushes of each worker
+  std::unordered_map<int, uint64_t> clock;
+  // pulls of workers too far ahead of the slowest one
+  std::vector<ps::KVMeta> blocked_pulls;
+};
+KeyTable<StalenessState> staleness_map_;
 
 // address map
-std::mutex store_mu_;
-std::unordered_map<uint64_t, BytePSArray> store_;
+KeyTable<BytePSArray> store_;
 
-// hash function
+// hash function, only used by the request handler
+KeyTable<EngineKey> hash_cache_;
+// guards the assignment of keys to engine threads
 std::mutex hash_mu_;
-std::unordered_map<uint64_t, size_t> hash_cache_;
 std::vector<uint64_t> acc_load_; // accumulated tensor size for an engine thread
 
+// engine load balancing
+std::unique_ptr<std::atomic<uint64_t>[]> engine_busy_ns_;
+std::vector<uint64_t> engine_last_busy_ns_;
+uint64_t last_rebalance_ns_ = 0;
+uint64_t rebalance_interval_ns_ = 0;
+bool enable_rebalance_ = false;
+double rebalance_threshold_ = 1.2;
+// max/mean busy time of the engine threads in the first and the last
+// interval that had any load
+std::atomic<double> first_imbalance_{0};
+std::atomic<double> last_imbalance_{0};
+std::atomic<uint64_t> num_key_migrations_{0};
+
+// memory of the store and the compressors, one arena per NUMA node, or
+// posix_memalign() per buffer if arena_chunk_bytes_ is 0
+size_t arena_chunk_bytes_ = 0;
+bool arena_hugepage_ = false;
+std::mutex arena_mu_;
+std::map<int, std::unique_ptr<MemoryArena> > arenas_;
+// the NUMA node of each engine thread, -1 if it is not pinned
+std::vector<int> engine_numa_node_;
+// the node of the compressor being created
+int compressor_numa_node_ = -1;
+
+// staging of pushes
+size_t stage_pushes_ = 0;
+uint64_t stage_deadline_ns_ = 0;
+// keys with staged pushes, to flush them after the deadline
+std::unordered_set<uint64_t> staged_keys_;
+// flushes the staged pushes when no request arrives to do it
+std::thread* stage_thread_ = nullptr;
+std::mutex stage_mu_;
+std::condition_variable stage_cv_;
+bool stage_stop_ = false;
+std::atomic<uint64_t> num_staged_pushes_{0};
+std::atomic<uint64_t> num_staged_passes_{0};
+
+// statistics, written to a file every interval
+KeyTable<KeyStats> key_stats_;
+std::unique_ptr<EngineStats[]> engine_stats_;
+std::string stats_file_;
+uint64_t stats_interval_ms_ = 10000;
+size_t stats_top_keys_ = 10;
+std::thread* stats_thread_ = nullptr;
+// by worker rank
+std::unique_ptr<WorkerLateness[]> worker_lateness_;
+// warn about pushes later than this, 0 to never warn
+uint64_t straggler_threshold_ns_ = 0;
+std::mutex stats_mu_;
+std::condition_variable stats_cv_;
+bool stats_stop_ = false;
+
 // global knob
 uint64_t timestamp_ = 0;
 size_t engine_thread_num_ = 4;
 volatile bool is_engine_blocking_ = false;
 volatile bool log_key_info_ = false;
 volatile bool sync_mode_ = true;
+// the max rounds a worker may be ahead of the slowest one in asynchronous
+// training, -1 for no bound
+int staleness_ = -1;
 volatile bool debug_mode_ = false;
 volatile bool enable_schedule_ = false;
 
@@ -147,15 +380,18 @@ uint64_t EncodeKey(ps::Key key) {
 }
 
 size_t GetThreadID(uint64_t key, size_t len) {
-  std::lock_guard<std::mutex> lock(hash_mu_);
-  if (len == 0) { // pull
-    CHECK_NE(hash_cache_.find(key), hash_cache_.end());
-    return hash_cache_[key];
-  }
-  if (hash_cache_.find(key) != hash_cache_.end()) {
-    return hash_cache_[key];
+  auto engine_key = hash_cache_.Find(key);
+  if (engine_key) {
+    auto tid = engine_key->tid.load(std::memory_order_acquire);
+    if (tid != EngineKey::kNoEngineThread) return tid;
   }
-  CHECK_GT(len, 0);
+  std::lock_guard<std::mutex> lock(hash_mu_);
+  // another thread may have placed the key meanwhile, always completely
+  // since that is done under hash_mu_
+  engine_key = hash_cache_.Find(key);
+  if (engine_key) return engine_key->tid.load(std::memory_order_acquire);
+  // a pull of a key that was never pushed
+  CHECK_GT(len, 0) << "no engine thread for key=" << key;
   CHECK_EQ(acc_load_.size(), engine_thread_num_);
   auto min_index = -1;
   auto min_load = std::numeric_limits<uint64_t>::max();
@@ -168,8 +404,16 @@ size_t GetThreadID(uint64_t key, size_t len) {
   CHECK_GE(min_index, 0);
   CHECK_LT(min_index, engine_thread_num_);
   acc_load_[min_index] += len;
-  hash_cache_[key] = min_index;
-  return hash_cache_[key];
+  engine_key = hash_cache_.Get(key);
+  engine_key->len = len;
+  engine_key->tid.store(min_index, std::memory_order_release);
+  return min_index;
+}
+
+EngineKey* GetEngineKey(uint64_t key) {
+  auto engine_key = hash_cache_.Find(key);
+  CHECK(engine_key) << "no engine thread for key=" << key;
+  return engine_key;
 }
 
 void PageAlignedMalloc(void** ptr, size_t size) {
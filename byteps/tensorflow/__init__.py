@@ -26,6 +26,9 @@ import warnings
 from byteps.tensorflow.compression import Compression
 from byteps.tensorflow.ops import broadcast, _push_pull
 from byteps.tensorflow.ops import init, shutdown, suspend, resume, get_pushpull_speed
+from byteps.tensorflow.ops import get_scheduling_credit, get_threadpool_busy_time
+from byteps.tensorflow.ops import get_queue_stats, get_reducer_calibration
+from byteps.tensorflow.ops import declare
 from byteps.tensorflow.ops import size, local_size, rank, local_rank
 from byteps.tensorflow.ops import handle_average_backwards_compatibility
 from byteps.tensorflow.util import _executing_eagerly
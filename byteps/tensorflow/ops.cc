@@ -71,6 +71,8 @@ const common::DataType ConvertDType(int dtype) {
       return common::BYTEPS_INT64;
     case ::tensorflow::DT_HALF:
       return common::BYTEPS_FLOAT16;
+    case ::tensorflow::DT_BFLOAT16:
+      return common::BYTEPS_BFLOAT16;
     case ::tensorflow::DT_FLOAT:
       return common::BYTEPS_FLOAT32;
     case ::tensorflow::DT_DOUBLE:
@@ -127,9 +129,13 @@ common::ReadyEvent* RecordReadyEvent(::tensorflow::OpKernelContext* context) {
   return nullptr;
 }
 
-extern "C" void byteps_tensorflow_declare_tensor(char* name) {
+extern "C" void byteps_tensorflow_declare_tensor(char* name,
+                                                 int partition_bytes) {
   std::string tensor_name(name);
   common::IsTensorDeclared(tensor_name);
+  if (partition_bytes > 0) {
+    common::SetPartitionBytes(tensor_name, partition_bytes);
+  }
   return;
 }
 
@@ -211,7 +217,7 @@ REGISTER_KERNEL_BUILDER(Name("BytepsPushPull").Device(::tensorflow::DEVICE_GPU),
                         BytePSPushPullOp);
 
 REGISTER_OP("BytepsPushPull")
-    .Attr("T: {int32, int64, float16, float32, float64}")
+    .Attr("T: {int32, int64, float16, bfloat16, float32, float64}")
     .Attr("input_name: string = 'default_tensor_name'")
     .Input("tensor: T")
     .Output("sum: T")
@@ -51,7 +51,8 @@ class TFTensor : public common::Tensor {
   ::tensorflow::Tensor tensor_;
 };
 
-extern "C" void byteps_tensorflow_declare_tensor(char* name);
+extern "C" void byteps_tensorflow_declare_tensor(char* name,
+                                                 int partition_bytes);
 
 }  // namespace tensorflow
 }  // namespace byteps
@@ -63,6 +63,10 @@ local_size = _basics.local_size
 rank = _basics.rank
 local_rank = _basics.local_rank
 get_pushpull_speed = _basics.get_pushpull_speed
+get_scheduling_credit = _basics.get_scheduling_credit
+get_threadpool_busy_time = _basics.get_threadpool_busy_time
+get_queue_stats = _basics.get_queue_stats
+get_reducer_calibration = _basics.get_reducer_calibration
 
 dll_path = os.path.join(os.path.dirname(__file__),
                         'c_lib' + get_ext_suffix())
@@ -106,6 +110,19 @@ def randomString(stringLength=16):
     letters = string.ascii_lowercase
     return ''.join(random.choice(letters) for i in range(stringLength))
 
+def declare(name, partition_bytes=0):
+    """Declares a tensor before its first push_pull.
+    Arguments:
+        name: The full name of the tensor, i.e., scope + name as used in
+              push_pull.
+        partition_bytes: The partition size of this tensor in bytes. 0 means
+                         BYTEPS_PARTITION_BYTES, or the automatic choice with
+                         BYTEPS_PARTITION_POLICY=auto. All workers must
+                         use the same value.
+    """
+    TF_LIB_CTYPES.byteps_tensorflow_declare_tensor(
+        ctypes.c_char_p(name.encode("ascii")), ctypes.c_int(partition_bytes))
+
 def _push_pull(tensor, scope='', name=None):
     """An op which sums an input tensor over all the BytePS processes.
     The reduction operation is keyed by the name of the op. The tensor type and
@@ -130,7 +147,7 @@ def _push_pull(tensor, scope='', name=None):
     if not full_name:
         full_name = "empty_name_" + randomString()
     full_name_ascii = full_name.encode("ascii")
-    TF_LIB_CTYPES.byteps_tensorflow_declare_tensor(ctypes.c_char_p(full_name_ascii))
+    TF_LIB_CTYPES.byteps_tensorflow_declare_tensor(ctypes.c_char_p(full_name_ascii), 0)
     return C_LIB.byteps_push_pull(tensor, name=name, input_name = full_name)
 
 
@@ -173,7 +190,7 @@ def broadcast(tensor, root_rank, scope='', name=None, is_variable=True):
         full_name = "empty_name_" + randomString()
     full_name_ascii = full_name.encode("ascii")
 
-    TF_LIB_CTYPES.byteps_tensorflow_declare_tensor(ctypes.c_char_p(full_name_ascii))
+    TF_LIB_CTYPES.byteps_tensorflow_declare_tensor(ctypes.c_char_p(full_name_ascii), 0)
     if root_rank != rank():
         if is_variable:
             if hasattr(tf, 'assign_sub'):
@@ -26,6 +26,8 @@ from byteps.torch.ops import push_pull
 from byteps.torch.ops import poll, synchronize, declare
 from byteps.torch.ops import init, shutdown, suspend, resume
 from byteps.torch.ops import size, local_size, rank, local_rank
+from byteps.torch.ops import get_scheduling_credit, get_threadpool_busy_time
+from byteps.torch.ops import get_queue_stats, get_reducer_calibration
 
 import os
 import torch
@@ -34,9 +36,10 @@ import collections
 
 class _DistributedOptimizer(torch.optim.Optimizer):
     def __init__(self, params, named_parameters, compression,
-                 backward_passes_per_step=1):
+                 backward_passes_per_step=1, server_optimizer=False):
         super(self.__class__, self).__init__(params)
         self._compression = compression
+        self._server_optimizer = server_optimizer
 
         if named_parameters is not None:
             named_parameters = list(named_parameters)
@@ -48,6 +51,9 @@ class _DistributedOptimizer(torch.optim.Optimizer):
             assert int(os.getenv('DMLC_NUM_WORKER')) > 1, \
                 "Async is only valid for distributed training"
             print('BytePS: enable asynchronous training')
+        elif self._server_optimizer:
+            raise ValueError('server_optimizer requires asynchronous training '
+                             '(BYTEPS_ENABLE_ASYNC=1)')
 
         # make sure that named_parameters are tuples
         if any([not isinstance(p, tuple) for p in named_parameters]):
@@ -96,6 +102,8 @@ class _DistributedOptimizer(torch.optim.Optimizer):
         # We use two loops for load-balancing
         for name in sorted(self._parameter_names.values()):
             declare("Parameter."+name)
+        if self._server_optimizer:
+            self._init_server_optimizer()
 
     @staticmethod
     def find_duplicates(lst):
@@ -107,6 +115,65 @@ class _DistributedOptimizer(torch.optim.Optimizer):
             seen.add(el)
         return dups
 
+    def _get_name(self, p):
+        if self._is_tensor_instance:
+            return self._parameter_names.get(p.__hash__())
+        return self._parameter_names.get(p)
+
+    def _server_optimizer_kwargs(self, group):
+        """The hyperparameters of a param group for the server optimizer."""
+        if group.get('maximize', False):
+            raise ValueError('the server optimizer does not support maximize')
+        if isinstance(self, torch.optim.SGD):
+            if group['dampening'] != 0:
+                raise ValueError('the server optimizer does not support '
+                                 'dampening')
+            return {'type': 'sgd', 'lr': group['lr'],
+                    'momentum': group['momentum'],
+                    'weight_decay': group['weight_decay'],
+                    'nesterov': int(group['nesterov'])}
+        if isinstance(self, torch.optim.Adam):
+            if group.get('amsgrad', False):
+                raise ValueError('the server optimizer does not support '
+                                 'amsgrad')
+            return {'type': 'adam', 'lr': group['lr'],
+                    'beta1': group['betas'][0], 'beta2': group['betas'][1],
+                    'eps': group['eps'],
+                    'weight_decay': group['weight_decay']}
+        raise ValueError('the server optimizer supports torch.optim.SGD and '
+                         'torch.optim.Adam only')
+
+    def _init_server_optimizer(self):
+        # the servers keep the weights and the optimizer state, the first
+        # push_pull sends the weights and returns those of the first worker
+        handles = []
+        # the hyperparameters are only sent here, see _check_server_optimizer
+        self._server_optimizer_sent = []
+        for group in self.param_groups:
+            kwargs = self._server_optimizer_kwargs(group)
+            self._server_optimizer_sent.append(kwargs)
+            for p in group['params']:
+                name = self._get_name(p)
+                declare("AsyncParam."+name, server_optimizer=kwargs)
+                handles.append(byteps_push_pull(p.data, average=False,
+                                                name="AsyncParam."+name))
+        for handle in handles:
+            synchronize(handle)
+
+    def _check_server_optimizer(self):
+        """Refuses hyperparameters that changed after they were sent to the
+        servers, e.g., the lr by a torch.optim.lr_scheduler, which the servers
+        would silently ignore."""
+        for group, sent in zip(self.param_groups,
+                               self._server_optimizer_sent):
+            kwargs = self._server_optimizer_kwargs(group)
+            if kwargs != sent:
+                changed = sorted(k for k in kwargs if kwargs[k] != sent.get(k))
+                raise ValueError('the hyperparameters %s of the server '
+                                 'optimizer changed after they were sent to '
+                                 'the servers, which do not support that '
+                                 '(e.g., no lr_scheduler)' % ', '.join(changed))
+
     def set_backward_passes_per_step(self, passes):
         self.backward_passes_per_step = passes
         for p in self._push_pull_delay:
@@ -184,7 +251,25 @@ class _DistributedOptimizer(torch.optim.Optimizer):
             self._should_sync = True
 
     def step(self, closure=None):
-        if self._enable_async:
+        if self._server_optimizer:
+            self._check_server_optimizer()
+            loss = closure() if closure is not None else None
+            # push the gradients, and pull the weights updated by the servers;
+            # as in torch.optim, parameters without a gradient are left alone
+            handles = []
+            for p, (h, _) in self._handles.items():
+                if h is None and p.grad is not None:
+                    p.data.copy_(p.grad)
+                    handles.append(byteps_push_pull(
+                        p.data, average=False,
+                        name="AsyncParam."+self._get_name(p)))
+            for handle in handles:
+                synchronize(handle)
+            for p in self._handles:
+                self._push_pull_delay[p] = self.backward_passes_per_step
+            self._handles.clear()
+            return loss
+        elif self._enable_async:
             old_weight_map = {}
             # store the weights before update
             for p, _ in self._handles.items():
@@ -216,7 +301,8 @@ class _DistributedOptimizer(torch.optim.Optimizer):
 
 def DistributedOptimizer(optimizer, named_parameters=None,
                          compression=Compression.none,
-                         backward_passes_per_step=1):
+                         backward_passes_per_step=1,
+                         server_optimizer=False):
     """
     An optimizer that wraps another torch.optim.Optimizer, using an push_pull to
     average gradient values before applying gradients to model weights.
@@ -247,13 +333,22 @@ def DistributedOptimizer(optimizer, named_parameters=None,
                                   allows accumulating gradients over multiple
                                   mini-batches before executing averaging and
                                   applying them.
+        server_optimizer: In asynchronous training, let the servers apply the
+                          optimizer to the weights they keep, so that workers
+                          push gradients and pull the updated weights. Only
+                          torch.optim.SGD (without dampening) and
+                          torch.optim.Adam (without amsgrad) are supported.
+                          The hyperparameters are sent once, step() raises
+                          a ValueError if they change later, e.g., by a
+                          learning rate scheduler. Only available in
+                          PyTorch, not in the MXNet and TensorFlow plugins.
     """
     # We dynamically create a new class that inherits from the optimizer that was passed in.
     # The goal is to override the `step()` method with an push_pull implementation.
     cls = type(optimizer.__class__.__name__, (optimizer.__class__,),
                dict(_DistributedOptimizer.__dict__))
     return cls(optimizer.param_groups, named_parameters,
-               compression, backward_passes_per_step)
+               compression, backward_passes_per_step, server_optimizer)
 
 
 def broadcast_parameters(params, root_rank):
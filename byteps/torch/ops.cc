@@ -118,9 +118,16 @@ void SetNumGrads(int num_grads) {
 
 int PollHandle(int handle) { return handle_manager.PollHandle(handle) ? 1 : 0; }
 
-void DeclareTensor(const std::string& name) {
+void DeclareTensor(const std::string& name, int partition_bytes,
+                   std::unordered_map<std::string, std::string> optimizer) {
   std::string tensor_name = GetOpName("byteps", name.c_str(), 0);
   common::IsTensorDeclared(tensor_name);
+  if (partition_bytes > 0) {
+    common::SetPartitionBytes(tensor_name, partition_bytes);
+  }
+  if (!optimizer.empty()) {
+    common::RegisterServerOptimizer(tensor_name, optimizer);
+  }
 }
 
 void WaitAndClear(int handle) {
@@ -168,6 +175,7 @@ PYBIND11_MODULE(c_lib, m) {
   m.def("byteps_torch_push_pull_async_torch_IntTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_LongTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_HalfTensor", &DoPushPull);
+  m.def("byteps_torch_push_pull_async_torch_BFloat16Tensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_FloatTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_DoubleTensor", &DoPushPull);
 
@@ -177,6 +185,7 @@ PYBIND11_MODULE(c_lib, m) {
   m.def("byteps_torch_push_pull_group_sync_torch_IntTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_LongTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_HalfTensor", &DoPushPullGroupSync);
+  m.def("byteps_torch_push_pull_group_sync_torch_BFloat16Tensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_FloatTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_DoubleTensor", &DoPushPullGroupSync);
 
@@ -185,6 +194,7 @@ PYBIND11_MODULE(c_lib, m) {
   m.def("byteps_torch_push_pull_async_torch_cuda_IntTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_cuda_LongTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_cuda_HalfTensor", &DoPushPull);
+  m.def("byteps_torch_push_pull_async_torch_cuda_BFloat16Tensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_cuda_FloatTensor", &DoPushPull);
   m.def("byteps_torch_push_pull_async_torch_cuda_DoubleTensor", &DoPushPull);
 
@@ -192,6 +202,7 @@ PYBIND11_MODULE(c_lib, m) {
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_IntTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_LongTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_HalfTensor", &DoPushPullGroupSync);
+  m.def("byteps_torch_push_pull_group_sync_torch_cuda_BFloat16Tensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_FloatTensor", &DoPushPullGroupSync);
   m.def("byteps_torch_push_pull_group_sync_torch_cuda_DoubleTensor", &DoPushPullGroupSync);
 #endif
@@ -199,7 +210,9 @@ PYBIND11_MODULE(c_lib, m) {
   // basics
   m.def("byteps_torch_poll", &PollHandle);
   m.def("byteps_torch_wait_and_clear", &WaitAndClear);
-  m.def("byteps_torch_declare_tensor", &DeclareTensor);
+  m.def("byteps_torch_declare_tensor", &DeclareTensor, py::arg("name"),
+        py::arg("partition_bytes") = 0,
+        py::arg("optimizer") = std::unordered_map<std::string, std::string>());
 }
 
 }  // namespace torch
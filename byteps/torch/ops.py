@@ -43,6 +43,10 @@ size = _basics.size
 local_size = _basics.local_size
 rank = _basics.rank
 local_rank = _basics.local_rank
+get_scheduling_credit = _basics.get_scheduling_credit
+get_threadpool_busy_time = _basics.get_threadpool_busy_time
+get_queue_stats = _basics.get_queue_stats
+get_reducer_calibration = _basics.get_reducer_calibration
 
 
 # Schema: handle -> input, output
@@ -211,8 +215,24 @@ def poll(handle):
     return c_lib.byteps_torch_poll(handle) != 0
 
 
-def declare(name):
-    c_lib.byteps_torch_declare_tensor(name.encode())
+def declare(name, partition_bytes=0, server_optimizer=None):
+    """Declares a tensor before its first push_pull.
+    Arguments:
+        name: A name of the tensor, the same as used in push_pull.
+        partition_bytes: The partition size of this tensor in bytes. 0 means
+                         BYTEPS_PARTITION_BYTES, or the automatic choice with
+                         BYTEPS_PARTITION_POLICY=auto. All workers must
+                         use the same value.
+        server_optimizer: A dict of the optimizer that the servers apply to
+                          this tensor in asynchronous training, e.g.,
+                          {'type': 'sgd', 'lr': 0.1, 'momentum': 0.9}. The
+                          first push_pull of each worker sends the weights,
+                          the later ones send gradients and return the
+                          updated weights.
+    """
+    optimizer = {k: str(v) for k, v in (server_optimizer or {}).items()}
+    c_lib.byteps_torch_declare_tensor(name.encode(), partition_bytes,
+                                      optimizer)
     return 0
 
 def byteps_torch_set_num_grads(num_grads_):
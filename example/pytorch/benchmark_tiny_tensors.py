@@ -0,0 +1,89 @@
+from __future__ import print_function
+
+import argparse
+import timeit
+import sys
+
+import numpy as np
+import torch
+import byteps.torch as bps
+
+# Push-pull many tiny tensors, e.g., the biases and LayerNorm weights of BERT.
+# Compare runs with and without tensor fusion:
+#   BYTEPS_FUSION_THRESHOLD=0 ...
+#   BYTEPS_FUSION_THRESHOLD=65536 ...
+# or with multi-key batching:
+#   BYTEPS_BATCH_BYTES=1048576 BYTEPS_BATCH_WAIT_US=50 ...
+parser = argparse.ArgumentParser(description='BytePS Tiny Tensor Benchmark',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument('--num-tensors', type=int, default=500,
+                    help='number of tensors')
+parser.add_argument('--tensor-size', type=int, default=1024,
+                    help='number of float32 elements per tensor')
+parser.add_argument('--num-warmup-batches', type=int, default=10,
+                    help='number of warm-up batches that don\'t count towards benchmark')
+parser.add_argument('--num-batches-per-iter', type=int, default=10,
+                    help='number of batches per benchmark iteration')
+parser.add_argument('--num-iters', type=int, default=10,
+                    help='number of benchmark iterations')
+parser.add_argument('--no-cuda', action='store_true', default=False,
+                    help='disables CUDA')
+
+args = parser.parse_args()
+args.cuda = not args.no_cuda and torch.cuda.is_available()
+
+bps.init()
+
+if args.cuda:
+    torch.cuda.set_device(bps.local_rank())
+    device = torch.device('cuda')
+else:
+    device = torch.device('cpu')
+
+tensors = []
+for i in range(args.num_tensors):
+    name = 'tiny.%d' % i
+    bps.declare(name)
+    tensors.append((name, torch.zeros(args.tensor_size, device=device)))
+
+
+def benchmark_step():
+    handles = []
+    # the last declared tensor has the highest priority, like in backward
+    for i, (name, tensor) in enumerate(tensors):
+        tensor.fill_(bps.rank() + 1)
+        handles.append(bps.push_pull_async_inplace(
+            tensor, average=False, name=name, priority=-i))
+    for handle in handles:
+        bps.synchronize(handle)
+
+
+def log(s, nl=True):
+    if bps.local_rank() != 0:
+        return
+    print(s, end='\n' if nl else '')
+    sys.stdout.flush()
+
+
+log('Tensors: %d x %d bytes' % (args.num_tensors, args.tensor_size * 4))
+log('Number of workers: %d' % bps.size())
+
+log('Running warmup...')
+timeit.timeit(benchmark_step, number=args.num_warmup_batches)
+
+# every element is the sum of (rank + 1) over all ranks
+expected = bps.size() * (bps.size() + 1) / 2
+for name, tensor in tensors:
+    assert torch.all(tensor == expected), \
+        '%s: got %s, expected %s' % (name, tensor[0].item(), expected)
+
+log('Running benchmark...')
+iter_times = []
+for x in range(args.num_iters):
+    time = timeit.timeit(benchmark_step, number=args.num_batches_per_iter)
+    iter_ms = time * 1000 / args.num_batches_per_iter
+    log('Iter #%d: %.2f ms per push_pull of all tensors' % (x, iter_ms))
+    iter_times.append(iter_ms)
+
+log('Time per iteration: %.2f +-%.2f ms' %
+    (np.mean(iter_times), 1.96 * np.std(iter_times)))
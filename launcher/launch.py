@@ -122,6 +122,52 @@ def allocate_cpu(local_size):
     return ret
 
 
+def format_cpu_list(cpus):
+    """[0, 1, 2, 5] -> "0-2,5", in the given order"""
+    ranges = []
+    for cpu in cpus:
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else "%d-%d" % (a, b)
+                    for a, b in ranges)
+
+
+def get_worker_affinity(allocation):
+    """Default BYTEPS_THREAD_AFFINITY of a worker process from its NUMA
+    allocation: one cpu each for the push and pull loops, then the
+    compression thread pool, and the rest for the reducer."""
+    cpus = [cpu for cpu_set in allocation for cpu in cpu_set]
+    if len(cpus) < 3:
+        return None
+    rest = cpus[2:]
+    pool_size = int(os.getenv("BYTEPS_THREADPOOL_SIZE", 0))
+    if 0 < pool_size < len(rest):
+        compress, reducer = rest[:pool_size], rest[pool_size:]
+    else:
+        compress, reducer = rest, rest
+    return "push=%d;pull=%d;compress=%s;reducer=%s" % (
+        cpus[0], cpus[1], format_cpu_list(compress), format_cpu_list(reducer))
+
+
+def get_server_affinity(nodes):
+    """Default BYTEPS_THREAD_AFFINITY of a server process from
+    get_numa_info(): the engine threads are spread over the NUMA nodes, the
+    reducer uses the remaining cpus."""
+    cpus = [cpu for node in nodes for cpu in node]
+    engine_num = int(os.getenv("BYTEPS_SERVER_ENGINE_THREAD", 4))
+    if not nodes or len(cpus) <= engine_num:
+        return None
+    engine = []
+    for i in range(engine_num):
+        node = nodes[i % len(nodes)]
+        engine.append(node[i // len(nodes) % len(node)])
+    reducer = [cpu for cpu in cpus if cpu not in engine]
+    return "engine=%s;reducer=%s" % (",".join(str(cpu) for cpu in engine),
+                                     format_cpu_list(reducer))
+
+
 def check_env():
     assert "DMLC_ROLE" in os.environ and \
            os.environ["DMLC_ROLE"].lower() in ["worker", "server", "scheduler"]
@@ -159,6 +205,11 @@ def worker(local_rank, local_size, command, allocation=None):
             numa = numa.strip(',') + ' '
             command = numa + command
             print("Command: %s\n" % command)
+            if "BYTEPS_THREAD_AFFINITY" not in my_env:
+                affinity = get_worker_affinity(allocation)
+                if affinity:
+                    my_env["BYTEPS_THREAD_AFFINITY"] = affinity
+                    print("BYTEPS_THREAD_AFFINITY: %s" % affinity)
         else:
             print("Warning: numactl not found. try `sudo apt-get install numactl`.")
 
@@ -212,6 +263,12 @@ def launch_bps():
             command = "gdb -ex 'run' -ex 'bt' -batch --args " + command
         print("Command: %s\n" % command, flush=True)
         my_env = os.environ.copy()
+        if os.environ.get("BYTEPS_NUMA_ON", "") == "1" and \
+                "BYTEPS_THREAD_AFFINITY" not in my_env:
+            affinity = get_server_affinity(get_numa_info())
+            if affinity:
+                my_env["BYTEPS_THREAD_AFFINITY"] = affinity
+                print("BYTEPS_THREAD_AFFINITY: %s" % affinity, flush=True)
         subprocess.check_call(command, env=my_env,
                               stdout=sys.stdout, stderr=sys.stderr, shell=True)
 
@@ -171,7 +171,11 @@ def get_mpi_flags():
 
 def get_cpp_flags(build_ext):
     last_err = None
-    default_flags = ['-std=c++11', '-fPIC', '-Ofast', '-Wall', '-fopenmp', '-march=native']
+    default_flags = ['-std=c++11', '-fPIC', '-Ofast', '-Wall', '-fopenmp']
+    # the CpuReducer kernels pick their instruction set at runtime, so a
+    # portable build for a mixed fleet still reduces at full speed
+    if not int(os.environ.get('BYTEPS_BUILD_PORTABLE', 0)):
+        default_flags.append('-march=native')
     flags_to_try = []
     if sys.platform == 'darwin':
         # Darwin most likely will have Clang, which has libc++.
@@ -249,7 +253,10 @@ def get_common_options(build_ext):
                'byteps/common/ready_table.cc',
                'byteps/common/shared_memory.cc',
                'byteps/common/nccl_manager.cc',
-               'byteps/common/cpu_reducer.cc'] + [
+               'byteps/common/cpu_reducer.cc',
+               'byteps/common/cpu_reducer_kernels.cc',
+               'byteps/common/fusion.cc',
+               'byteps/common/affinity.cc'] + [
                'byteps/common/compressor/compressor_registry.cc',
                'byteps/common/compressor/error_feedback.cc',
                'byteps/common/compressor/momentum.cc',
@@ -302,6 +309,8 @@ def build_server(build_ext, options):
     server_lib.include_dirs = options['INCLUDES']
     server_lib.sources = ['byteps/server/server.cc',
                           'byteps/common/cpu_reducer.cc',
+                          'byteps/common/cpu_reducer_kernels.cc',
+                          'byteps/common/affinity.cc',
                           'byteps/common/logging.cc',
                           'byteps/common/common.cc'] + [
                           'byteps/common/compressor/compressor_registry.cc',
@@ -322,6 +331,8 @@ def build_server(build_ext, options):
         server_lib.libraries = ['rdmacm', 'ibverbs', 'rt']
     else:
         server_lib.libraries = []
+    # NUMA placement of the memory arena
+    server_lib.libraries += ['numa']
 
     build_ext.build_extension(server_lib)
 
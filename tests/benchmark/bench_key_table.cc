@@ -0,0 +1,97 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// A push storm on the per-key state of the server. Every thread stands for
+// the request handler or an engine thread and, for each push of a key, looks
+// up the four maps a push goes through (store, update buffer, engine thread,
+// push response). Compares maps behind one mutex each, as the server had
+// them, with the KeyTable.
+//
+// Usage: ./bench_key_table [num_threads] [num_tensors] [partitions]
+//                          [pushes_per_thread]
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <mutex>
+#include <thread>
+#include <unordered_map>
+#include <vector>
+
+#include "key_table.h"
+
+using byteps::server::KeyTable;
+
+struct Entry {
+  uint64_t value;
+};
+
+struct LockedMap {
+  std::mutex mutex;
+  std::unordered_map<uint64_t, Entry> entries;
+  Entry* Get(uint64_t key) {
+    std::lock_guard<std::mutex> lock(mutex);
+    return &entries[key];
+  }
+};
+
+template <typename Map>
+double Run(int num_threads, const std::vector<uint64_t>& keys, int pushes) {
+  Map maps[4];
+  // the init round
+  for (auto key : keys) {
+    for (auto& map : maps) map.Get(key)->value = 0;
+  }
+  auto start = std::chrono::steady_clock::now();
+  std::vector<std::thread> threads;
+  for (int t = 0; t < num_threads; ++t) {
+    threads.emplace_back([&, t] {
+      uint64_t x = t + 1;
+      for (int i = 0; i < pushes; ++i) {
+        // xorshift, so that the threads hit the keys in no particular order
+        x ^= x << 13;
+        x ^= x >> 7;
+        x ^= x << 17;
+        auto key = keys[x % keys.size()];
+        for (auto& map : maps) map.Get(key)->value += 1;
+      }
+    });
+  }
+  for (auto& t : threads) t.join();
+  double s = std::chrono::duration<double>(std::chrono::steady_clock::now() -
+                                           start)
+                 .count();
+  return (double)num_threads * pushes / s / 1e6;
+}
+
+int main(int argc, char** argv) {
+  int num_threads = argc > 1 ? atoi(argv[1]) : 8;
+  int num_tensors = argc > 2 ? atoi(argv[2]) : 200;
+  int partitions = argc > 3 ? atoi(argv[3]) : 4;
+  int pushes = argc > 4 ? atoi(argv[4]) : 1000000;
+  std::vector<uint64_t> keys;
+  for (int t = 0; t < num_tensors; ++t) {
+    for (int p = 0; p < partitions; ++p) {
+      keys.push_back(((uint64_t)t << 16) | p);
+    }
+  }
+  printf("threads=%d keys=%d x %d pushes per thread=%d\n", num_threads,
+         num_tensors, partitions, pushes);
+  printf("locked maps  %7.2f M pushes/s\n",
+         Run<LockedMap>(num_threads, keys, pushes));
+  printf("key table    %7.2f M pushes/s\n",
+         Run<KeyTable<Entry> >(num_threads, keys, pushes));
+  return 0;
+}
@@ -0,0 +1,136 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Compares the sleep-polling and notification idle modes of the background
+// loops. A producer feeds tasks to N loop threads at a fixed interval; each
+// loop polls its own queue and idles through a LoopNotifier.
+//
+// Usage: ./bench_loop_notify [num_loops] [interval_us] [duration_ms]
+//                            [spin_us] [wait_us]
+
+#include <time.h>
+
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <deque>
+#include <memory>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+#include "loop_notifier.h"
+
+using byteps::common::LoopNotifier;
+
+static uint64_t NowNs() {
+  return std::chrono::duration_cast<std::chrono::nanoseconds>(
+             std::chrono::steady_clock::now().time_since_epoch())
+      .count();
+}
+
+static uint64_t ProcessCpuNs() {
+  struct timespec ts;
+  clock_gettime(CLOCK_PROCESS_CPUTIME_ID, &ts);
+  return ts.tv_sec * 1000000000ULL + ts.tv_nsec;
+}
+
+struct Loop {
+  std::mutex mu;
+  std::deque<uint64_t> tasks;  // enqueue timestamps
+  std::shared_ptr<LoopNotifier> notifier;
+  uint64_t picked = 0;
+  uint64_t latency_ns = 0;
+};
+
+void RunMode(bool notify_mode, int num_loops, int interval_us,
+             int duration_ms, int spin_us, int wait_us) {
+  std::vector<std::unique_ptr<Loop>> loops;
+  for (int i = 0; i < num_loops; ++i) {
+    loops.emplace_back(new Loop);
+    loops.back()->notifier = std::make_shared<LoopNotifier>(
+        "bench", notify_mode, spin_us, wait_us);
+  }
+  std::atomic<bool> stop{false};
+  std::vector<std::thread> threads;
+  for (auto& l : loops) {
+    Loop* loop = l.get();
+    threads.emplace_back([loop, &stop] {
+      while (!stop.load()) {
+        auto version = loop->notifier->Version();
+        uint64_t ts = 0;
+        {
+          std::lock_guard<std::mutex> lock(loop->mu);
+          if (!loop->tasks.empty()) {
+            ts = loop->tasks.front();
+            loop->tasks.pop_front();
+          }
+        }
+        if (ts) {
+          loop->notifier->OnPickup();
+          loop->latency_ns += NowNs() - ts;
+          ++loop->picked;
+        } else {
+          loop->notifier->Idle(version);
+        }
+      }
+    });
+  }
+
+  auto cpu_start = ProcessCpuNs();
+  auto wall_start = NowNs();
+  auto end = std::chrono::steady_clock::now() +
+             std::chrono::milliseconds(duration_ms);
+  uint64_t produced = 0;
+  while (std::chrono::steady_clock::now() < end) {
+    auto& loop = loops[produced++ % loops.size()];
+    {
+      std::lock_guard<std::mutex> lock(loop->mu);
+      loop->tasks.push_back(NowNs());
+    }
+    loop->notifier->Notify();
+    std::this_thread::sleep_for(std::chrono::microseconds(interval_us));
+  }
+  stop = true;
+  for (auto& l : loops) l->notifier->Notify();
+  for (auto& t : threads) t.join();
+  double wall = NowNs() - wall_start;
+  double cpu = ProcessCpuNs() - cpu_start;
+
+  uint64_t picked = 0, latency_ns = 0;
+  double idle_cpu = 0;
+  for (auto& l : loops) {
+    picked += l->picked;
+    latency_ns += l->latency_ns;
+    idle_cpu += l->notifier->GetIdleCpuPercent();
+  }
+  printf("%-7s loops=%d cpu=%6.1f%% (of one core)  idle cpu/loop=%5.1f%%  "
+         "avg pickup latency=%7.1f us  tasks=%lu\n",
+         notify_mode ? "notify" : "sleep", num_loops, 100.0 * cpu / wall,
+         idle_cpu / num_loops, picked ? latency_ns / 1e3 / picked : 0.0,
+         (unsigned long)picked);
+}
+
+int main(int argc, char** argv) {
+  int num_loops = argc > 1 ? atoi(argv[1]) : 12;
+  int interval_us = argc > 2 ? atoi(argv[2]) : 100;
+  int duration_ms = argc > 3 ? atoi(argv[3]) : 2000;
+  int spin_us = argc > 4 ? atoi(argv[4]) : 50;
+  int wait_us = argc > 5 ? atoi(argv[5]) : 1000;
+  RunMode(false, num_loops, interval_us, duration_ms, spin_us, wait_us);
+  RunMode(true, num_loops, interval_us, duration_ms, spin_us, wait_us);
+  return 0;
+}
@@ -0,0 +1,121 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Contention benchmark of the ReadyTable. Half of the threads signal every
+// key once per round, like the local ranks do through AddReadyCount; the
+// other half scan their share of the keys with IsKeyReady, like getTask()
+// does, and clear the keys that became ready. Compares the map-only table
+// (dense_keys=0) with the lock-free counters.
+//
+// Usage: ./bench_ready_table [num_threads] [num_tensors] [partitions]
+//                            [rounds]
+
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <thread>
+#include <vector>
+
+#include "ready_table.h"
+
+using byteps::common::ReadyTable;
+
+void Run(int dense_keys, int num_threads, int num_tensors, int partitions,
+         int rounds) {
+  int signalers = std::max(num_threads / 2, 1);
+  int pollers = std::max(num_threads - signalers, 1);
+  ReadyTable table(signalers, "BENCH", dense_keys);
+  std::vector<uint64_t> keys;
+  for (int t = 0; t < num_tensors; ++t) {
+    for (int p = 0; p < partitions; ++p) {
+      keys.push_back(((uint64_t)t << 16) | p);
+    }
+  }
+
+  std::atomic<int> round_started{-1};
+  std::atomic<int> left{0};
+  std::atomic<uint64_t> polls{0};
+  std::vector<std::thread> threads;
+  for (int i = 0; i < signalers; ++i) {
+    threads.emplace_back([&, i] {
+      for (int r = 0; r < rounds; ++r) {
+        while (round_started.load() < r) std::this_thread::yield();
+        // each signaler walks the keys from a different start
+        for (size_t k = 0; k < keys.size(); ++k) {
+          table.AddReadyCount(keys[(k + i * keys.size() / signalers) %
+                                   keys.size()]);
+        }
+      }
+    });
+  }
+  for (int i = 0; i < pollers; ++i) {
+    threads.emplace_back([&, i] {
+      uint64_t my_polls = 0;
+      for (int r = 0; r < rounds; ++r) {
+        while (round_started.load() < r) std::this_thread::yield();
+        std::vector<uint64_t> pending;
+        for (size_t k = i; k < keys.size(); k += pollers) {
+          pending.push_back(keys[k]);
+        }
+        while (!pending.empty()) {
+          size_t before = pending.size();
+          for (size_t k = 0; k < pending.size();) {
+            ++my_polls;
+            if (table.IsKeyReady(pending[k])) {
+              table.ClearReadyCount(pending[k]);
+              pending[k] = pending.back();
+              pending.pop_back();
+              left.fetch_sub(1);
+            } else {
+              ++k;
+            }
+          }
+          // like an idle loop
+          if (pending.size() == before) std::this_thread::yield();
+        }
+      }
+      polls.fetch_add(my_polls);
+    });
+  }
+
+  auto start = std::chrono::steady_clock::now();
+  for (int r = 0; r < rounds; ++r) {
+    left = keys.size();
+    round_started = r;
+    while (left.load()) std::this_thread::yield();
+  }
+  double ms = std::chrono::duration<double, std::milli>(
+                  std::chrono::steady_clock::now() - start)
+                  .count();
+  for (auto& t : threads) t.join();
+  double ops = (double)keys.size() * rounds * (signalers + 1) + polls.load();
+  printf("%-9s %8.2f ms per round, %7.2f Mops/s (%d signalers, %d pollers)\n",
+         dense_keys ? "lock-free" : "map", ms / rounds, ops / ms / 1e3,
+         signalers, pollers);
+}
+
+int main(int argc, char** argv) {
+  int num_threads = argc > 1 ? atoi(argv[1]) : 8;
+  int num_tensors = argc > 2 ? atoi(argv[2]) : 200;
+  int partitions = argc > 3 ? atoi(argv[3]) : 4;
+  int rounds = argc > 4 ? atoi(argv[4]) : 50;
+  printf("threads=%d keys=%d x %d rounds=%d\n", num_threads, num_tensors,
+         partitions, rounds);
+  Run(0, num_threads, num_tensors, partitions, rounds);
+  Run(ReadyTable::kMaxDenseKeys, num_threads, num_tensors, partitions, rounds);
+  return 0;
+}
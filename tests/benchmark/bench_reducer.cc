@@ -0,0 +1,96 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Throughput of CpuReducer::sum with and without pinning its OpenMP team.
+// Optional busy threads stand for the training process competing for the
+// same cores. Each mode runs in a child process, since the affinity spec is
+// read once per process.
+//
+// Usage: ./bench_reducer [reducer_cpus] [mbytes] [iterations] [busy_threads]
+// e.g. ./bench_reducer 2-5 64 50 4. When pinned, the team is at most the
+// caller plus one thread per reducer cpu, see BYTEPS_OMP_THREAD_PER_GPU.
+
+#include <sys/wait.h>
+#include <unistd.h>
+
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <string>
+#include <thread>
+#include <vector>
+
+#include "cpu_reducer.h"
+
+using byteps::common::CpuReducer;
+
+void Run(const char* spec, size_t bytes, int iters, int busy_threads) {
+  if (spec) {
+    setenv("BYTEPS_THREAD_AFFINITY", spec, 1);
+  } else {
+    unsetenv("BYTEPS_THREAD_AFFINITY");
+  }
+  std::atomic<bool> stop{false};
+  std::vector<std::thread> busy;
+  for (int i = 0; i < busy_threads; ++i) {
+    busy.emplace_back([&stop] {
+      volatile uint64_t x = 0;
+      while (!stop.load()) ++x;
+    });
+  }
+
+  CpuReducer reducer(nullptr);
+  std::vector<float> dst(bytes / 4, 1.0f), src(bytes / 4, 2.0f);
+  // warm up, also pins the team
+  reducer.sum(dst.data(), src.data(), bytes, byteps::common::BYTEPS_FLOAT32);
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < iters; ++i) {
+    reducer.sum(dst.data(), src.data(), bytes,
+                byteps::common::BYTEPS_FLOAT32);
+  }
+  double sec = std::chrono::duration<double>(
+                   std::chrono::steady_clock::now() - start)
+                   .count();
+  stop = true;
+  for (auto& t : busy) t.join();
+  // read dst and src, write dst
+  printf("%-24s %8.2f GB/s\n", spec ? spec : "not pinned",
+         3.0 * bytes * iters / sec / 1e9);
+}
+
+int main(int argc, char** argv) {
+  std::string cpus = argc > 1 ? argv[1] : "0-3";
+  size_t mbytes = argc > 2 ? atoi(argv[2]) : 64;
+  int iters = argc > 3 ? atoi(argv[3]) : 50;
+  int busy_threads = argc > 4 ? atoi(argv[4]) : 0;
+  printf("%zu MB float32 sum, %d iterations, %d busy thread(s), "
+         "BYTEPS_OMP_THREAD_PER_GPU=%s\n",
+         mbytes, iters, busy_threads,
+         getenv("BYTEPS_OMP_THREAD_PER_GPU") ? getenv("BYTEPS_OMP_THREAD_PER_GPU")
+                                            : "4");
+  fflush(stdout);
+  std::string spec = "reducer=" + cpus;
+  for (int pinned = 0; pinned < 2; ++pinned) {
+    pid_t pid = fork();
+    if (pid == 0) {
+      Run(pinned ? spec.c_str() : nullptr, mbytes << 20, iters, busy_threads);
+      fflush(stdout);
+      _exit(0);
+    }
+    waitpid(pid, nullptr, 0);
+  }
+  return 0;
+}
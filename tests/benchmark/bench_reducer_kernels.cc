@@ -0,0 +1,255 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Single-thread throughput of the CpuReducer kernels of every instruction
+// set this CPU supports, per dtype and buffer length, for dst += src. The
+// result of each kernel is checked against the scalar one. The last column
+// runs CpuReducer::sum with its own threads and runtime-picked kernels; with
+// BYTEPS_REDUCER_CALIBRATE=1, the team sizes it calibrated at startup are
+// printed first.
+// Before that, the float16 and bfloat16 sums of CpuReducer, pairwise and
+// N-way, are checked against float32 sums of the same values.
+//
+// Usage: ./bench_reducer_kernels [max_mbytes] [gbytes_per_point]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <vector>
+
+#include "cpu_reducer.h"
+
+using byteps::common::CpuReducer;
+using byteps::common::DataType;
+using byteps::common::FindReducerKernels;
+using byteps::common::BFloat16Bits2Float;
+using byteps::common::Float2BFloat16Bits;
+using byteps::common::Float2HalfBits;
+using byteps::common::HalfBits2Float;
+using byteps::common::ReducerCalibration;
+using byteps::common::ReducerKernels;
+
+struct Buffers {
+  std::vector<char> dst, src;
+};
+
+void Fill(Buffers* b, size_t bytes, DataType dtype) {
+  b->dst.resize(bytes);
+  b->src.resize(bytes);
+  for (size_t i = 0; i < bytes / 8; ++i) {
+    float x = (i % 1000) * 0.001f, y = (i % 777) * 0.002f;
+    switch (dtype) {
+      case byteps::common::BYTEPS_FLOAT32:
+        for (int j = 0; j < 2; ++j) {
+          reinterpret_cast<float*>(b->dst.data())[2 * i + j] = x;
+          reinterpret_cast<float*>(b->src.data())[2 * i + j] = y;
+        }
+        break;
+      case byteps::common::BYTEPS_FLOAT64:
+        reinterpret_cast<double*>(b->dst.data())[i] = x;
+        reinterpret_cast<double*>(b->src.data())[i] = y;
+        break;
+      case byteps::common::BYTEPS_BFLOAT16:
+        for (int j = 0; j < 4; ++j) {
+          reinterpret_cast<uint16_t*>(b->dst.data())[4 * i + j] =
+              Float2BFloat16Bits(x);
+          reinterpret_cast<uint16_t*>(b->src.data())[4 * i + j] =
+              Float2BFloat16Bits(y);
+        }
+        break;
+      default:
+        for (int j = 0; j < 4; ++j) {
+          Float2HalfBits(&x, reinterpret_cast<unsigned short*>(
+                                 b->dst.data()) + 4 * i + j);
+          Float2HalfBits(&y, reinterpret_cast<unsigned short*>(
+                                 b->src.data()) + 4 * i + j);
+        }
+    }
+  }
+}
+
+void RunKernel(const ReducerKernels& k, Buffers* b, DataType dtype) {
+  void* dst = b->dst.data();
+  const void* src = b->src.data();
+  size_t bytes = b->dst.size();
+  switch (dtype) {
+    case byteps::common::BYTEPS_FLOAT32:
+      k.axpy_f32((float*)dst, (float*)dst, (const float*)src, bytes / 4, 1.0f);
+      break;
+    case byteps::common::BYTEPS_FLOAT64:
+      k.axpy_f64((double*)dst, (double*)dst, (const double*)src, bytes / 8,
+                 1.0f);
+      break;
+    case byteps::common::BYTEPS_BFLOAT16:
+      k.axpy_bf16((uint16_t*)dst, (uint16_t*)dst, (const uint16_t*)src,
+                  bytes / 2, 1.0f);
+      break;
+    default:
+      k.axpy_f16((uint16_t*)dst, (uint16_t*)dst, (const uint16_t*)src,
+                 bytes / 2, 1.0f);
+  }
+}
+
+float ToFloat(uint16_t x, DataType dtype) {
+  if (dtype == byteps::common::BYTEPS_BFLOAT16) return BFloat16Bits2Float(x);
+  float f;
+  HalfBits2Float(&x, &f);
+  return f;
+}
+
+uint16_t FromFloat(float f, DataType dtype) {
+  if (dtype == byteps::common::BYTEPS_BFLOAT16) return Float2BFloat16Bits(f);
+  unsigned short h;
+  Float2HalfBits(&f, &h);
+  return h;
+}
+
+// Sums num_srcs buffers of random values in [-1, 1) in dtype, both N-way
+// and as dst += alpha * src, and returns false if a result is further than
+// one unit in the last place of dtype from the float32 sum.
+bool CheckAgainstFloat32(CpuReducer* reducer, DataType dtype,
+                         size_t num_srcs, size_t n, float alpha) {
+  std::vector<std::vector<uint16_t>> srcs(num_srcs, std::vector<uint16_t>(n));
+  std::vector<const void*> ptrs;
+  for (auto& src : srcs) {
+    for (auto& x : src) x = FromFloat(rand() * 2.0f / RAND_MAX - 1, dtype);
+    ptrs.push_back(src.data());
+  }
+  std::vector<uint16_t> sum_n(n), axpy = srcs[0];
+  reducer->sum(sum_n.data(), ptrs.data(), num_srcs, n * 2, dtype);
+  for (size_t k = 1; k < num_srcs; ++k) {
+    reducer->sum(axpy.data(), srcs[k].data(), n * 2, dtype, alpha);
+  }
+  const float ulp = dtype == byteps::common::BYTEPS_BFLOAT16 ? 1.0f / 128
+                                                             : 1.0f / 1024;
+  for (size_t i = 0; i < n; ++i) {
+    float expected_n = 0, expected_axpy = ToFloat(srcs[0][i], dtype);
+    for (size_t k = 0; k < num_srcs; ++k) {
+      expected_n += ToFloat(srcs[k][i], dtype);
+      // the pairwise sums round after every step, as the reducer does
+      if (k) {
+        expected_axpy = ToFloat(
+            FromFloat(expected_axpy + alpha * ToFloat(srcs[k][i], dtype),
+                      dtype),
+            dtype);
+      }
+    }
+    float got_n = ToFloat(sum_n[i], dtype);
+    float got_axpy = ToFloat(axpy[i], dtype);
+    float tol_n = ulp * std::max(std::fabs(expected_n), 1e-3f);
+    float tol_axpy = ulp * std::max(std::fabs(expected_axpy), 1e-3f);
+    if (std::fabs(got_n - expected_n) > tol_n ||
+        std::fabs(got_axpy - expected_axpy) > tol_axpy) {
+      printf("element %zu of %zu-way sum: %g (N-way), %g (pairwise), "
+             "float32 %g and %g\n",
+             i, num_srcs, got_n, got_axpy, expected_n, expected_axpy);
+      return false;
+    }
+  }
+  return true;
+}
+
+template <typename F>
+double GBps(size_t bytes, double gbytes, F f) {
+  // read dst and src, write dst
+  int iters = std::max(1.0, gbytes * 1e9 / (3.0 * bytes));
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < iters; ++i) f();
+  double sec = std::chrono::duration<double>(
+                   std::chrono::steady_clock::now() - start)
+                   .count();
+  return 3.0 * bytes * iters / sec / 1e9;
+}
+
+int main(int argc, char** argv) {
+  size_t max_mbytes = argc > 1 ? atoi(argv[1]) : 64;
+  double gbytes = argc > 2 ? atof(argv[2]) : 2.0;
+  const ReducerKernels* scalar = FindReducerKernels("scalar");
+  std::vector<const ReducerKernels*> kernels;
+  for (auto isa : {"scalar", "avx2", "avx512"}) {
+    if (FindReducerKernels(isa)) kernels.push_back(FindReducerKernels(isa));
+  }
+  CpuReducer reducer(nullptr);
+
+  for (auto dtype :
+       {byteps::common::BYTEPS_FLOAT16, byteps::common::BYTEPS_BFLOAT16}) {
+    for (size_t num_srcs : {2, 4, 8}) {
+      for (float alpha : {1.0f, 0.5f}) {
+        if (!CheckAgainstFloat32(&reducer, dtype, num_srcs, 100003, alpha)) {
+          printf("dtype %d differs from float32\n", dtype);
+          return 1;
+        }
+      }
+    }
+  }
+  printf("float16 and bfloat16 sums match float32\n");
+
+  auto& calibration = CpuReducer::GetCalibration();
+  if (!calibration.rows.empty()) {
+    printf("%-8s %10s", "dtype", "bytes");
+    for (auto t : calibration.threads) printf(" %7d thr", t);
+    printf("   (us, team size used)\n");
+    for (auto& row : calibration.rows) {
+      for (size_t i = 0; i < calibration.bytes.size(); ++i) {
+        printf("%-8d %10zu", row.dtype, calibration.bytes[i]);
+        for (auto us : row.us[i]) printf(" %11.1f", us);
+        printf("   %d\n", row.best[i]);
+      }
+    }
+  }
+
+
+  printf("%-8s %10s", "dtype", "bytes");
+  for (auto k : kernels) printf(" %10s", k->isa);
+  printf(" %10s   (GB/s)\n", "reducer");
+  struct {
+    const char* name;
+    DataType dtype;
+  } dtypes[] = {{"float32", byteps::common::BYTEPS_FLOAT32},
+                {"float16", byteps::common::BYTEPS_FLOAT16},
+                {"bfloat16", byteps::common::BYTEPS_BFLOAT16},
+                {"float64", byteps::common::BYTEPS_FLOAT64}};
+  for (auto& d : dtypes) {
+    for (size_t bytes = 4096; bytes <= (max_mbytes << 20); bytes *= 16) {
+      // lengths that are not a multiple of the vector width
+      size_t len = bytes + 24;
+      Buffers expected;
+      Fill(&expected, len, d.dtype);
+      RunKernel(*scalar, &expected, d.dtype);
+      printf("%-8s %10zu", d.name, len);
+      for (auto k : kernels) {
+        Buffers b;
+        Fill(&b, len, d.dtype);
+        RunKernel(*k, &b, d.dtype);
+        if (b.dst != expected.dst) {
+          printf("\n%s %s kernel differs from scalar\n", k->isa, d.name);
+          return 1;
+        }
+        printf(" %10.2f", GBps(len, gbytes, [&] { RunKernel(*k, &b, d.dtype); }));
+        fflush(stdout);
+      }
+      Buffers b;
+      Fill(&b, len, d.dtype);
+      printf(" %10.2f\n", GBps(len, gbytes, [&] {
+               reducer.sum(b.dst.data(), b.src.data(), len, d.dtype);
+             }));
+    }
+  }
+  return 0;
+}
@@ -0,0 +1,234 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Throughput of the N-ary CpuReducer::sum of 2, 4 and 8 buffers against
+// folding them with repeated pairwise sums, as the cross-PCIe-switch reduce
+// and the server did before. Throughput is in bytes of the sources per
+// second. Before that, the sum_n kernels of every instruction set this CPU
+// supports are checked against the scalar ones, with and without
+// non-temporal stores, the N-ary sum with alpha against doubles and int64
+// sums for exactness.
+//
+// Usage: ./bench_reducer_sum_n [max_mbytes] [gbytes_per_point]
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <string>
+#include <vector>
+
+#include "cpu_reducer.h"
+
+using byteps::common::CpuReducer;
+using byteps::common::DataType;
+using byteps::common::FindReducerKernels;
+using byteps::common::Float2BFloat16Bits;
+using byteps::common::Float2HalfBits;
+using byteps::common::ReducerKernels;
+
+struct Type {
+  const char* name;
+  DataType dtype;
+  size_t size;
+};
+
+const Type kTypes[] = {{"float32", byteps::common::BYTEPS_FLOAT32, 4},
+                       {"float16", byteps::common::BYTEPS_FLOAT16, 2},
+                       {"bfloat16", byteps::common::BYTEPS_BFLOAT16, 2},
+                       {"float64", byteps::common::BYTEPS_FLOAT64, 8}};
+
+// num_srcs buffers of bytes each of values in [-1, 1)
+std::vector<std::vector<char>> Sources(const Type& t, size_t num_srcs,
+                                       size_t bytes) {
+  std::vector<std::vector<char>> srcs(num_srcs, std::vector<char>(bytes));
+  for (auto& src : srcs) {
+    for (size_t i = 0; i < bytes / t.size; ++i) {
+      float x = rand() * 2.0f / RAND_MAX - 1;
+      switch (t.dtype) {
+        case byteps::common::BYTEPS_FLOAT32:
+          reinterpret_cast<float*>(src.data())[i] = x;
+          break;
+        case byteps::common::BYTEPS_FLOAT64:
+          reinterpret_cast<double*>(src.data())[i] = x;
+          break;
+        case byteps::common::BYTEPS_BFLOAT16:
+          reinterpret_cast<uint16_t*>(src.data())[i] = Float2BFloat16Bits(x);
+          break;
+        default:
+          Float2HalfBits(&x, reinterpret_cast<unsigned short*>(src.data()) + i);
+      }
+    }
+  }
+  return srcs;
+}
+
+std::vector<const void*> Pointers(const std::vector<std::vector<char>>& bufs) {
+  std::vector<const void*> ptrs;
+  for (auto& buf : bufs) ptrs.push_back(buf.data());
+  return ptrs;
+}
+
+void RunSumN(const ReducerKernels& k, const Type& t, void* dst,
+             const void* const* srcs, size_t num_srcs, size_t offset,
+             size_t n, bool stream) {
+  switch (t.dtype) {
+    case byteps::common::BYTEPS_FLOAT32:
+      k.sum_n_f32((float*)dst, (const float* const*)srcs, num_srcs, offset, n,
+                  1.0f, stream);
+      break;
+    case byteps::common::BYTEPS_FLOAT64:
+      k.sum_n_f64((double*)dst, (const double* const*)srcs, num_srcs, offset,
+                  n, 1.0f, stream);
+      break;
+    case byteps::common::BYTEPS_BFLOAT16:
+      k.sum_n_bf16((uint16_t*)dst, (const uint16_t* const*)srcs, num_srcs,
+                   offset, n, 1.0f, stream);
+      break;
+    default:
+      k.sum_n_f16((uint16_t*)dst, (const uint16_t* const*)srcs, num_srcs,
+                  offset, n, 1.0f, stream);
+  }
+}
+
+// Every kernel must give the bits of the scalar one, on an unaligned
+// range so that the heads and tails are covered.
+bool CheckKernels() {
+  const ReducerKernels* scalar = FindReducerKernels("scalar");
+  for (auto isa : {"avx2", "avx512"}) {
+    const ReducerKernels* k = FindReducerKernels(isa);
+    if (!k) continue;
+    for (auto& t : kTypes) {
+      for (size_t num_srcs : {2, 3, 8}) {
+        size_t n = 10007, offset = 5;
+        auto srcs = Sources(t, num_srcs, (offset + n) * t.size);
+        auto ptrs = Pointers(srcs);
+        std::vector<char> expected(srcs[0].size());
+        RunSumN(*scalar, t, expected.data(), ptrs.data(), num_srcs, offset, n,
+                false);
+        for (bool stream : {false, true}) {
+          std::vector<char> got(srcs[0].size());
+          RunSumN(*k, t, got.data(), ptrs.data(), num_srcs, offset, n, stream);
+          if (got != expected) {
+            printf("%s %s %zu-way sum (stream %d) differs from scalar\n", isa,
+                   t.name, num_srcs, stream);
+            return false;
+          }
+        }
+      }
+    }
+  }
+  return true;
+}
+
+// dst = srcs[0] + alpha * (srcs[1] + ...) in float32, against doubles
+bool CheckAlpha(CpuReducer* reducer) {
+  const Type& t = kTypes[0];
+  for (size_t num_srcs : {2, 4, 8}) {
+    size_t n = 100003;
+    auto srcs = Sources(t, num_srcs, n * t.size);
+    auto ptrs = Pointers(srcs);
+    std::vector<float> dst(n);
+    reducer->sum(dst.data(), ptrs.data(), num_srcs, n * t.size, t.dtype, 0.5f);
+    for (size_t i = 0; i < n; ++i) {
+      double rest = 0;
+      for (size_t k = 1; k < num_srcs; ++k) {
+        rest += reinterpret_cast<const float*>(ptrs[k])[i];
+      }
+      double expected = reinterpret_cast<const float*>(ptrs[0])[i] + 0.5 * rest;
+      if (std::fabs(dst[i] - expected) > 1e-5 * num_srcs) {
+        printf("element %zu of %zu-way sum with alpha: %g, expected %g\n", i,
+               num_srcs, dst[i], expected);
+        return false;
+      }
+    }
+  }
+  return true;
+}
+
+// int64 values beyond 2^24 must be summed exactly, which float would not
+bool CheckInt64(CpuReducer* reducer) {
+  for (size_t num_srcs : {2, 3, 8}) {
+    size_t n = 10007;
+    std::vector<std::vector<int64_t>> srcs(num_srcs, std::vector<int64_t>(n));
+    std::vector<const void*> ptrs;
+    for (size_t k = 0; k < num_srcs; ++k) {
+      for (size_t i = 0; i < n; ++i) {
+        srcs[k][i] = (int64_t(1) << 40) + 1000003 * i + k;
+      }
+      ptrs.push_back(srcs[k].data());
+    }
+    std::vector<int64_t> dst(n);
+    reducer->sum(dst.data(), ptrs.data(), num_srcs, n * 8,
+                 byteps::common::BYTEPS_INT64);
+    for (size_t i = 0; i < n; ++i) {
+      int64_t expected = 0;
+      for (size_t k = 0; k < num_srcs; ++k) expected += srcs[k][i];
+      if (dst[i] != expected) {
+        printf("element %zu of %zu-way int64 sum: %lld, expected %lld\n", i,
+               num_srcs, (long long)dst[i], (long long)expected);
+        return false;
+      }
+    }
+  }
+  return true;
+}
+
+template <typename F>
+double GBps(size_t bytes, double gbytes, F f) {
+  int iters = std::max(1.0, gbytes * 1e9 / bytes);
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < iters; ++i) f();
+  double sec = std::chrono::duration<double>(
+                   std::chrono::steady_clock::now() - start)
+                   .count();
+  return 1.0 * bytes * iters / sec / 1e9;
+}
+
+int main(int argc, char** argv) {
+  size_t max_mbytes = argc > 1 ? atoi(argv[1]) : 64;
+  double gbytes = argc > 2 ? atof(argv[2]) : 4.0;
+  CpuReducer reducer(nullptr);
+  if (!CheckKernels() || !CheckAlpha(&reducer) || !CheckInt64(&reducer)) {
+    return 1;
+  }
+  printf("sum_n kernels match scalar, alpha matches double, int64 is exact\n");
+
+  printf("%-8s %4s %10s %10s %10s %8s   (GB/s of sources)\n", "dtype", "ways",
+         "bytes", "n-ary", "pairwise", "speedup");
+  for (auto& t : kTypes) {
+    for (size_t bytes = 256 << 10; bytes <= (max_mbytes << 20); bytes *= 16) {
+      for (size_t num_srcs : {2, 4, 8}) {
+        auto srcs = Sources(t, num_srcs, bytes);
+        auto ptrs = Pointers(srcs);
+        std::vector<char> dst(bytes);
+        double n_ary = GBps(bytes * num_srcs, gbytes, [&] {
+          reducer.sum(dst.data(), ptrs.data(), num_srcs, bytes, t.dtype);
+        });
+        double pairwise = GBps(bytes * num_srcs, gbytes, [&] {
+          reducer.sum(dst.data(), ptrs[0], ptrs[1], bytes, t.dtype);
+          for (size_t k = 2; k < num_srcs; ++k) {
+            reducer.sum(dst.data(), ptrs[k], bytes, t.dtype);
+          }
+        });
+        printf("%-8s %4zu %10zu %10.2f %10.2f %7.2fx\n", t.name, num_srcs,
+               bytes, n_ary, pairwise, n_ary / pairwise);
+        fflush(stdout);
+      }
+    }
+  }
+  return 0;
+}
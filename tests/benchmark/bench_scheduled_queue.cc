@@ -0,0 +1,215 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Pushes N partitions through the scheduled queue ordering logic, comparing
+// the sorted vector of old, the ordered map that scanned over the blocked
+// tasks on every get, and TaskIndex, which sets them aside until woken. A
+// share of the tasks is blocked by the ReadyTable when inserted and becomes
+// ready `lag` gets later; without arguments, both a few short and many long
+// blockings are run.
+//
+// Usage: ./bench_scheduled_queue [num_partitions] [queue_depth] [blocked_pct]
+//                                [lag]
+
+#include <algorithm>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <deque>
+#include <map>
+#include <memory>
+#include <random>
+#include <unordered_map>
+#include <vector>
+
+#include "scheduled_queue.h"
+
+using byteps::common::TaskIndex;
+using byteps::common::TensorTableEntry;
+typedef std::shared_ptr<TensorTableEntry> Task;
+
+// The queue as it was before TaskIndex: sort on every insert, linear scan
+// and erase from the middle on every get.
+class SortedVectorQueue {
+ public:
+  void insert(Task entry) {
+    _sq.push_back(entry);
+    std::sort(_sq.begin(), _sq.end(), [](const Task& a, const Task& b) {
+      if (a->priority == b->priority) {
+        return (a->key < b->key);
+      }
+      return (a->priority > b->priority);
+    });
+  }
+
+  template <typename Pred>
+  Task popFirst(Pred pred) {
+    for (auto it = _sq.begin(); it != _sq.end(); ++it) {
+      if (!pred(*it)) continue;
+      auto task = *it;
+      _sq.erase(it);
+      return task;
+    }
+    return nullptr;
+  }
+
+  size_t size() const { return _sq.size(); }
+
+ private:
+  std::vector<Task> _sq;
+};
+
+// TaskIndex before it set the blocked tasks aside: an ordered map, scanned
+// from the first task on every get.
+class ScanIndex {
+ public:
+  void insert(Task task) {
+    _tasks.emplace(std::make_pair(std::make_pair(-task->priority, task->key),
+                                  _seq++),
+                   task);
+  }
+
+  template <typename Pred>
+  Task popFirst(Pred pred) {
+    for (auto it = _tasks.begin(); it != _tasks.end(); ++it) {
+      if (!pred(it->second)) continue;
+      auto task = it->second;
+      _tasks.erase(it);
+      return task;
+    }
+    return nullptr;
+  }
+
+  size_t size() const { return _tasks.size(); }
+
+ private:
+  uint64_t _seq = 0;
+  std::map<std::pair<std::pair<int, uint64_t>, uint64_t>, Task> _tasks;
+};
+
+std::vector<Task> MakeTasks(size_t num) {
+  // mimic a model: tensors of 1 to 16 partitions, later layers first
+  std::vector<Task> tasks;
+  std::mt19937 gen(0);
+  std::uniform_int_distribution<int> parts(1, 16);
+  uint64_t declared_key = 0;
+  while (tasks.size() < num) {
+    int n = parts(gen);
+    for (int i = 0; i < n && tasks.size() < num; ++i) {
+      Task t(new TensorTableEntry);
+      t->key = (declared_key << 16) + i;
+      t->priority = -static_cast<int>(declared_key);
+      t->len = 4096000;
+      tasks.push_back(t);
+    }
+    ++declared_key;
+  }
+  // gradients are produced from the last layer to the first
+  std::reverse(tasks.begin(), tasks.end());
+  return tasks;
+}
+
+// the ReadyTable state of every key
+typedef std::unordered_map<uint64_t, bool> Ready;
+
+template <typename Queue>
+Task Pop(Queue& q, Ready& ready) {
+  return q.popFirst([&](const Task& t) { return ready[t->key]; });
+}
+
+Task Pop(TaskIndex& q, Ready& ready) {
+  return q.popFirst([&](const Task& t) {
+    return ready[t->key] ? TaskIndex::kRunnable : TaskIndex::kByReadyTable;
+  });
+}
+
+template <typename Queue>
+void Wake(Queue& q, uint64_t key) {}
+
+void Wake(TaskIndex& q, uint64_t key) { q.wakeKey(key); }
+
+template <typename Queue>
+double Run(Queue& q, const std::vector<Task>& tasks, size_t depth,
+           int blocked_pct, size_t lag, std::vector<uint64_t>* order) {
+  std::mt19937 gen(1);
+  std::uniform_int_distribution<int> pct(0, 99);
+  Ready ready;
+  // (get, key) of the keys to become ready
+  std::deque<std::pair<size_t, uint64_t>> signals;
+  size_t gets = 0;
+  auto start = std::chrono::steady_clock::now();
+  size_t next = 0;
+  while (next < tasks.size() || q.size()) {
+    while (next < tasks.size() && q.size() < depth) {
+      auto& t = tasks[next++];
+      ready[t->key] = pct(gen) >= blocked_pct;
+      if (!ready[t->key]) signals.emplace_back(gets + lag, t->key);
+      q.insert(t);
+    }
+    auto task = Pop(q, ready);
+    ++gets;
+    if (task) order->push_back(task->key);
+    while (!signals.empty() && signals.front().first <= gets) {
+      ready[signals.front().second] = true;
+      Wake(q, signals.front().second);
+      signals.pop_front();
+    }
+  }
+  auto end = std::chrono::steady_clock::now();
+  return std::chrono::duration<double>(end - start).count();
+}
+
+bool Compare(const std::vector<Task>& tasks, size_t depth, int blocked_pct,
+             size_t lag) {
+  std::vector<uint64_t> vector_order, scan_order, index_order;
+  SortedVectorQueue vector_q;
+  ScanIndex scan_q;
+  TaskIndex index_q(true);
+  double vector_sec =
+      Run(vector_q, tasks, depth, blocked_pct, lag, &vector_order);
+  double scan_sec = Run(scan_q, tasks, depth, blocked_pct, lag, &scan_order);
+  double index_sec =
+      Run(index_q, tasks, depth, blocked_pct, lag, &index_order);
+  bool same = vector_order == index_order && scan_order == index_order;
+
+  size_t num = tasks.size();
+  printf("partitions=%zu depth=%zu blocked=%d%% lag=%zu\n", num, depth,
+         blocked_pct, lag);
+  printf("%-16s %10.3f s %12.0f tasks/s\n", "sorted vector", vector_sec,
+         num / vector_sec);
+  printf("%-16s %10.3f s %12.0f tasks/s\n", "scanned map", scan_sec,
+         num / scan_sec);
+  printf("%-16s %10.3f s %12.0f tasks/s\n", "task index", index_sec,
+         num / index_sec);
+  printf("speedup %.1fx over the vector, %.1fx over the scan, same order: "
+         "%s\n",
+         vector_sec / index_sec, scan_sec / index_sec, same ? "yes" : "NO");
+  return same;
+}
+
+int main(int argc, char** argv) {
+  size_t num = argc > 1 ? strtoull(argv[1], nullptr, 10) : 100000;
+  size_t depth = argc > 2 ? strtoull(argv[2], nullptr, 10) : 1024;
+  auto tasks = MakeTasks(num);
+  if (argc > 3) {
+    int blocked_pct = atoi(argv[3]);
+    size_t lag = argc > 4 ? strtoull(argv[4], nullptr, 10) : 100;
+    return Compare(tasks, depth, blocked_pct, lag) ? 0 : 1;
+  }
+  // most of the queue waits for the other local GPUs
+  bool same = Compare(tasks, depth, 10, 100) &&
+              Compare(tasks, depth, 90, 4 * depth);
+  return same ? 0 : 1;
+}
@@ -0,0 +1,194 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// A synthetic BytePS worker that drives byteps.server without a framework
+// or GPU. It declares num_keys tensors of `size` bytes, as the worker does
+// in InitTensor, then pushes and pulls all of them each round, as the PUSH
+// and PULL loops do, and prints one JSON line with the time of each round.
+// The DMLC_* variables are those of a worker, see
+// tests/run_server_benchmark.py, which launches the whole cluster.
+//
+// Usage: ./bench_server_worker [num_keys] [size] [dtype] [rounds] [warmup]
+//                              [compressor kwargs, e.g.
+//                               compressor_type=topk,compressor_k=0.01]
+
+#include <chrono>
+#include <condition_variable>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <memory>
+#include <mutex>
+#include <sstream>
+#include <string>
+#include <vector>
+
+#include "common.h"
+#include "compressor/compressor.h"
+#include "compressor/compressor_registry.h"
+#include "compressor/utils.h"
+#include "ps/ps.h"
+
+using namespace byteps::common;
+
+int ParseDataType(const std::string& name) {
+  if (name == "float32") return BYTEPS_FLOAT32;
+  if (name == "float64") return BYTEPS_FLOAT64;
+  if (name == "float16") return BYTEPS_FLOAT16;
+  if (name == "int32") return BYTEPS_INT32;
+  if (name == "int64") return BYTEPS_INT64;
+  fprintf(stderr, "unknown dtype %s\n", name.c_str());
+  exit(1);
+}
+
+compressor::kwargs_t ParseKwargs(const std::string& arg) {
+  compressor::kwargs_t kwargs;
+  std::istringstream is(arg);
+  std::string item;
+  while (std::getline(is, item, ',')) {
+    auto eq = item.find('=');
+    if (eq == std::string::npos) continue;
+    kwargs[item.substr(0, eq)] = item.substr(eq + 1);
+  }
+  return kwargs;
+}
+
+// Counts down the push_pulls of a round.
+class Countdown {
+ public:
+  void Reset(int n) {
+    std::lock_guard<std::mutex> lock(_mutex);
+    _pending = n;
+  }
+  void Done() {
+    std::lock_guard<std::mutex> lock(_mutex);
+    if (--_pending == 0) _cv.notify_all();
+  }
+  void Wait() {
+    std::unique_lock<std::mutex> lock(_mutex);
+    _cv.wait(lock, [this] { return _pending == 0; });
+  }
+
+ private:
+  std::mutex _mutex;
+  std::condition_variable _cv;
+  int _pending = 0;
+};
+
+int main(int argc, char** argv) {
+  int num_keys = argc > 1 ? atoi(argv[1]) : 64;
+  size_t size = argc > 2 ? atol(argv[2]) : (4 << 20);
+  int dtype = ParseDataType(argc > 3 ? argv[3] : "float32");
+  int rounds = argc > 4 ? atoi(argv[4]) : 50;
+  int warmup = argc > 5 ? atoi(argv[5]) : 5;
+  auto kwargs = ParseKwargs(argc > 6 ? argv[6] : "");
+  size_t aligned_size = Align(size, dtype);
+
+  ps::KVWorker<char> kv(0, 0);
+  ps::StartAsync(0, "bench_server_worker\0");
+  ps::Postoffice::Get()->Barrier(
+      0, ps::kWorkerGroup + ps::kServerGroup + ps::kScheduler);
+
+  // partition 0 of declared key i, on server i % num_servers
+  auto krs = ps::Postoffice::Get()->GetServerKeyRanges();
+  std::vector<ps::SArray<ps::Key> > keys(num_keys);
+  for (int i = 0; i < num_keys; ++i) {
+    keys[i].push_back(krs[i % krs.size()].begin() + ((uint64_t)i << 16));
+  }
+
+  std::vector<char> data(aligned_size);
+  srand(ps::MyRank() + 1);
+  for (auto& byte : data) byte = rand() % 64;
+  ps::SArray<char> vals(data.data(), size, false);
+  ps::SArray<int> lens(1, size);
+  int cmd = GetCommandType(RequestType::kDefaultPushPull, dtype);
+
+  // the init push, also a barrier per key
+  for (int i = 0; i < num_keys; ++i) {
+    kv.Wait(kv.ZPush(keys[i], vals, lens, cmd));
+  }
+
+  // with compression, every round pushes the same compressed gradient
+  std::vector<ps::SArray<char> > pushed(num_keys, vals);
+  std::vector<ps::SArray<int> > pushed_lens(num_keys, lens);
+  std::vector<std::unique_ptr<compressor::Compressor> > compressors;
+  if (!kwargs.empty()) {
+    auto content = compressor::Serialize(kwargs);
+    ps::SArray<char> config(const_cast<char*>(content.data()), content.size(),
+                            false);
+    ps::SArray<int> config_lens(1, content.size());
+    int config_cmd = GetCommandType(RequestType::kCompressedPushPull, dtype);
+    for (int i = 0; i < num_keys; ++i) {
+      kv.Wait(kv.ZPush(keys[i], config, config_lens, config_cmd));
+      compressors.push_back(compressor::CompressorRegistry::Create(
+          kwargs, aligned_size, static_cast<DataType>(dtype)));
+      std::vector<char> grad(data);
+      auto compressed = compressors.back()->Compress(
+          compressor::tensor_t(grad.data(), size, dtype));
+      pushed[i].CopyFrom(compressed.data, compressed.size);
+      pushed_lens[i] = ps::SArray<int>(1, compressed.size);
+    }
+  }
+
+  // pulls land in one buffer per key, or are allocated by ps-lite when the
+  // compressed size varies
+  std::vector<std::vector<char> > outputs(
+      num_keys, std::vector<char>(kwargs.empty() ? size : 0));
+  Countdown countdown;
+  std::vector<double> round_ms;
+  size_t bytes = 0;
+  double seconds = 0;
+  for (int r = 0; r < warmup + rounds; ++r) {
+    countdown.Reset(num_keys);
+    auto start = std::chrono::steady_clock::now();
+    for (int i = 0; i < num_keys; ++i) {
+      kv.ZPush(keys[i], pushed[i], pushed_lens[i], cmd, [&, i]() {
+        auto out = new ps::SArray<char>();
+        if (!outputs[i].empty()) {
+          *out = ps::SArray<char>(outputs[i].data(), size, false);
+        }
+        auto out_lens = new ps::SArray<int>();
+        kv.ZPull(keys[i], out, out_lens, cmd, [&, out, out_lens]() {
+          delete out;
+          delete out_lens;
+          countdown.Done();
+        });
+      });
+    }
+    countdown.Wait();
+    double s = std::chrono::duration<double>(
+                   std::chrono::steady_clock::now() - start)
+                   .count();
+    if (r < warmup) continue;
+    round_ms.push_back(s * 1e3);
+    seconds += s;
+    for (int i = 0; i < num_keys; ++i) bytes += 2 * pushed[i].size();
+  }
+
+  std::ostringstream os;
+  os << "{\"rank\": " << ps::MyRank() << ", \"keys\": " << num_keys
+     << ", \"size\": " << size << ", \"rounds\": " << rounds
+     << ", \"bytes\": " << bytes << ", \"seconds\": " << seconds
+     << ", \"round_ms\": [";
+  for (size_t r = 0; r < round_ms.size(); ++r) {
+    os << (r ? ", " : "") << round_ms[r];
+  }
+  os << "]}";
+  printf("%s\n", os.str().c_str());
+  fflush(stdout);
+
+  ps::Finalize(0, true);
+  return 0;
+}
@@ -0,0 +1,86 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Feeds the compression thread pool the way the COMPRESS loop does: one
+// iteration submits one task per layer, from the last layer (lowest
+// priority) to the first, and every task burns CPU proportional to its
+// layer size. Reports the time until the first layers are done, with and
+// without passing the priority, and the busy time per worker.
+//
+// Usage: ./bench_thread_pool [num_threads] [num_layers] [iterations]
+
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <vector>
+
+#include "thread_pool.h"
+
+static uint64_t NowNs() {
+  return std::chrono::duration_cast<std::chrono::nanoseconds>(
+             std::chrono::steady_clock::now().time_since_epoch())
+      .count();
+}
+
+static void Burn(int units) {
+  volatile float x = 1.0f;
+  for (int i = 0; i < units * 1000; ++i) x = x * 1.000001f + 0.5f;
+}
+
+void Run(bool with_priority, int num_threads, int num_layers, int iters) {
+  ThreadPool pool(num_threads);
+  // the first tenth of the layers is what the next forward pass waits for
+  int front = num_layers / 10 + 1;
+  double front_ms = 0, all_ms = 0;
+  for (int it = 0; it < iters; ++it) {
+    std::atomic<int> front_left{front}, left{num_layers};
+    std::atomic<uint64_t> front_done{0};
+    auto start = NowNs();
+    for (int layer = num_layers - 1; layer >= 0; --layer) {
+      bool is_front = layer < front;
+      pool.enqueue(
+          [&, layer, is_front]() {
+            Burn(1 + layer % 7);
+            if (is_front && front_left.fetch_sub(1) == 1) {
+              front_done = NowNs();
+            }
+            left.fetch_sub(1);
+          },
+          with_priority ? -layer : 0);
+    }
+    while (left.load()) std::this_thread::yield();
+    front_ms += (front_done - start) / 1e6;
+    all_ms += (NowNs() - start) / 1e6;
+  }
+  printf("%-14s front layers done after %8.3f ms, all after %8.3f ms, "
+         "%.1f%% stolen\n",
+         with_priority ? "priority" : "fifo", front_ms / iters, all_ms / iters,
+         100.0 * pool.getNumStolen() / pool.getNumTasks());
+  printf("  busy ms per worker:");
+  for (auto ns : pool.getBusyNs()) printf(" %.1f", ns / 1e6);
+  printf("\n");
+}
+
+int main(int argc, char** argv) {
+  int num_threads = argc > 1 ? atoi(argv[1]) : 4;
+  int num_layers = argc > 2 ? atoi(argv[2]) : 200;
+  int iters = argc > 3 ? atoi(argv[3]) : 20;
+  printf("threads=%d layers=%d iterations=%d\n", num_threads, num_layers,
+         iters);
+  Run(false, num_threads, num_layers, iters);
+  Run(true, num_threads, num_layers, iters);
+  return 0;
+}
@@ -0,0 +1,169 @@
+// Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+// =============================================================================
+
+// Time of TopkCompressor::Compress, with 1 and 4 threads, against the
+// per-element heap it replaced, for float32 gradients of normal values and
+// several k. Every result is checked to hold the k largest magnitudes with
+// their indices, also for float16 and float64, gradients with many zeros
+// and short gradients, which take the radix select path.
+//
+// Usage: ./bench_topk [max_melems] [iters]
+
+#include <algorithm>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <limits>
+#include <random>
+#include <set>
+#include <vector>
+
+#include "compressor/impl/topk.h"
+
+using byteps::common::DataType;
+using byteps::common::compressor::TopkCompressor;
+using byteps::common::compressor::tensor_t;
+
+// the old CompressImpl of TopkCompressor
+template <typename index_t, typename scalar_t>
+void HeapTopk(std::pair<index_t, scalar_t>* beg, const scalar_t* src,
+              size_t len, size_t k) {
+  using pair_t = std::pair<index_t, scalar_t>;
+  auto comp = [](const pair_t& lhs, const pair_t& rhs) {
+    return std::abs(lhs.second) > std::abs(rhs.second);
+  };
+  size_t size = 0;
+  for (size_t i = 0; i < len; ++i) {
+    if (i < k) {
+      beg[size] = std::make_pair(i, src[i]);
+      size++;
+      std::push_heap(beg, beg + size, comp);
+    } else if (std::abs(src[i]) > std::abs(beg->second)) {
+      std::pop_heap(beg, beg + size, comp);
+      beg[size - 1] = std::make_pair(i, src[i]);
+      std::push_heap(beg, beg + size, comp);
+    }
+  }
+}
+
+template <typename scalar_t>
+std::vector<scalar_t> Gradient(size_t len, double zeros) {
+  std::mt19937 gen(len);
+  std::normal_distribution<float> normal;
+  std::uniform_real_distribution<float> uniform;
+  std::vector<scalar_t> grad(len);
+  for (auto& x : grad) x = uniform(gen) < zeros ? 0.0f : normal(gen);
+  return grad;
+}
+
+// The pairs must be k distinct indices with their values, whose magnitudes
+// are the k largest of grad.
+template <typename index_t, typename scalar_t>
+bool Check(const std::vector<scalar_t>& grad, tensor_t compressed, size_t k) {
+  using pair_t = std::pair<index_t, scalar_t>;
+  if (compressed.size != k * sizeof(pair_t)) return false;
+  auto pairs = reinterpret_cast<const pair_t*>(compressed.data);
+  std::set<size_t> indices;
+  std::vector<double> got, expected;
+  for (size_t i = 0; i < k; ++i) {
+    if (!indices.insert(pairs[i].first).second ||
+        std::memcmp(&grad[pairs[i].first], &pairs[i].second,
+                    sizeof(scalar_t))) {
+      return false;
+    }
+    got.push_back(std::fabs(double(pairs[i].second)));
+  }
+  for (auto x : grad) expected.push_back(std::fabs(double(x)));
+  std::nth_element(expected.begin(), expected.begin() + k - 1, expected.end(),
+                   std::greater<double>());
+  expected.resize(k);
+  std::sort(got.begin(), got.end());
+  std::sort(expected.begin(), expected.end());
+  return got == expected;
+}
+
+template <typename index_t, typename scalar_t>
+bool CheckAll(DataType dtype, const char* name) {
+  for (size_t len : {1000, 50000, 1 << 20}) {
+    // the indices of float16 are 16 bits
+    if (len - 1 > std::numeric_limits<index_t>::max()) continue;
+    for (double zeros : {0.0, 0.99}) {
+      auto grad = Gradient<scalar_t>(len, zeros);
+      for (size_t k : {size_t(1), len / 1000, len / 100, len / 10, len / 2}) {
+        if (k == 0) continue;
+        for (unsigned threads : {1, 4}) {
+          TopkCompressor c(len * sizeof(scalar_t), dtype, k, threads);
+          auto out = c.Compress(
+              tensor_t(grad.data(), len * sizeof(scalar_t), dtype));
+          if (!Check<index_t>(grad, out, k)) {
+            printf("%s top %zu of %zu (%.0f%% zeros, %u threads) is wrong\n",
+                   name, k, len, zeros * 100, threads);
+            return false;
+          }
+        }
+      }
+    }
+  }
+  return true;
+}
+
+template <typename F>
+double Ms(int iters, F f) {
+  f();
+  auto start = std::chrono::steady_clock::now();
+  for (int i = 0; i < iters; ++i) f();
+  return std::chrono::duration<double, std::milli>(
+             std::chrono::steady_clock::now() - start)
+             .count() /
+         iters;
+}
+
+int main(int argc, char** argv) {
+  size_t max_melems = argc > 1 ? atoi(argv[1]) : 16;
+  int iters = argc > 2 ? atoi(argv[2]) : 10;
+  if (!CheckAll<uint32_t, float>(byteps::common::BYTEPS_FLOAT32, "float32") ||
+      !CheckAll<uint64_t, double>(byteps::common::BYTEPS_FLOAT64,
+                                  "float64") ||
+      !CheckAll<uint16_t, mshadow::half::half_t>(
+          byteps::common::BYTEPS_FLOAT16, "float16")) {
+    return 1;
+  }
+  printf("top k matches exact selection\n");
+
+  printf("%10s %8s %10s %10s %10s %8s   (ms, float32)\n", "elems", "k",
+         "heap", "1 thread", "4 threads", "speedup");
+  for (size_t len = 1 << 16; len <= (max_melems << 20); len *= 4) {
+    auto grad = Gradient<float>(len, 0);
+    tensor_t in(grad.data(), len * sizeof(float),
+                byteps::common::BYTEPS_FLOAT32);
+    for (double ratio : {0.001, 0.01, 0.1}) {
+      size_t k = std::max<size_t>(1, len * ratio);
+      std::vector<std::pair<uint32_t, float>> heap(k);
+      double heap_ms = Ms(iters, [&] {
+        HeapTopk(heap.data(), grad.data(), len, k);
+      });
+      TopkCompressor one(in.size, byteps::common::BYTEPS_FLOAT32, k, 1);
+      TopkCompressor four(in.size, byteps::common::BYTEPS_FLOAT32, k, 4);
+      double one_ms = Ms(iters, [&] { one.Compress(in); });
+      double four_ms = Ms(iters, [&] { four.Compress(in); });
+      printf("%10zu %8zu %10.3f %10.3f %10.3f %7.2fx\n", len, k, heap_ms,
+             one_ms, four_ms, heap_ms / one_ms);
+      fflush(stdout);
+    }
+  }
+  return 0;
+}
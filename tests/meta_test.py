@@ -14,16 +14,24 @@
 # ==============================================================================
 
 import copy
+import importlib
 import time
 import os
 import subprocess
 import sys
 import threading
 
-import byteps.mxnet as bps
-
 
 class MetaTest(type):
+    """Runs every test_* method of a test case on a local cluster.
+
+    The test case may set `framework` (default "mxnet") to the byteps module
+    to init, `env` to variables for all processes of the cluster and
+    `helper_worker` to the command of a second worker, run with the name of
+    the test appended, e.g., for asynchronous training, which needs two. The
+    `env` of a test case is applied when its tests run, so that test cases
+    of one module may use different ones.
+    """
     BASE_ENV = {"DMLC_NUM_WORKER": "1",
                 "DMLC_NUM_SERVER": "1",
                 "DMLC_PS_ROOT_URI": "127.0.0.1",
@@ -40,10 +48,13 @@ class MetaTest(type):
     SERVER_ENV.update(DMLC_ROLE="server")
 
     def __new__(cls, name, bases, dict):
+        framework = dict.get("framework", "mxnet")
+        env = dict.get("env", {})
+        helper_worker = dict.get("helper_worker")
         # decorate all test cases
         for k, v in dict.items():
             if k.startswith("test_") and hasattr(v, "__call__"):
-                dict[k] = cls.launch_bps(v)
+                dict[k] = cls.launch_bps(v, framework, env, helper_worker)
 
         for k, v in cls.BASE_ENV.items():
             os.environ[k] = v
@@ -54,28 +65,44 @@ class MetaTest(type):
         os.environ["BYTEPS_FORCE_DISTRIBUTED"] = "1"
         os.environ["BYTEPS_LOCAL_RANK"] = "0"
         os.environ["BYTEPS_LOCAL_SIZE"] = "1"
+        os.environ.update(env)
         return type(name, bases, dict)
 
     @classmethod
-    def launch_bps(cls, func):
+    def launch_bps(cls, func, framework="mxnet", env={}, helper_worker=None):
         def wrapper(*args, **kwargs):
+            bps = importlib.import_module("byteps." + framework)
+            os.environ.update(env)
+            scheduler_env = dict(cls.SCHEDULER_ENV, **env)
+            server_env = dict(cls.SERVER_ENV, **env)
+
             def run(env):
                 subprocess.check_call(args=["bpslaunch"], shell=True,
                                       stdout=sys.stdout, stderr=sys.stderr,
                                       env=env)
                 
             print("bps init")
-            scheduler = threading.Thread(target=run,
-                                         args=(cls.SCHEDULER_ENV,))
-            server = threading.Thread(target=run, args=(cls.SERVER_ENV,))
+            scheduler = threading.Thread(target=run, args=(scheduler_env,))
+            server = threading.Thread(target=run, args=(server_env,))
             scheduler.daemon = True
             server.daemon = True
             scheduler.start()
             server.start()
+            helper = None
+            if helper_worker:
+                helper = subprocess.Popen(
+                    helper_worker + [func.__name__],
+                    env=dict(os.environ, DMLC_WORKER_ID="1"))
 
             bps.init()
-            func(*args, **kwargs)
-            bps.shutdown()
+            try:
+                func(*args, **kwargs)
+            finally:
+                bps.shutdown()
+                if helper:
+                    helper.wait()
+            if helper and helper.returncode:
+                raise RuntimeError("the helper worker failed")
 
             scheduler.join()
             server.join()
@@ -0,0 +1,35 @@
+#!/bin/bash
+# Runs example/pytorch/benchmark_tiny_tensors.py with one worker and
+# NUM_SERVER servers on localhost, e.g.,
+#   NUM_SERVER=4 BYTEPS_BATCH_BYTES=1048576 bash tests/run_loopback_benchmark.sh
+# Extra arguments are passed to the benchmark.
+
+path="$(dirname $0)"
+
+export DMLC_NUM_WORKER=1
+export DMLC_NUM_SERVER=${NUM_SERVER:-1}
+export DMLC_PS_ROOT_URI=127.0.0.1
+export DMLC_PS_ROOT_PORT=${DMLC_PS_ROOT_PORT:-1234}
+
+function cleanup() {
+  kill $(jobs -p) 2>/dev/null
+}
+
+trap cleanup EXIT
+
+echo "Launch scheduler"
+DMLC_ROLE=scheduler bpslaunch &
+
+echo "Launch $DMLC_NUM_SERVER server(s)"
+for i in $(seq 1 $DMLC_NUM_SERVER); do
+  DMLC_ROLE=server bpslaunch &
+done
+
+export NVIDIA_VISIBLE_DEVICES=${NVIDIA_VISIBLE_DEVICES:-0}
+export DMLC_WORKER_ID=0
+export DMLC_ROLE=worker
+export BYTEPS_FORCE_DISTRIBUTED=1
+# the message counters are logged at INFO level
+export BYTEPS_LOG_LEVEL=${BYTEPS_LOG_LEVEL:-INFO}
+
+bpslaunch python3 $path/../example/pytorch/benchmark_tiny_tensors.py "$@"
@@ -0,0 +1,169 @@
+# Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Benchmarks byteps.server on its own, on 127.0.0.1.
+
+Launches a scheduler, the servers and synthetic workers
+(tests/benchmark/bench_server_worker, build it with
+`make -C tests/benchmark bench_server_worker`), which push and pull all keys
+each round. Reports the aggregate throughput, the percentiles of the round
+time and the CPU usage of each server, and writes them as JSON, e.g.,
+
+    python3 tests/run_server_benchmark.py --workers 8 --keys 64 \\
+        --size 4194304 --env BYTEPS_SERVER_STAGE_PUSHES=8 --output stage.json
+
+Server knobs are taken from the environment or --env.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def cpu_seconds(pid):
+    """User and system CPU time of a process, from /proc."""
+    with open("/proc/%d/stat" % pid) as f:
+        # the command may contain spaces, the fields start after it
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[k]
+
+
+def main():
+    path = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--servers", type=int, default=1)
+    parser.add_argument("--keys", type=int, default=64)
+    parser.add_argument("--size", type=int, default=4 << 20,
+                        help="bytes per key")
+    parser.add_argument("--dtype", default="float32",
+                        choices=["float32", "float64", "float16", "int32",
+                                 "int64"])
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--compressor", default="",
+                        help="compressor kwargs, e.g., "
+                             "compressor_type=topk,compressor_k=0.01")
+    parser.add_argument("--async", dest="is_async", action="store_true",
+                        help="asynchronous training")
+    parser.add_argument("--env", action="append", default=[],
+                        help="NAME=VALUE for all processes, can be repeated")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--worker-bin",
+                        default=os.path.join(path, "benchmark",
+                                             "bench_server_worker"))
+    parser.add_argument("--output", default="server_benchmark.json")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update(DMLC_NUM_WORKER=str(args.workers),
+               DMLC_NUM_SERVER=str(args.servers),
+               DMLC_PS_ROOT_URI="127.0.0.1",
+               DMLC_PS_ROOT_PORT=str(args.port),
+               BYTEPS_ENABLE_ASYNC="1" if args.is_async else "0")
+    for item in args.env:
+        name, value = item.split("=", 1)
+        env[name] = value
+
+    # every process launched, terminated at exit if still running
+    children = []
+
+    def launch(role, **extra):
+        role_env = dict(env, DMLC_ROLE=role, **extra)
+        if role == "worker":
+            cmd = [args.worker_bin, str(args.keys), str(args.size), args.dtype,
+                   str(args.rounds), str(args.warmup), args.compressor]
+            p = subprocess.Popen(cmd, env=role_env, stdout=subprocess.PIPE,
+                                 universal_newlines=True)
+        else:
+            p = subprocess.Popen([sys.executable, "-c", "import byteps.server"],
+                                 env=role_env)
+        children.append(p)
+        return p
+
+    try:
+        scheduler = launch("scheduler")
+        servers = [launch("server") for _ in range(args.servers)]
+        workers = [launch("worker", DMLC_WORKER_ID=str(i))
+                   for i in range(args.workers)]
+
+        # the CPU time of the servers while the workers run
+        start = time.time()
+        cpu_start = [cpu_seconds(s.pid) for s in servers]
+        cpu_end = list(cpu_start)
+        end = start
+        while any(w.poll() is None for w in workers):
+            try:
+                cpu_end = [cpu_seconds(s.pid) for s in servers]
+                end = time.time()
+            except (IOError, OSError):
+                break
+            time.sleep(0.1)
+        results = []
+        for w in workers:
+            out, _ = w.communicate()
+            if w.returncode != 0:
+                sys.exit("a worker failed with exit code %d" % w.returncode)
+            results.append(json.loads(out.strip().splitlines()[-1]))
+        for p in servers + [scheduler]:
+            p.wait()
+    finally:
+        # after a failure, the other processes would wait for the failed one
+        # forever
+        for p in children:
+            if p.poll() is None:
+                p.terminate()
+        for p in children:
+            p.wait()
+
+    round_ms = [ms for r in results for ms in r["round_ms"]]
+    seconds = max(r["seconds"] for r in results)
+    wall = max(end - start, 1e-9)
+    summary = {
+        "config": {
+            "workers": args.workers, "servers": args.servers,
+            "keys": args.keys, "size": args.size, "dtype": args.dtype,
+            "rounds": args.rounds, "compressor": args.compressor,
+            "async": args.is_async,
+            "env": dict(item.split("=", 1) for item in args.env),
+        },
+        "throughput_gbps": sum(r["bytes"] for r in results) / seconds / 1e9,
+        "round_ms": {"p50": percentile(round_ms, 50),
+                     "p90": percentile(round_ms, 90),
+                     "p99": percentile(round_ms, 99),
+                     "max": max(round_ms)},
+        # in cores, over the lifetime of the workers
+        "server_cpu": [(e - s) / wall for s, e in zip(cpu_start, cpu_end)],
+    }
+    with open(args.output, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import os
+import sys
+import unittest
+
+import byteps.torch as bps
+import torch
+
+from meta_test import MetaTest
+
+# a bfloat16 has 8 bits of significand
+BF16_EPS = 2.0 ** -8
+
+
+def data(rank, n=100003):
+    gen = torch.Generator().manual_seed(rank)
+    return (torch.rand(n, generator=gen) * 2 - 1).to(torch.bfloat16)
+
+
+def push_pull(rank, rounds):
+    """The bfloat16 and the float32 sums of the same bfloat16 values over
+    both workers."""
+    results = []
+    for i in range(rounds):
+        x = data(rank * rounds + i)
+        bf16 = bps.push_pull(x, average=False, name="bf16")
+        fp32 = bps.push_pull(x.float(), average=False, name="fp32")
+        results.append((bf16, fp32))
+    return results
+
+
+def helper(test):
+    # MetaTest sets worker 0 when this module is imported
+    os.environ["DMLC_WORKER_ID"] = "1"
+    bps.init()
+    push_pull(1, rounds=3)
+    bps.shutdown()
+
+
+class BFloat16TestCase(unittest.TestCase, metaclass=MetaTest):
+    framework = "torch"
+    # the server sums the pushes of two workers
+    env = {"DMLC_NUM_WORKER": "2"}
+    helper_worker = [sys.executable, os.path.abspath(__file__), "--helper"]
+
+    def test_push_pull(self):
+        for bf16, fp32 in push_pull(0, rounds=3):
+            self.assertEqual(bf16.dtype, torch.bfloat16)
+            got = bf16.float()
+            # rounded once from the float32 sum
+            tol = BF16_EPS * fp32.abs().clamp(min=1e-3)
+            self.assertTrue(((got - fp32).abs() <= tol).all(),
+                            "max error %g" % (got - fp32).abs().max())
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == "--helper":
+        helper(sys.argv[2])
+    else:
+        unittest.main()
@@ -0,0 +1,88 @@
+# Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import os
+import sys
+import unittest
+
+import byteps.torch as bps
+import torch
+
+from meta_test import MetaTest
+
+ROUNDS = 6
+# (name, elements, dtype), fused unless larger than BYTEPS_FUSION_THRESHOLD
+TENSORS = ([("small.%d" % i, 1 + 37 * i, torch.float32) for i in range(40)] +
+           [("double.%d" % i, 3 + 11 * i, torch.float64) for i in range(10)] +
+           [("large", 100003, torch.float32)])
+# only pushed and pulled in even rounds, so that the other tensors of their
+# buffers are sent after the deadline without them
+SOMETIMES = {"small.3", "small.17", "double.5"}
+
+
+def data(rank, name, i, n, dtype):
+    # small integers, so that the sums are exact, as without fusion
+    seed = (rank * ROUNDS + i) * 1000 + sum(map(ord, name))
+    gen = torch.Generator().manual_seed(seed)
+    return torch.randint(-8, 8, (n,), generator=gen).to(dtype)
+
+
+def push_pull(rank):
+    results = []
+    for i in range(ROUNDS):
+        handles = {}
+        for name, n, dtype in TENSORS:
+            if name in SOMETIMES and i % 2:
+                continue
+            handles[name] = bps.push_pull_async(
+                data(rank, name, i, n, dtype), average=False, name=name)
+        results.append({name: bps.synchronize(handle)
+                        for name, handle in handles.items()})
+    return results
+
+
+def helper(test):
+    # MetaTest sets worker 0 when this module is imported
+    os.environ["DMLC_WORKER_ID"] = "1"
+    bps.init()
+    push_pull(1)
+    bps.shutdown()
+
+
+class FusionTestCase(unittest.TestCase, metaclass=MetaTest):
+    framework = "torch"
+    env = {"DMLC_NUM_WORKER": "2",
+           "BYTEPS_FUSION_THRESHOLD": "4096",
+           # several buffers per dtype
+           "BYTEPS_FUSION_BUFFER_BYTES": "16384",
+           "BYTEPS_FUSION_DEADLINE_US": "1000"}
+    helper_worker = [sys.executable, os.path.abspath(__file__), "--helper"]
+
+    def test_push_pull(self):
+        sizes = {name: (n, dtype) for name, n, dtype in TENSORS}
+        for i, results in enumerate(push_pull(0)):
+            for name, got in results.items():
+                n, dtype = sizes[name]
+                expected = data(0, name, i, n, dtype) + data(1, name, i, n,
+                                                             dtype)
+                self.assertTrue(torch.equal(got, expected),
+                                "%s in round %d" % (name, i))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == "--helper":
+        helper(sys.argv[2])
+    else:
+        unittest.main()
@@ -0,0 +1,98 @@
+# Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import copy
+import os
+import sys
+import unittest
+
+import byteps.torch as bps
+import torch
+
+from meta_test import MetaTest
+
+OPTIMIZERS = {
+    "test_sgd": lambda params: torch.optim.SGD(
+        params, lr=0.1, momentum=0.9, nesterov=True, weight_decay=1e-4),
+    "test_adam": lambda params: torch.optim.Adam(
+        params, lr=0.01, betas=(0.9, 0.99), eps=1e-8, weight_decay=1e-4),
+}
+
+
+def make_model():
+    # the same weights on both workers
+    torch.manual_seed(2020)
+    return torch.nn.Sequential(torch.nn.Linear(16, 8), torch.nn.Tanh(),
+                               torch.nn.Linear(8, 4))
+
+
+def make_optimizer(test, model):
+    return bps.DistributedOptimizer(
+        OPTIMIZERS[test](model.parameters()),
+        named_parameters=model.named_parameters(), server_optimizer=True)
+
+
+def helper(test):
+    """The second worker, which only declares the tensors and sends the
+    weights, so that worker 0 alone updates them."""
+    # MetaTest sets worker 0 when this module is imported
+    os.environ["DMLC_WORKER_ID"] = "1"
+    bps.init()
+    make_optimizer(test, make_model())
+    bps.shutdown()
+
+
+class ServerOptimizerTestCase(unittest.TestCase, metaclass=MetaTest):
+    framework = "torch"
+    # asynchronous training needs two workers
+    env = {"DMLC_NUM_WORKER": "2", "BYTEPS_ENABLE_ASYNC": "1"}
+    helper_worker = [sys.executable, os.path.abspath(__file__), "--helper"]
+
+    def _compare(self, test, steps=10):
+        model = make_model()
+        ref = copy.deepcopy(model)
+        optimizer = make_optimizer(test, model)
+        ref_optimizer = OPTIMIZERS[test](ref.parameters())
+
+        gen = torch.Generator().manual_seed(0)
+        for step in range(steps):
+            x = torch.randn(32, 16, generator=gen)
+            y = torch.randn(32, 4, generator=gen)
+            for m, opt in ((model, optimizer), (ref, ref_optimizer)):
+                opt.zero_grad()
+                ((m(x) - y) ** 2).mean().backward()
+                opt.step()
+            for p, q in zip(model.parameters(), ref.parameters()):
+                self.assertTrue(torch.allclose(p.data, q.data, rtol=1e-5,
+                                               atol=1e-6),
+                                "step %d: %s != %s" % (step, p.data, q.data))
+        return optimizer
+
+    def test_sgd(self):
+        optimizer = self._compare("test_sgd")
+        # e.g., by a learning rate scheduler, which the servers ignore
+        optimizer.param_groups[0]["lr"] *= 0.1
+        with self.assertRaises(ValueError):
+            optimizer.step()
+
+    def test_adam(self):
+        self._compare("test_adam")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == "--helper":
+        helper(sys.argv[2])
+    else:
+        unittest.main()
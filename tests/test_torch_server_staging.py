@@ -0,0 +1,102 @@
+# Copyright 2019 Bytedance Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import os
+import sys
+import time
+import unittest
+
+import byteps.torch as bps
+import torch
+
+from meta_test import MetaTest
+
+# the servers stage up to two pushes of a key and sum them in one pass
+SYNC_ENV = {"DMLC_NUM_WORKER": "2",
+            "BYTEPS_ENABLE_ASYNC": "0",
+            "BYTEPS_SERVER_STAGE_PUSHES": "2",
+            "BYTEPS_SERVER_STAGE_DEADLINE_US": "1000"}
+ASYNC_ENV = dict(SYNC_ENV, BYTEPS_ENABLE_ASYNC="1")
+ROUNDS = 5
+
+
+def data(rank, i, n=100003):
+    # small integers, so that the float32 sums are exact
+    gen = torch.Generator().manual_seed(rank * ROUNDS + i)
+    return torch.randint(-8, 8, (n,), generator=gen).float()
+
+
+def push_pull(rank, name, delay=0):
+    results = []
+    for i in range(ROUNDS):
+        time.sleep(delay)
+        results.append(bps.push_pull(data(rank, i), average=False, name=name))
+    return results
+
+
+def helper(test):
+    # MetaTest sets worker 0 and the last env when this module is imported
+    os.environ.update(ASYNC_ENV if test.startswith("test_async") else SYNC_ENV)
+    os.environ["DMLC_WORKER_ID"] = "1"
+    bps.init()
+    if test == "test_sync":
+        push_pull(1, test)
+    elif test == "test_sync_partial":
+        # later than the stage deadline, so that the push of worker 0 is
+        # summed alone first
+        push_pull(1, test, delay=0.1)
+    else:
+        # only joins the initialization, which needs all workers
+        bps.push_pull(torch.zeros(100003), average=False, name=test)
+    bps.shutdown()
+
+
+class StagingSyncTestCase(unittest.TestCase, metaclass=MetaTest):
+    framework = "torch"
+    env = SYNC_ENV
+    helper_worker = [sys.executable, os.path.abspath(__file__), "--helper"]
+
+    def _check(self, results):
+        for i, got in enumerate(results):
+            self.assertTrue(torch.equal(got, data(0, i) + data(1, i)),
+                            "round %d" % i)
+
+    def test_sync(self):
+        self._check(push_pull(0, "test_sync"))
+
+    def test_sync_partial(self):
+        self._check(push_pull(0, "test_sync_partial"))
+
+
+class StagingAsyncTestCase(unittest.TestCase, metaclass=MetaTest):
+    framework = "torch"
+    env = ASYNC_ENV
+    helper_worker = [sys.executable, os.path.abspath(__file__), "--helper"]
+
+    def test_async(self):
+        name = "test_async"
+        bps.push_pull(torch.zeros(100003), average=False, name=name)
+        # the pull returns the store, which holds every push so far
+        expected = torch.zeros(100003)
+        for i, got in enumerate(push_pull(0, name)):
+            expected += data(0, i)
+            self.assertTrue(torch.equal(got, expected), "round %d" % i)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == "--helper":
+        helper(sys.argv[2])
+    else:
+        unittest.main()